@@ -0,0 +1,45 @@
+"""ASGI entry point: the Streamlit app plus a streaming export route.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8501
+
+``GET /export/{csv,jsonl,parquet}?admin=<KONSULTA_ADMIN_TOKEN>&month=YYYY-MM``
+streams the export chunk by chunk straight into the response. The admin
+page links here when the app is served this way; under ``streamlit run``
+it falls back to building the file in memory.
+"""
+import hmac
+import os
+
+import streamlit as st
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from exporter import FORMATS, export_chunks, export_filename, month_range
+from form_schema import get_schema
+from submission_store import get_store
+
+# Tells the admin page that /export is being served
+os.environ['KONSULTA_STREAMING_EXPORT'] = '1'
+
+
+async def export(request: Request):
+    token = os.environ.get('KONSULTA_ADMIN_TOKEN')
+    if not token or not hmac.compare_digest(request.query_params.get('admin', ''), token):
+        return PlainTextResponse("Forbidden", status_code=403)
+    fmt = request.path_params['fmt']
+    if fmt not in FORMATS:
+        return PlainTextResponse(f"Unknown export format {fmt!r}", status_code=404)
+    try:
+        since, until = month_range(request.query_params['month']) if 'month' in request.query_params else (None, None)
+    except ValueError:
+        return PlainTextResponse("month must be YYYY-MM", status_code=400)
+    # A sync iterator; Starlette pulls each chunk in its thread pool
+    disposition = f'attachment; filename="{export_filename(fmt, since, until)}"'
+    return StreamingResponse(export_chunks(get_store(), fmt, get_schema(), since, until), media_type=FORMATS[fmt],
+                             headers={'Content-Disposition': disposition})
+
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'streamlit_app.py')
+
+app = st.App(APP_PATH, routes=[Route('/export/{fmt}', export)])
@@ -0,0 +1,123 @@
+"""Cohort search latency over a large registry.
+
+Fills a temporary store with ``--patients`` submissions (one per patient,
+with varied conditions, habits, places and registration months), builds the
+cohort index from it and times multi-condition searches: count plus the
+first page of ids, as the search page does. Each query's count is checked
+against a brute-force filter of the same answers in pandas.
+
+    python benchmarks/bench_cohort.py [--patients 500000] [--barangays 200]
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_form_memory import variants  # noqa: E402
+from bench_ncd_risk import patient  # noqa: E402
+from cohort_index import BARANGAY, MONTH, CohortIndex, months_between  # noqa: E402
+from rollups import get_rollup_layout  # noqa: E402
+from submission_store import SubmissionStore  # noqa: E402
+
+INSERT_BATCH = 5000
+SEARCHES = 50
+PAGE = 200
+
+# (description, flags, any_of)
+QUERIES = [
+    ("hypertensive", ['past_hypertension'], {}),
+    ("hypertensive, family diabetes, smoker", ['past_hypertension', 'fam_diabetes_mellitus'],
+     {'smoking_status': ['Yes']}),
+    ("... in one barangay, registered Q3", ['past_hypertension', 'fam_diabetes_mellitus'],
+     {'smoking_status': ['Yes'], BARANGAY: [('036916', 'Barangay 7')],
+      MONTH: months_between('2026-07-01', '2026-09-30')}),
+    ("female, O+, drinker or ex-drinker, family CAD", ['fam_coronary_artery_disease'],
+     {'sex': ['F'], 'blood_type': ['O+'], 'alcohol_status': ['Yes', 'Quit']}),
+    ("diabetic in any of 20 barangays", ['past_diabetes_mellitus'],
+     {BARANGAY: [('036916', f"Barangay {n}") for n in range(20)]}),
+]
+
+
+def registration(rng: random.Random, form_data: dict, number: int, barangays: int) -> dict:
+    form_data = patient(rng, form_data)
+    general = {**form_data['general_info'], 'philhealth_pin': f"{number:012d}", 'sex': rng.choice('FM'),
+               'municipality_code': '036916', 'barangay_code': None, 'barangay': f"Barangay {rng.randrange(barangays)}",
+               'registration_date': f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"}
+    history = {**form_data['medical_history'], 'blood_type': rng.choice(['A+', 'B+', 'O+', 'AB+', 'O-'])}
+    return {**form_data, 'general_info': general, 'medical_history': history}
+
+
+def brute_force(frame: pd.DataFrame, flags, any_of) -> int:
+    mask = pd.Series(True, index=frame.index)
+    for name in flags:
+        mask &= frame[name] == 1
+    for field, values in any_of.items():
+        if field == BARANGAY:
+            mask &= frame['barangay'].isin([barangay for _, barangay in values])
+        elif field == MONTH:
+            mask &= frame['registration_date'].str[:7].isin(values)
+        else:
+            mask &= frame[field].isin(values)
+    return int(mask.sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=500_000)
+    parser.add_argument('--barangays', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(20)
+    form_data = variants()['typical']
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SubmissionStore(os.path.join(tmp, 'konsulta.db'))
+        started = time.perf_counter()
+        for start in range(0, args.patients, INSERT_BATCH):
+            store.insert_many(registration(rng, form_data, number, args.barangays)
+                              for number in range(start, min(start + INSERT_BATCH, args.patients)))
+        print(f"stored {args.patients} submissions in {time.perf_counter() - started:.1f} s")
+
+        index = CohortIndex(get_rollup_layout())
+        started = time.perf_counter()
+        index.refresh(store)
+        bitmaps = len(index._bitmaps)
+        print(f"built index in {time.perf_counter() - started:.1f} s: {bitmaps} bitmaps, "
+              f"{index.nbytes() / 2 ** 20:.1f} MiB (uncompressed {bitmaps * args.patients / 8 / 2 ** 20:.1f} MiB)")
+
+        started = time.perf_counter()
+        store.insert_many(registration(rng, form_data, args.patients + n, args.barangays) for n in range(100))
+        index.refresh(store)
+        print(f"100 new submissions stored and indexed in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+        frame = pd.DataFrame.from_records([row for rows in store.iter_fields(index.fields) for row in rows],
+                                          columns=['id'] + [name for _, name in index.fields])
+        failed = False
+        print(f"{'query':<48} {'patients':>9} {'median ms':>10} {'p90 ms':>8}")
+        for description, flags, any_of in QUERIES:
+            samples = []
+            for _ in range(SEARCHES):
+                searched = time.perf_counter()
+                cohort = index.search(flags, any_of)
+                count = len(cohort)
+                list(itertools.islice(cohort.descending(), PAGE))
+                samples.append((time.perf_counter() - searched) * 1000)
+            samples.sort()
+            expected = brute_force(frame, flags, any_of)
+            failed |= count != expected
+            print(f"{description:<48} {count:>9} {statistics.median(samples):>10.2f} "
+                  f"{samples[int(len(samples) * 0.9)]:>8.2f}" + ("" if count == expected else f"  expected {expected}"))
+        store.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
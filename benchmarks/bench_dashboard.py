@@ -0,0 +1,111 @@
+"""Barangay dashboard load time against the size of the registry.
+
+Fills a temporary store in steps up to each ``--sizes`` value with
+submissions spread over ``--barangays`` barangays and twelve registration
+months, and after each step times a dashboard load (``rollup_rows`` plus
+``dashboard_table``) for one month and for all months. The rollups are kept
+up to date by the inserts; for comparison the first step also times
+re-aggregating the raw records. At the end the rollups are rebuilt and must
+match the incremental ones exactly.
+
+    python benchmarks/bench_dashboard.py [--sizes 10000 100000] [--barangays 60]
+"""
+import argparse
+import collections
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_form_memory import variants  # noqa: E402
+from bench_ncd_risk import patient  # noqa: E402
+from gazetteer import Gazetteer  # noqa: E402
+from rollups import dashboard_table, get_rollup_layout, rollup_deltas  # noqa: E402
+from submission_store import SubmissionStore  # noqa: E402
+
+INSERT_BATCH = 5000
+LOADS = 20
+
+
+def registration(rng: random.Random, form_data: dict, barangays: int) -> dict:
+    form_data = patient(rng, form_data)
+    general = {**form_data['general_info'], 'municipality_code': '036916', 'barangay_code': None,
+               'barangay': f"Barangay {rng.randrange(barangays)}",
+               'registration_date': f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"}
+    return {**form_data, 'general_info': general}
+
+
+def load_ms(store: SubmissionStore, month, gazetteer: Gazetteer) -> float:
+    samples = []
+    for _ in range(LOADS):
+        started = time.perf_counter()
+        dashboard_table(store.rollup_rows(month), get_rollup_layout(), gazetteer)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def reaggregate(store: SubmissionStore) -> int:
+    """What every page view would cost without rollups: read and count every submission"""
+    totals = collections.Counter()
+    for chunk in store.iter_chunks(1000):
+        for record in chunk:
+            key, values = rollup_deltas(record['form_data'], record['submitted_at'])
+            totals.update({key + (metric,): value for metric, value in values.items()})
+    return len(totals)
+
+
+def snapshot(store: SubmissionStore) -> list:
+    return sorted((row['municipality'], row['barangay'], row['metric'], round(row['value'], 6))
+                  for row in store.rollup_rows())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--barangays', type=int, default=60)
+    args = parser.parse_args()
+
+    rng = random.Random(19)
+    form_data = variants()['typical']
+    gazetteer = Gazetteer([])
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SubmissionStore(os.path.join(tmp, 'konsulta.db'))
+        stored = 0
+        sample = [registration(rng, form_data, args.barangays) for _ in range(1000)]
+        started = time.perf_counter()
+        for submission in sample:
+            rollup_deltas(submission, '2026-10-17T00:00:00')
+        print(f"rollup deltas: {(time.perf_counter() - started) * 1000:.0f} us per submission")
+
+        print(f"{'submissions':>11} {'month ms':>9} {'all months ms':>13} {'re-aggregate ms':>15}")
+        for size in sorted(args.sizes):
+            while stored < size:
+                batch = min(INSERT_BATCH, size - stored)
+                store.insert_many(registration(rng, form_data, args.barangays) for _ in range(batch))
+                stored += batch
+            month_ms = load_ms(store, '2026-06', gazetteer)
+            all_ms = load_ms(store, None, gazetteer)
+            raw = ''
+            if size == min(args.sizes):
+                started = time.perf_counter()
+                reaggregate(store)
+                raw = f"{(time.perf_counter() - started) * 1000:.0f}"
+            print(f"{size:>11} {month_ms:>9.1f} {all_ms:>13.1f} {raw:>15}")
+
+        incremental = snapshot(store)
+        started = time.perf_counter()
+        store.rebuild_rollups()
+        print(f"rebuild_rollups: {time.perf_counter() - started:.1f} s")
+        matches = snapshot(store) == incremental
+        print("rebuilt rollups match the incremental ones" if matches else "rebuilt rollups DIFFER")
+        store.close()
+    sys.exit(0 if matches else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Throughput and peak memory of the streaming export.
+
+Fills a temporary store with ``--records`` typical submissions, then exports
+the first tenth of them and all of them in every format to a byte counter.
+Each export runs in a fresh process, which reports how far its resident
+memory (Python heap, Arrow buffers and SQLite cache alike) rose above the
+baseline after imports: equal growth at both sizes shows the export does
+not grow with the database.
+
+    python benchmarks/bench_export.py [--records 1000000] [--format parquet]
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_form_memory import variants  # noqa: E402
+from exporter import FORMATS, export_chunks  # noqa: E402
+from form_schema import build_schema  # noqa: E402
+from submission_store import SubmissionStore  # noqa: E402
+
+INSERT_BATCH = 5000
+
+
+class LimitedStore:
+    """Stops ``iter_chunks`` after ``limit`` records"""
+
+    def __init__(self, store: SubmissionStore, limit: int):
+        self.store = store
+        self.limit = limit
+
+    def iter_chunks(self, chunk_size, since=None, until=None, registered=False):
+        remaining = self.limit
+        for chunk in self.store.iter_chunks(chunk_size, since, until, registered):
+            if remaining <= 0:
+                return
+            yield chunk[:remaining]
+            remaining -= len(chunk)
+
+
+def populate(store: SubmissionStore, records: int):
+    form_data = variants()['typical']
+    general = form_data['general_info']
+    for start in range(0, records, INSERT_BATCH):
+        store.insert_many({**form_data, 'general_info': {**general, 'last_name': f"Cruz {i}",
+                                                         'philhealth_pin': f"{i:012d}"}}
+                          for i in range(start, min(start + INSERT_BATCH, records)))
+
+
+def _rss_kib() -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def export(args):
+    """Worker: export ``limit`` records and report size, time and memory growth"""
+    path, fmt, limit = args
+    import pyarrow.parquet  # noqa: F401 -- part of the baseline, not the export
+    store = LimitedStore(SubmissionStore(path), limit)
+    schema = build_schema()
+    baseline = _rss_kib()
+    started = time.perf_counter()
+    size = sum(len(data) for data in export_chunks(store, fmt, schema))
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is the peak resident size in KiB on Linux
+    return size, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=200_000)
+    parser.add_argument('--format', action='append', choices=sorted(FORMATS), help="only this format (repeatable)")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'konsulta.db')
+        store = SubmissionStore(path)
+        started = time.perf_counter()
+        populate(store, args.records)
+        store.close()
+        print(f"stored {args.records} submissions in {time.perf_counter() - started:.1f} s")
+
+        print(f"{'format':>8} {'MiB':>8} {'s':>7} {'rows/s':>8} {'RSS +MiB @10%':>14} {'RSS +MiB @100%':>15}")
+        for fmt in args.format or FORMATS:
+            with context.Pool(1, maxtasksperchild=1) as pool:
+                _, _, small_growth = pool.apply(export, ((path, fmt, args.records // 10),))
+            with context.Pool(1, maxtasksperchild=1) as pool:
+                size, elapsed, growth = pool.apply(export, ((path, fmt, args.records),))
+            print(f"{fmt:>8} {size / 2 ** 20:>8.1f} {elapsed:>7.1f} {args.records / elapsed:>8.0f} "
+                  f"{small_growth / 1024:>14.1f} {growth / 1024:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
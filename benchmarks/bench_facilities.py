@@ -0,0 +1,79 @@
+"""Facility typeahead latency on a large synthetic directory.
+
+Builds a directory of synthetic facilities (default 50k) and times
+``FacilityDirectory.search`` for each keystroke of exact, misspelt and
+reordered queries.
+
+    python benchmarks/bench_facilities.py [--facilities 50000] [--queries 500]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from facility_directory import FacilityDirectory, facility_label  # noqa: E402
+
+KINDS = ['Barangay Health Station', 'Rural Health Unit', 'Medical Clinic', 'Family Health Center',
+         'Community Hospital', 'Lying-in Clinic', 'Diagnostic Center', 'Health Center']
+SYLLABLES = ['ba', 'ca', 'da', 'ga', 'la', 'ma', 'na', 'pa', 'ra', 'sa', 'ta', 'bi', 'li', 'ri', 'to', 'lo', 'nu',
+             'san', 'sta', 'del', 'mon', 'lag', 'ilo']
+
+
+def _word(rng: random.Random) -> str:
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+
+
+def synthetic_facility(rng: random.Random) -> str:
+    place = _word(rng)
+    return facility_label(f"{place} {rng.choice(KINDS)}", f"{_word(rng)}, {_word(rng)}")
+
+
+def typo(text: str, rng: random.Random) -> str:
+    i = rng.randrange(1, len(text) - 1)
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--facilities', type=int, default=50_000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=9)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    labels = [synthetic_facility(rng) for _ in range(args.facilities)]
+    started = time.perf_counter()
+    directory = FacilityDirectory(labels)
+    print(f"indexed {len(directory)} facilities in {time.perf_counter() - started:.2f} s")
+
+    targets = rng.sample(directory.labels, args.queries)
+    queries = {
+        'exact': targets,
+        'typo': [typo(label.split(',')[0], rng) for label in targets],
+        'reordered': [' '.join(reversed(label.split(',')[0].split())) for label in targets],
+    }
+    for label, texts in queries.items():
+        timings, hits = [], 0
+        for target, text in zip(targets, texts):
+            for end in range(1, len(text) + 1):
+                started = time.perf_counter()
+                matches = directory.search(text[:end])
+                timings.append((time.perf_counter() - started) * 1000)
+            # Synthetic place names repeat, so any facility with the target's name counts
+            hits += any(match.split(',')[0] == target.split(',')[0] for match in matches)
+        print(f"{label:>9}: {len(timings)} keystrokes, p50 {statistics.median(timings):.3f} ms, "
+              f"p99 {percentile(timings, 99):.3f} ms, max {max(timings):.3f} ms, "
+              f"name suggested {hits}/{len(texts)}")
+
+
+if __name__ == '__main__':
+    main()
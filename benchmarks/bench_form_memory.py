@@ -0,0 +1,94 @@
+"""Per-session memory of form_data as plain dicts versus SectionRecords.
+
+Builds the form_data a session holds once every section has been rendered
+(every schema field present, as render_field stores widget defaults) for an
+untouched form, a typical filled form and a form with every condition
+ticked. Each variant is loaded ``--sessions`` times from JSON, so every
+session owns its own value objects, and the traced heap is compared.
+
+    python benchmarks/bench_form_memory.py [--sessions 1000]
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_reruns import GENERAL_DATA, VITALS, history_values  # noqa: E402
+from form_record import SECTION_KEYS, SectionRecord, build_layouts  # noqa: E402
+from form_schema import build_schema  # noqa: E402
+
+DEFAULTS = {'text': '', 'facility': '', 'place': None, 'number': 0, 'radio': None, 'selectbox': None,
+            'checkbox': False, 'date': datetime.date.today().isoformat()}
+
+
+def rendered_form(values) -> dict:
+    """form_data after a full render, with ``values`` filled in"""
+    schema = build_schema()
+    form_data = {key: {} for key in SECTION_KEYS}
+    for section in schema.sections:
+        for name, field in section.fields.items():
+            form_data[section.key][name] = field.options[0] if field.options else DEFAULTS[field.kind]
+    for section_key, pairs in values.items():
+        for name, value in pairs:
+            form_data[section_key][name] = value.isoformat() if isinstance(value, datetime.date) else value
+    # Detail fields are only rendered while their condition is ticked
+    for section in schema.sections:
+        data = form_data[section.key]
+        for field in section.fields.values():
+            if data.get(field.name) != field.show_details_when:
+                for detail in field.details:
+                    data.pop(detail.name, None)
+    return form_data
+
+
+def variants() -> dict:
+    ticked = history_values()
+    return {
+        'untouched': rendered_form({}),
+        'typical': rendered_form({'general_info': GENERAL_DATA,
+                                  'medical_history': ticked[:8] + VITALS}),
+        'all ticked': rendered_form({'general_info': GENERAL_DATA, 'medical_history': ticked + VITALS}),
+    }
+
+
+def measure(template: str, sessions: int, compact: bool) -> float:
+    layouts = build_layouts(build_schema())
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    forms = []
+    for _ in range(sessions):
+        form_data = json.loads(template)
+        if compact:
+            form_data = {key: SectionRecord(layouts[key], section) if key in layouts else section
+                         for key, section in form_data.items()}
+        forms.append(form_data)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del forms
+    return used / sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'form':>11} {'fields':>7} {'dict B':>8} {'record B':>9} {'saved':>6}")
+    for label, form_data in variants().items():
+        template = json.dumps(form_data)
+        plain = measure(template, args.sessions, compact=False)
+        compact = measure(template, args.sessions, compact=True)
+        fields = sum(len(section) for section in form_data.values())
+        print(f"{label:>11} {fields:>7} {plain:>8.0f} {compact:>9.0f} {1 - compact / plain:>6.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Throughput of the spreadsheet import, with a share of broken rows.
+
+Writes a CSV of ``--rows`` typical encoded forms (every General Data and
+Medical History column), breaking every ``--bad-every``-th row in one of a
+few ways (bad date, unknown option, malformed PIN, missing name, detail
+without its condition), imports it into a temporary store and checks that
+exactly the broken rows were rejected. Exits 1 on a miscount or when the
+import runs slower than ``--min-rate`` rows per second.
+
+    python benchmarks/bench_import.py [--rows 100000] [--workers 4] [--min-rate 10000]
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_form_memory import variants  # noqa: E402
+from exporter import export_columns  # noqa: E402
+from form_schema import build_schema  # noqa: E402
+from importer import import_file  # noqa: E402
+from submission_store import SubmissionStore  # noqa: E402
+
+FAULTS = [
+    ('birthdate', '02/30/1984'),
+    ('sex', 'Female?'),
+    ('philhealth_pin', '12-3456'),
+    ('last_name', ''),
+    ('past_hypertension_bp', '150/100'),
+]
+
+
+def write_backlog(path: str, rows: int, bad_every: int) -> int:
+    """A CSV of typical forms; returns how many rows were broken"""
+    columns = [(section, name) for section, name in export_columns(build_schema())
+               if section != 'general_info' or not name.endswith('_code')]
+    form_data = variants()['typical']
+    template = [form_data[section].get(name) for section, name in columns]
+    index = {name: i for i, (_, name) in enumerate(columns)}
+    broken = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([name for _, name in columns])
+        for i in range(rows):
+            row = list(template)
+            row[index['last_name']] = f"Cruz {i}"
+            row[index['philhealth_pin']] = f"{i:012d}"
+            if bad_every and i % bad_every == bad_every - 1:
+                name, value = FAULTS[broken % len(FAULTS)]
+                row[index[name]] = value
+                if name == 'past_hypertension_bp':
+                    row[index['past_hypertension']] = False
+                broken += 1
+            writer.writerow(row)
+    return broken
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--bad-every', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--min-rate', type=float, default=10_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'backlog.csv')
+        broken = write_backlog(path, args.rows, args.bad_every)
+        store = SubmissionStore(os.path.join(tmp, 'konsulta.db'))
+        counts = import_file(path, store, os.path.join(tmp, 'errors.csv'), args.workers)
+        stored = store.count()
+        store.close()
+
+    rate = counts['rows'] / counts['seconds']
+    print(f"{counts['rows']} rows with {args.workers} workers in {counts['seconds']} s: {rate:.0f} rows/s, "
+          f"{counts['imported']} imported, {counts['rejected']} rejected")
+    ok = counts['rejected'] == broken and stored == counts['imported'] == args.rows - broken
+    if not ok:
+        print(f"expected {broken} rejected and {args.rows - broken} stored, store has {stored}")
+    if rate < args.min_rate:
+        print(f"slower than {args.min_rate:.0f} rows/s")
+    sys.exit(0 if ok and rate >= args.min_rate else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Duplicate-detection latency against a large synthetic registry.
+
+Fills a temporary SQLite store with synthetic patients (default 500k), then
+times candidate retrieval plus scoring for registrations that are exact
+re-registrations, misspelt re-registrations and new patients.
+
+    python benchmarks/bench_matching.py [--patients 500000] [--probes 2000]
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matching import blocking_keys, find_likely_duplicates  # noqa: E402
+from submission_store import SubmissionStore  # noqa: E402
+
+LAST_NAMES = [
+    'Santos', 'Reyes', 'Cruz', 'Bautista', 'Ocampo', 'Garcia', 'Mendoza', 'Torres', 'Tomas', 'Andrada',
+    'Castillo', 'Flores', 'Villanueva', 'Ramos', 'Castro', 'Rivera', 'Aquino', 'Navarro', 'Salazar', 'Mercado',
+    'Dela Cruz', 'Del Rosario', 'Gonzales', 'Lopez', 'Hernandez', 'Perez', 'Fernandez', 'Domingo', 'Gutierrez',
+    'Pascual', 'Soriano', 'Aguilar', 'Dizon', 'Valdez', 'Manalo', 'Javier', 'Lim', 'Tan', 'Magbanua', 'Sarmiento',
+]
+FIRST_NAMES = [
+    'Maria', 'Jose', 'Juan', 'Ana', 'Mark', 'John', 'Michael', 'Angelica', 'Christian', 'Kimberly',
+    'Jerome', 'Princess', 'Joshua', 'Mary Grace', 'Rodel', 'Marites', 'Ronaldo', 'Jocelyn', 'Rowena', 'Ariel',
+    'Jennifer', 'Romeo', 'Lorna', 'Danilo', 'Edgardo', 'Rosalie', 'Arnel', 'Liza', 'Noel', 'Cristina',
+]
+BARANGAYS = [f"Barangay {n}" for n in range(1, 61)]
+
+
+SYLLABLES = ['ba', 'ca', 'da', 'ga', 'la', 'ma', 'na', 'pa', 'ra', 'sa', 'ta', 'bi', 'li', 'ri', 'to', 'lo', 'nu']
+
+
+def _pool(common: list, size: int, rng: random.Random) -> tuple:
+    """Names with Zipf-like weights: the common ones first, then a long tail"""
+    names = list(common)
+    while len(names) < size:
+        names.append(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title())
+    return names, list(itertools.accumulate(1 / rank for rank in range(1, size + 1)))
+
+
+def _name(rng: random.Random, pool: tuple) -> str:
+    names, cum_weights = pool
+    return rng.choices(names, cum_weights=cum_weights)[0]
+
+
+def synthetic_patient(rng: random.Random, number: int, pools: dict) -> dict:
+    year = rng.randint(1940, 2024)
+    return {'general_info': {
+        'philhealth_pin': f"{number:012d}" if rng.random() < 0.8 else '',
+        'last_name': _name(rng, pools['last']),
+        'first_name': _name(rng, pools['first']),
+        'middle_name': _name(rng, pools['last']),
+        'birthdate': f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        'barangay': rng.choice(BARANGAYS),
+        'municipality': 'Sample Municipality',
+        'registration_date': '2026-01-01',
+    }}
+
+
+def misspell(name: str, rng: random.Random) -> str:
+    if len(name) < 3:
+        return name
+    i = rng.randrange(1, len(name) - 1)
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=500_000)
+    parser.add_argument('--probes', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=8)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pools = {'last': _pool(LAST_NAMES, 5000, rng), 'first': _pool(FIRST_NAMES, 2000, rng)}
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SubmissionStore(os.path.join(tmp, 'bench.db'))
+        started = time.perf_counter()
+        for first in range(0, args.patients, 10_000):
+            store.insert_many(synthetic_patient(rng, n, pools) for n in range(first, min(first + 10_000, args.patients)))
+        print(f"loaded {args.patients} patients in {time.perf_counter() - started:.1f} s")
+
+        stored = [store.get(rng.randint(1, args.patients))['form_data'] for _ in range(args.probes)]
+        probes = {
+            'same PIN': [patient['general_info'] for patient in stored],
+            'misspelt, no PIN': [
+                dict(patient['general_info'], philhealth_pin='',
+                     last_name=misspell(patient['general_info']['last_name'], rng))
+                for patient in stored
+            ],
+            'new patient': [synthetic_patient(rng, args.patients + n, pools)['general_info'] for n in range(args.probes)],
+        }
+        for label, records in probes.items():
+            timings, candidates, found = [], [], 0
+            for general_info in records:
+                candidates.append(len(store.find_block_candidates(blocking_keys(general_info))))
+                started = time.perf_counter()
+                found += bool(find_likely_duplicates(general_info, store))
+                timings.append((time.perf_counter() - started) * 1000)
+            print(f"{label:>17}: p50 {statistics.median(timings):.2f} ms, p99 {percentile(timings, 99):.2f} ms, "
+                  f"max {max(timings):.2f} ms, median candidates {statistics.median(candidates):.0f}, "
+                  f"flagged {found}/{len(records)}")
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
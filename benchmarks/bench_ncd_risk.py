@@ -0,0 +1,84 @@
+"""Population NCD re-scoring: vectorized columns against a per-patient loop.
+
+Fills a temporary store with ``--records`` typical submissions whose vitals,
+habits and histories vary, then re-scores the whole registry with
+``rescore_registry`` (read, score and save) and times ``score_frame`` alone on
+the same inputs. The per-patient path (``score_patient`` on every form, as the
+live form does) is timed on a sample and extrapolated, and its categories are
+checked against the vectorized ones.
+
+    python benchmarks/bench_ncd_risk.py [--records 500000] [--sample 5000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_form_memory import variants  # noqa: E402
+from ncd_risk import FLAG_FIELDS, INPUT_FIELDS, rescore_registry, score_frame, score_patient  # noqa: E402
+from submission_store import SubmissionStore  # noqa: E402
+
+INSERT_BATCH = 5000
+
+
+def patient(rng: random.Random, form_data: dict) -> dict:
+    history = {**form_data['medical_history'],
+               'height': round(rng.uniform(140, 185), 1), 'weight': round(rng.uniform(40, 100), 1),
+               'bp': rng.choice(['110/70', '120/80', '135/85', '145/95', '160/100', '', 'n/a']),
+               'smoking_status': rng.choice(['Yes', 'No', 'No', 'Quit']),
+               'alcohol_status': rng.choice(['Yes', 'No', 'Quit'])}
+    history.update((name, rng.random() < 0.15) for name in FLAG_FIELDS)
+    return {**form_data, 'general_info': {**form_data['general_info'], 'age': rng.randint(18, 90)},
+            'medical_history': history}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=500_000)
+    parser.add_argument('--sample', type=int, default=5000, help="forms scored one at a time")
+    args = parser.parse_args()
+
+    rng = random.Random(18)
+    form_data = variants()['typical']
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SubmissionStore(os.path.join(tmp, 'konsulta.db'))
+        started = time.perf_counter()
+        for start in range(0, args.records, INSERT_BATCH):
+            store.insert_many(patient(rng, form_data) for _ in range(min(INSERT_BATCH, args.records - start)))
+        print(f"stored {args.records} submissions in {time.perf_counter() - started:.1f} s")
+
+        started = time.perf_counter()
+        counts = rescore_registry(store)
+        print(f"rescore_registry: {time.perf_counter() - started:.2f} s {counts}")
+
+        names = ['id'] + [name for _, name in INPUT_FIELDS]
+        frame = pd.DataFrame.from_records([row for rows in store.iter_fields(INPUT_FIELDS) for row in rows],
+                                          columns=names)
+        started = time.perf_counter()
+        scores = score_frame(frame)
+        vectorized = time.perf_counter() - started
+        print(f"score_frame alone: {vectorized:.2f} s ({len(frame) / vectorized:,.0f} rows/s)")
+
+        sample = next(store.iter_chunks(args.sample))
+        started = time.perf_counter()
+        looped = [score_patient(record['form_data']) for record in sample]
+        per_row = (time.perf_counter() - started) / len(sample)
+        print(f"score_patient loop: {per_row * 1e6:.0f} us/row, ~{per_row * len(frame):.1f} s for {len(frame)} rows "
+              f"(without loading the JSON)")
+
+        mismatches = sum(result['risk_category'] != expected
+                         for result, expected in zip(looped, scores['risk_category'][:len(looped)]))
+        print(f"category mismatches between the two paths: {mismatches}")
+        store.close()
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Batch rendering of printable forms.
+
+Stores ``--forms`` varied submissions in a temporary store, all on one day,
+and renders that day's batch as one merged PDF and as a zip of PDFs with
+one worker and with ``--workers``. Every output is checked: the merged
+file's cross-reference table must point at its objects and it must hold
+one set of template pages per form.
+
+    python benchmarks/bench_pdf.py [--forms 1000] [--workers 4]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_form_memory import variants  # noqa: E402
+from bench_ncd_risk import patient  # noqa: E402
+from form_pdf import form_streams, get_template, render_batch, render_pdf, select_records  # noqa: E402
+from submission_store import SubmissionStore  # noqa: E402
+
+DAY = '2026-10-17'
+
+
+def check_pdf(data: bytes) -> int:
+    """Page count of a PDF written by FormPdf, after checking every xref offset"""
+    xref = int(re.search(rb'startxref\n(\d+)\n%%EOF\n$', data)[1])
+    count = int(re.match(rb'xref\n0 (\d+)\n', data[xref:])[1])
+    entries = data[xref:].split(b'\n')[3:3 + count - 1]
+    for number, entry in enumerate(entries, 1):
+        offset = int(entry[:10])
+        if not data.startswith(b'%d 0 obj\n' % number, offset):
+            raise ValueError(f"object {number} is not at offset {offset}")
+    return int(re.search(rb'/Type /Pages /Kids \[[^\]]*\] /Count (\d+)', data)[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--forms', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    rng = random.Random(21)
+    form_data = variants()['typical']
+    template = get_template()
+    pages = len(template.pages)
+    started = time.perf_counter()
+    for _ in range(200):
+        render_pdf(form_data, template)
+    print(f"single form: {(time.perf_counter() - started) / 200 * 1000:.2f} ms, {len(render_pdf(form_data)) / 1024:.1f} "
+          f"KiB, {pages} pages; template {sum(map(len, template.pages)) / 1024:.1f} KiB compressed")
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SubmissionStore(os.path.join(tmp, 'konsulta.db'))
+        store.insert_many(patient(rng, form_data) for _ in range(args.forms))
+        # Stamp them all with one submission day
+        store._conn.execute("UPDATE submissions SET submitted_at = ? || substr(submitted_at, 11)", (DAY,))
+        store._conn.commit()
+
+        print(f"{'output':<10} {'workers':>7} {'seconds':>8} {'forms/s':>8} {'MiB':>6}")
+        for workers in sorted({1, args.workers}):
+            for name in ('forms.pdf', 'forms.zip'):
+                path = os.path.join(tmp, name)
+                counts = render_batch(select_records(store, DAY), path, workers)
+                with open(path, 'rb') as f:
+                    data = f.read()
+                if name.endswith('.pdf'):
+                    failed |= check_pdf(data) != args.forms * pages
+                else:
+                    with zipfile.ZipFile(path) as archive:
+                        names = archive.namelist()
+                        failed |= len(names) != args.forms or check_pdf(archive.read(names[-1])) != pages
+                failed |= counts['forms'] != args.forms
+                print(f"{name:<10} {workers:>7} {counts['seconds']:>8.2f} "
+                      f"{counts['forms'] / counts['seconds']:>8.0f} {counts['bytes'] / 2 ** 20:>6.2f}")
+        store.close()
+
+    # What the merged file would weigh if every page carried its own copy of the static drawing
+    forms = [form_streams(patient(rng, form_data), template) for _ in range(100)]
+    shared = sum(len(stream) for streams in forms for stream in streams)
+    print(f"answers per form {shared / 100 / 1024:.1f} KiB; a private template copy would add "
+          f"{sum(map(len, template.pages)) / 1024:.1f} KiB to each")
+    print("all outputs check out" if not failed else "output check FAILED")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
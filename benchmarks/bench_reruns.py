@@ -0,0 +1,271 @@
+"""Headless rerun latency of streamlit_app.py, driven through AppTest.
+
+Each scenario starts a fresh ``AppTest`` session, applies a sequence of
+widget interactions and times the rerun that follows each one. Per rerun it
+records the wall time of every repeat, the number of widgets on the page and
+the peak Python heap growth (from a separate ``tracemalloc`` pass, so tracing
+does not inflate the timings). Results are written as JSON, and the run exits
+with status 1 when a scenario's p95 exceeds its budget.
+
+    python benchmarks/bench_reruns.py [--repeat 3] [--output rerun_benchmark.json]
+                                      [--p95-budget-ms 400] [--scenario submit]
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+from streamlit.testing.v1.element_tree import Widget  # noqa: E402
+
+from form_schema import FAMILY_CONDITIONS, PAST_CONDITIONS, build_schema, slugify  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, 'streamlit_app.py')
+RUN_TIMEOUT = 60
+
+# p95 rerun budget per scenario, in milliseconds
+P95_BUDGET_MS = {
+    'general_data': 400,
+    'history_toggles': 400,
+    'wizard_steps': 400,
+    'submit': 600,
+}
+
+GAZETTEER_ROWS = [
+    ('036915000', 'Tarlac City', '036915001', 'Aguso', 'Purok 1'),
+    ('036915000', 'Tarlac City', '036915001', 'Aguso', 'Purok 2'),
+    ('036915000', 'Tarlac City', '036915002', 'San Nicolas', 'Purok 1'),
+    ('036916000', 'Capas', '036916001', 'Aranguren', 'Purok 3'),
+]
+FACILITIES = [
+    ('Tarlac City Rural Health Unit I', 'Aguso, Tarlac City'),
+    ('San Nicolas Barangay Health Station', 'San Nicolas, Tarlac City'),
+    ('Capas Medical Clinic', 'Aranguren, Capas'),
+]
+
+GENERAL_DATA = [
+    ('last_name', 'Dela Cruz'), ('first_name', 'Maria'), ('middle_name', 'Santos'),
+    ('age', 42), ('sex', 'F'), ('birthdate', datetime.date(1984, 3, 14)),
+    ('municipality', 'Tarlac City'), ('barangay', 'Aguso'), ('purok', 'Purok 2'),
+    ('contact', '09171234567'), ('email', 'maria.delacruz@example.com'),
+    ('philhealth_pin', '190123456789'), ('member_type', 'MEMBER'),
+    ('registration_date', datetime.date(2026, 10, 1)),
+    ('facility_choice1', 'Tarlac City Rural Health Unit I, Aguso, Tarlac City'), ('choice1_check', True),
+    ('facility_choice2', 'San Nicolas Barangay Health Station, San Nicolas, Tarlac City'),
+    ('facility_choice3', 'Capas Medical Clinic, Aranguren, Capas'),
+    ('appointment_date', datetime.date(2026, 10, 20)),
+]
+VITALS = [
+    ('height', 156.0), ('weight', 61.5), ('bp', '130/85'), ('temp', 36.7), ('rr', 18), ('blood_type', 'O+'),
+    ('smoking_status', 'No'), ('alcohol_status', 'Yes'), ('alcohol_servings', '1'),
+]
+
+Step = Tuple[str, Callable[[AppTest], None]]
+
+
+def fixture_environ(directory: str) -> Dict[str, str]:
+    """Write a small gazetteer and facility list and return the app's environment for them"""
+    with open(os.path.join(directory, 'gazetteer.csv'), 'w', encoding='utf-8') as f:
+        f.write('municipality_code,municipality,barangay_code,barangay,purok\n')
+        f.writelines(','.join(row) + '\n' for row in GAZETTEER_ROWS)
+    with open(os.path.join(directory, 'facilities.csv'), 'w', encoding='utf-8') as f:
+        f.write('name,address\n')
+        f.writelines(f'{name},"{address}"\n' for name, address in FACILITIES)
+    return {
+        'KONSULTA_DB_PATH': os.path.join(directory, 'konsulta.db'),
+        'KONSULTA_DRAFT_DIR': os.path.join(directory, 'drafts'),
+        'KONSULTA_GAZETTEER_PATH': os.path.join(directory, 'gazetteer.csv'),
+        'KONSULTA_FACILITIES_PATH': os.path.join(directory, 'facilities.csv'),
+    }
+
+
+def set_widget(widget_key: str, kind: str, value) -> Callable[[AppTest], None]:
+    """An interaction that puts ``value`` into the widget with ``widget_key``"""
+    def apply(at: AppTest):
+        if kind in ('text', 'facility'):
+            at.text_input(key=widget_key).input(value)
+        elif kind == 'number':
+            at.number_input(key=widget_key).set_value(value)
+        elif kind == 'radio':
+            at.radio(key=widget_key).set_value(value)
+        elif kind in ('selectbox', 'place'):
+            at.selectbox(key=widget_key).set_value(value)
+        elif kind == 'checkbox':
+            at.checkbox(key=widget_key).set_value(value)
+        elif kind == 'date':
+            at.date_input(key=widget_key).set_value(value)
+        else:
+            raise ValueError(f"Unknown field kind: {kind}")
+    return apply
+
+
+def _field_steps(section_key: str, values: List[Tuple[str, object]]) -> List[Step]:
+    fields = build_schema().section(section_key).fields
+    return [(name, set_widget(fields[name].widget_key, fields[name].kind, value)) for name, value in values]
+
+
+def history_values() -> List[Tuple[str, object]]:
+    """Tick every past/family condition and fill the detail each one opens"""
+    fields = build_schema().section('medical_history').fields
+    values = []
+    for prefix, conditions in (('past_', PAST_CONDITIONS), ('fam_', FAMILY_CONDITIONS)):
+        for condition in conditions:
+            name = f"{prefix}{slugify(condition)}"
+            values.append((name, True))
+            values.extend((detail.name, '140/90' if detail.name.endswith('_bp') else 'Reported by patient')
+                          for detail in fields[name].details)
+    return values
+
+
+def _batch(label: str, steps: List[Step]) -> Step:
+    """Several interactions applied before a single rerun"""
+    def apply(at: AppTest):
+        for _, step in steps:
+            step(at)
+    return label, apply
+
+
+def press(label: str) -> Callable[[AppTest], None]:
+    def apply(at: AppTest):
+        next(button for button in at.button if button.label == label).click()
+    return apply
+
+
+def _wizard_steps() -> List[Step]:
+    titles = [tab.title for tab in build_schema().section('medical_history').tabs]
+    steps = [('wizard on', lambda at: at.toggle(key='wizard_mode').set_value(True))]
+    steps += [(f"step {title}", press("Next")) for title in titles[1:]]
+    steps += [(f"back from {titles[-1]}", press("Previous"))]
+    return steps
+
+
+def scenarios() -> Dict[str, List[Step]]:
+    history = history_values()
+    return {
+        'general_data': _field_steps('general_info', GENERAL_DATA),
+        'history_toggles': (_field_steps('medical_history', history)
+                            + _field_steps('medical_history', [(name, False) for name, value in history[:6]
+                                                               if value is True])),
+        'wizard_steps': _wizard_steps(),
+        'submit': [
+            _batch('fill general data', _field_steps('general_info', GENERAL_DATA)),
+            _batch('tick history', _field_steps('medical_history',
+                                                [(name, value) for name, value in history if value is True] + VITALS)),
+            _batch('fill history details', _field_steps('medical_history',
+                                                        [(name, value) for name, value in history if value is not True])),
+            ('submit', press("Submit Assessment")),
+        ],
+    }
+
+
+def _widget_count(at: AppTest) -> int:
+    count = 0
+    pending = [at._tree]
+    while pending:
+        node = pending.pop()
+        count += isinstance(node, Widget)
+        pending.extend(getattr(node, 'children', {}).values())
+    return count
+
+
+def _run(at: AppTest, trace: bool) -> Tuple[float, int]:
+    if trace:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    at.run(timeout=RUN_TIMEOUT)
+    elapsed = (time.perf_counter() - started) * 1000
+    if at.exception:
+        raise RuntimeError(f"App raised during the benchmark: {at.exception[0].message}")
+    if at.error:
+        # e.g. a submit that did not reach the completion threshold
+        raise RuntimeError(f"App reported an error during the benchmark: {at.error[0].value}")
+    peak = tracemalloc.get_traced_memory()[1] - before if trace else 0
+    return elapsed, peak
+
+
+def run_scenario(steps: List[Step], trace: bool = False) -> List[dict]:
+    """One pass through a scenario, starting from a fresh session"""
+    at = AppTest.from_file(APP_PATH, default_timeout=RUN_TIMEOUT)
+    elapsed, peak = _run(at, trace)
+    reruns = [{'step': 'load', 'ms': elapsed, 'widgets': _widget_count(at), 'peak_kib': peak / 1024}]
+    for label, apply in steps:
+        apply(at)
+        elapsed, peak = _run(at, trace)
+        reruns.append({'step': label, 'ms': elapsed, 'widgets': _widget_count(at), 'peak_kib': peak / 1024})
+    return reruns
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def measure(steps: List[Step], repeat: int) -> dict:
+    passes = [run_scenario(steps) for _ in range(repeat)]
+    tracemalloc.start()
+    try:
+        traced = run_scenario(steps, trace=True)
+    finally:
+        tracemalloc.stop()
+    reruns = []
+    for index, rerun in enumerate(passes[0]):
+        timings = [rerun_pass[index]['ms'] for rerun_pass in passes]
+        reruns.append({'step': rerun['step'], 'ms': [round(ms, 2) for ms in timings],
+                       'widgets': rerun['widgets'], 'peak_kib': round(traced[index]['peak_kib'], 1)})
+    # The first load pays for imports and cached resources; keep it out of the percentiles
+    timings = [ms for rerun in reruns[1:] for ms in rerun['ms']]
+    return {
+        'reruns': reruns,
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'max_ms': round(max(timings), 2),
+        'max_widgets': max(rerun['widgets'] for rerun in reruns),
+        'peak_kib': max(rerun['peak_kib'] for rerun in reruns),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='rerun_benchmark.json')
+    parser.add_argument('--p95-budget-ms', type=float,
+                        help="budget for every scenario instead of the defaults in P95_BUDGET_MS")
+    parser.add_argument('--scenario', action='append', choices=sorted(P95_BUDGET_MS),
+                        help="run only this scenario (repeatable)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(fixture_environ(tmp))
+        results, over_budget = {}, []
+        for name, steps in scenarios().items():
+            if args.scenario and name not in args.scenario:
+                continue
+            result = measure(steps, args.repeat)
+            result['budget_p95_ms'] = args.p95_budget_ms or P95_BUDGET_MS[name]
+            results[name] = result
+            print(f"{name:>15}: {len(result['reruns'])} reruns, p50 {result['p50_ms']:.1f} ms, "
+                  f"p95 {result['p95_ms']:.1f} ms (budget {result['budget_p95_ms']:.0f}), "
+                  f"max {result['max_ms']:.1f} ms, {result['max_widgets']} widgets, "
+                  f"peak {result['peak_kib']:.0f} KiB")
+            if result['p95_ms'] > result['budget_p95_ms']:
+                over_budget.append(name)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'repeat': args.repeat, 'python': sys.version.split()[0], 'scenarios': results}, f, indent=2)
+    if over_budget:
+        print(f"p95 over budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
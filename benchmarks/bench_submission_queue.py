@@ -0,0 +1,149 @@
+"""Burst load on the submission queue against a local mock upstream.
+
+Starts a keep-alive HTTP server on localhost that accepts ``{"submissions":
+[...]}`` batches, optionally with added latency and a share of 503 answers,
+then has ``--clients`` threads submit ``--submissions`` forms at once through
+a ``SubmissionQueue`` backed by a temporary SQLite store and an ``HttpSink``.
+Reports the submit latency a session sees, how long the burst takes to be
+stored and to be accepted upstream, and the batches, retries and
+connections it took. Exits 1 if any submission is lost or duplicated.
+
+    python benchmarks/bench_submission_queue.py [--submissions 2000] [--clients 16]
+                                                [--latency-ms 20] [--fail-rate 0.1]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import submission_queue  # noqa: E402
+from bench_form_memory import variants  # noqa: E402
+from bench_reruns import percentile  # noqa: E402
+from submission_queue import FAILED, HttpSink, SubmissionQueue  # noqa: E402
+from submission_store import SubmissionStore  # noqa: E402
+
+
+class MockUpstream(ThreadingHTTPServer):
+    """Records every accepted reference; fails a share of requests with 503"""
+    daemon_threads = True
+
+    def __init__(self, latency: float, fail_rate: float):
+        super().__init__(('127.0.0.1', 0), MockHandler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.references = []
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/submissions"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+            failed = random.random() < self.server.fail_rate
+            if not failed:
+                self.server.references += [item['reference'] for item in json.loads(body)['submissions']]
+        self.send_response(503 if failed else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--submissions', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=16, help="threads submitting at once")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="upstream time per batch")
+    parser.add_argument('--fail-rate', type=float, default=0.1, help="share of batches answered 503")
+    parser.add_argument('--batch-size', type=int, default=submission_queue.BATCH_SIZE)
+    args = parser.parse_args()
+    # Keep retries quick so a burst finishes in seconds
+    submission_queue.BACKOFF_BASE = 0.05
+
+    form_data = variants()['typical']
+    server = MockUpstream(args.latency_ms / 1000, args.fail_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SubmissionStore(os.path.join(tmp, 'konsulta.db'))
+        sink = HttpSink(server.url)
+        submissions = SubmissionQueue(store, sink, batch_size=args.batch_size)
+
+        latencies, tickets = [], []
+        lock = threading.Lock()
+
+        def client(count: int):
+            for i in range(count):
+                form = {**form_data, 'general_info': {**form_data['general_info'], 'last_name': f"Cruz {i}"}}
+                begin = time.perf_counter()
+                ticket = submissions.submit(form, timeout=60)
+                elapsed = (time.perf_counter() - begin) * 1000
+                with lock:
+                    latencies.append(elapsed)
+                    tickets.append(ticket)
+
+        per_client = [args.submissions // args.clients + (i < args.submissions % args.clients)
+                      for i in range(args.clients)]
+        clients = [threading.Thread(target=client, args=(count,)) for count in per_client]
+        started = time.perf_counter()
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        enqueued = time.perf_counter() - started
+        while store.count() < args.submissions:
+            time.sleep(0.005)
+        stored = time.perf_counter() - started
+        submissions.join()
+        finished = time.perf_counter() - started
+
+        statuses = submissions.status(tickets)
+        failed = sum(status['state'] == FAILED for status in statuses.values())
+        submissions.close()
+        sink.close()
+        store.close()
+    server.shutdown()
+
+    references = server.references
+    print(f"{args.submissions} submissions from {args.clients} clients, "
+          f"upstream {args.latency_ms:.0f} ms/batch, {args.fail_rate:.0%} answered 503")
+    print(f"  submit latency  p50 {statistics.median(latencies):.2f} ms, p99 {percentile(latencies, 99):.2f} ms, "
+          f"max {max(latencies):.2f} ms")
+    print(f"  enqueued in {enqueued:.2f} s, stored in {stored:.2f} s "
+          f"({args.submissions / stored:.0f}/s), accepted upstream in {finished:.2f} s "
+          f"({args.submissions / finished:.0f}/s)")
+    print(f"  {submissions.counters['batches']} store batches, {server.requests} upstream requests, "
+          f"{submissions.counters['retries']} retries, {server.connections} connections "
+          f"(sink opened {sink.connections_opened}), {failed} failed")
+    lost = args.submissions - len(set(references)) - failed
+    duplicated = len(references) - len(set(references))
+    print(f"  {lost} lost, {duplicated} accepted twice")
+    sys.exit(1 if lost or duplicated else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Offline sync cost against the size of the registry.
+
+For each ``--sizes`` value a station store is filled with that many
+submissions and synced to an empty central store with one full bundle.
+The station then stores ``--delta`` new submissions and amends a tenth as
+many old ones, and the delta bundle is exported and merged. Delta times
+should stay flat as the registry grows. Afterwards the central store must
+hold exactly the station's records and versions. A second merge of the same
+bundle, with and without the bundle ledger, must change nothing.
+
+    python benchmarks/bench_sync.py [--sizes 10000 100000] [--delta 200]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_form_memory import variants  # noqa: E402
+from bench_ncd_risk import patient  # noqa: E402
+from submission_store import SubmissionStore  # noqa: E402
+from sync_bundle import DUPLICATE, export_bundle, import_bundle  # noqa: E402
+
+INSERT_BATCH = 5000
+
+
+def versions(store: SubmissionStore) -> set:
+    return {(row['record_uuid'], row['version']) for rows in store.iter_sync_rows() for row in rows}
+
+
+def timed_sync(station: SubmissionStore, central: SubmissionStore, directory: str, **options):
+    started = time.perf_counter()
+    header = export_bundle(station, directory, 'bench', **options)
+    exported = time.perf_counter() - started
+    with open(header['path'], 'rb') as f:
+        data = f.read()
+    started = time.perf_counter()
+    counts = import_bundle(central, data)
+    return header, data, counts, exported, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--delta', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(22)
+    form_data = variants()['typical']
+    failed = False
+    print(f"{'registry':>9} {'full export s':>13} {'full import s':>13} {'MiB':>6} | {'delta':>5} "
+          f"{'export ms':>9} {'import ms':>9} {'KiB':>6} {'again ms':>8}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            station = SubmissionStore(os.path.join(tmp, 'station.db'))
+            central = SubmissionStore(os.path.join(tmp, 'central.db'))
+            for start in range(0, size, INSERT_BATCH):
+                station.insert_many(patient(rng, form_data) for _ in range(min(INSERT_BATCH, size - start)))
+            full, _, _, full_export, full_import = timed_sync(station, central, tmp)
+
+            ids = [row['id'] for rows in station.iter_sync_rows() for row in rows]
+            station.insert_many(patient(rng, form_data) for _ in range(args.delta))
+            for submission_id in rng.sample(ids, args.delta // 10):
+                station.amend(submission_id, patient(rng, form_data))
+            delta, data, counts, delta_export, delta_import = timed_sync(station, central, tmp)
+
+            started = time.perf_counter()
+            again = import_bundle(central, data)
+            again_ms = (time.perf_counter() - started) * 1000
+            central._conn.execute("DELETE FROM sync_bundles")
+            remerged = import_bundle(central, data)
+            failed |= (not again['already_imported'] or remerged[DUPLICATE] != delta['records']
+                       or counts['updated'] != args.delta // 10 or versions(central) != versions(station))
+            print(f"{size:>9} {full_export:>13.2f} {full_import:>13.2f} {full['bytes'] / 2 ** 20:>6.2f} | "
+                  f"{delta['records']:>5} {delta_export * 1000:>9.1f} {delta_import * 1000:>9.1f} "
+                  f"{delta['bytes'] / 1024:>6.1f} {again_ms:>8.1f}")
+            station.close()
+            central.close()
+    print("central matches the station" if not failed else "stores DIFFER after sync")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
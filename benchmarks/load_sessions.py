@@ -0,0 +1,188 @@
+"""Concurrent-session load simulator for streamlit_app.py.
+
+Each simulated encoder is an ``AppTest`` session in its own worker process
+(AppTest keeps a process-global runtime, so sessions cannot share one). All
+workers of a concurrency level start together behind a barrier, share one
+SQLite database, and replay a form-filling trace ``--forms`` times, each
+time as a fresh session. For every level the tool reports throughput
+(reruns/s across all sessions), p50/p99 rerun latency and each worker's
+resident memory: the baseline after imports and the peak while replaying.
+
+A trace is a JSON list of steps; each step is applied before one rerun::
+
+    [{"label": "last name", "actions": [{"section": "general_info", "field": "last_name", "value": "Cruz"}]},
+     {"label": "submit", "actions": [{"press": "Submit Assessment"}]}]
+
+Dates are ISO strings. ``--dump-trace`` writes the built-in trace as a
+starting point for recorded ones.
+
+    python benchmarks/load_sessions.py [--concurrency 1 2 4 8 16] [--forms 2]
+                                       [--trace trace.json] [--output load.json]
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_reruns import (APP_PATH, GENERAL_DATA, RUN_TIMEOUT, VITALS, fixture_environ,  # noqa: E402
+                          history_values, percentile, press, set_widget)
+
+_barrier = None
+
+
+def default_trace() -> List[Dict[str, Any]]:
+    """General Data field by field, then the history in two batches and a submit"""
+    def action(section, name, value):
+        if isinstance(value, datetime.date):
+            value = value.isoformat()
+        return {'section': section, 'field': name, 'value': value}
+
+    history = history_values()
+    trace = [{'label': name, 'actions': [action('general_info', name, value)]} for name, value in GENERAL_DATA]
+    ticks = [(name, value) for name, value in history if value is True] + VITALS
+    trace.append({'label': 'tick history', 'actions': [action('medical_history', name, value)
+                                                       for name, value in ticks]})
+    trace.append({'label': 'fill history details', 'actions': [action('medical_history', name, value)
+                                                               for name, value in history if value is not True]})
+    trace.append({'label': 'submit', 'actions': [{'press': "Submit Assessment"}]})
+    return trace
+
+
+def compile_trace(trace: List[Dict[str, Any]]):
+    """Turn trace steps into AppTest interactions"""
+    from form_schema import build_schema
+    schema = build_schema()
+    steps = []
+    for step in trace:
+        interactions = []
+        for action in step['actions']:
+            if 'press' in action:
+                interactions.append(press(action['press']))
+                continue
+            field = schema.section(action['section']).fields[action['field']]
+            value = action['value']
+            if field.kind == 'date':
+                value = datetime.date.fromisoformat(value)
+            interactions.append(set_widget(field.widget_key, field.kind, value))
+        steps.append((step['label'], interactions))
+    return steps
+
+
+def _rss_kib() -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def _init_worker(barrier, environ: Dict[str, str]):
+    global _barrier
+    _barrier = barrier
+    os.environ.update(environ)
+
+
+def replay(args) -> Dict[str, Any]:
+    """Worker: replay the trace ``forms`` times and report timings and memory"""
+    trace, forms = args
+    from streamlit.testing.v1 import AppTest
+
+    steps = compile_trace(trace)
+    # Warm the imports and cached resources before the clock starts
+    AppTest.from_file(APP_PATH, default_timeout=RUN_TIMEOUT).run()
+    baseline = _rss_kib()
+    _barrier.wait()
+
+    latencies, errors = [], 0
+    started = time.time()
+    for _ in range(forms):
+        at = AppTest.from_file(APP_PATH, default_timeout=RUN_TIMEOUT)
+        for interactions in [[]] + [interactions for _, interactions in steps]:
+            for interact in interactions:
+                interact(at)
+            begin = time.perf_counter()
+            at.run()
+            latencies.append((time.perf_counter() - begin) * 1000)
+            errors += bool(at.exception or at.error)
+    return {
+        'latencies': latencies,
+        'errors': errors,
+        'started': started,
+        'finished': time.time(),
+        'baseline_rss_kib': baseline,
+        # ru_maxrss is the peak resident size in KiB on Linux
+        'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_level(sessions: int, trace, forms: int, environ: Dict[str, str]) -> Dict[str, Any]:
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(sessions)
+    with context.Pool(sessions, initializer=_init_worker, initargs=(barrier, environ)) as pool:
+        # One task per worker; the barrier keeps a fast worker from taking two
+        results = pool.map(replay, [(trace, forms)] * sessions, chunksize=1)
+
+    latencies = [ms for result in results for ms in result['latencies']]
+    elapsed = max(result['finished'] for result in results) - min(result['started'] for result in results)
+    baseline = [result['baseline_rss_kib'] for result in results]
+    peak = [result['peak_rss_kib'] for result in results]
+    return {
+        'sessions': sessions,
+        'reruns': len(latencies),
+        'errors': sum(result['errors'] for result in results),
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(max(latencies), 2),
+        'baseline_rss_mib': round(statistics.mean(baseline) / 1024, 1),
+        'peak_rss_mib': round(max(peak) / 1024, 1),
+        'session_growth_mib': round(statistics.mean(p - b for p, b in zip(peak, baseline)) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--forms', type=int, default=2, help="forms each session fills per level")
+    parser.add_argument('--trace', help="JSON trace to replay instead of the built-in one")
+    parser.add_argument('--dump-trace', metavar='PATH', help="write the built-in trace and exit")
+    parser.add_argument('--output', default='load_sessions.json')
+    args = parser.parse_args()
+
+    if args.dump_trace:
+        with open(args.dump_trace, 'w', encoding='utf-8') as f:
+            json.dump(default_trace(), f, indent=2)
+        return
+    if args.trace:
+        with open(args.trace, encoding='utf-8') as f:
+            trace = json.load(f)
+    else:
+        trace = default_trace()
+
+    levels = []
+    print(f"{'sessions':>8} {'reruns/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'RSS MiB':>8} {'+/session':>9} {'errors':>6}")
+    for sessions in args.concurrency:
+        with tempfile.TemporaryDirectory() as tmp:
+            level = run_level(sessions, trace, args.forms, fixture_environ(tmp))
+        levels.append(level)
+        print(f"{sessions:>8} {level['throughput_rps']:>9.1f} {level['p50_ms']:>8.1f} {level['p99_ms']:>8.1f} "
+              f"{level['baseline_rss_mib']:>8.1f} {level['session_growth_mib']:>9.1f} {level['errors']:>6}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'forms': args.forms, 'cpus': os.cpu_count(), 'levels': levels}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""Bitmap indexes of stored submissions for cohort searches.
+
+Every indexed answer -- each past/family condition and immunization the
+dashboard counts, the categorical fields (sex, member type, blood type, the
+social-history statuses), the barangay and the registration month -- has a
+``Bitmap`` of the ids of the submissions that gave it. A search ANDs the
+bitmaps of the required answers (ORing the alternatives chosen for one
+field) with the bitmap of each patient's latest submission, so a query costs
+a few machine-word operations per 64 submissions whatever their number.
+
+``Bitmap`` is roaring-style: ids are split into chunks of 65536, and each
+chunk is a sorted ``array('H')`` of the low 16 bits while it holds at most
+``ARRAY_LIMIT`` ids, and an int bitset once it is denser, so rare answers
+and small barangays cost two bytes per submission instead of 8 KiB per
+chunk.
+
+The index lives in memory, one per process (see ``get_cohort_index``).
+Before each search it reads the submissions stored since the last one,
+including those written by other processes such as the importer, and drops
+the rows that newer versions of their records have superseded.
+"""
+import bisect
+import collections
+import itertools
+import threading
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import streamlit as st
+
+from matching import normalize_pin
+from rollups import UNANSWERED, RollupLayout, get_rollup_layout, rollup_key
+from submission_store import SubmissionStore
+
+CHUNK_BITS = 16
+LOW_MASK = (1 << CHUNK_BITS) - 1
+# Above this many ids a chunk is smaller as a 8 KiB bitset than as an array of uint16
+ARRAY_LIMIT = 4096
+
+CATEGORY_FIELDS = [
+    ('general_info', 'sex'), ('general_info', 'member_type'), ('medical_history', 'blood_type'),
+    ('medical_history', 'smoking_status'), ('medical_history', 'alcohol_status'),
+    ('medical_history', 'illicit_drugs_status'), ('medical_history', 'sexually_active_status'),
+]
+PLACE_FIELDS = [('general_info', name) for name in
+                ('municipality', 'municipality_code', 'barangay', 'barangay_code', 'registration_date')]
+PIN_FIELD = ('general_info', 'philhealth_pin')
+
+BARANGAY = 'barangay'
+MONTH = 'month'
+
+Container = Union[array, int]
+
+
+def _to_bitset(values: Iterable[int]) -> int:
+    bits = bytearray(1 << (CHUNK_BITS - 3))
+    for value in values:
+        bits[value >> 3] |= 1 << (value & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def _and(a: Container, b: Container) -> Container:
+    if isinstance(a, int) and isinstance(b, int):
+        return a & b
+    if isinstance(a, int):
+        a, b = b, a
+    if isinstance(b, int):
+        bits = b.to_bytes(1 << (CHUNK_BITS - 3), 'little')
+        return array('H', [value for value in a if bits[value >> 3] >> (value & 7) & 1])
+    return array('H', sorted(set(a).intersection(b)))
+
+
+def _union(containers: List[Container]) -> Container:
+    arrays = [container for container in containers if not isinstance(container, int)]
+    if len(containers) == len(arrays) and sum(map(len, arrays)) <= ARRAY_LIMIT:
+        return array('H', sorted(set().union(*arrays)))
+    result = _to_bitset(itertools.chain.from_iterable(arrays))
+    for container in containers:
+        if isinstance(container, int):
+            result |= container
+    return result
+
+
+class Bitmap:
+    """Roaring-style compressed set of submission ids"""
+
+    __slots__ = ('_chunks',)
+
+    def __init__(self, chunks: Optional[Dict[int, Container]] = None):
+        self._chunks: Dict[int, Container] = chunks if chunks is not None else {}
+
+    def add(self, value: int):
+        high, low = value >> CHUNK_BITS, value & LOW_MASK
+        chunk = self._chunks.get(high)
+        if chunk is None:
+            self._chunks[high] = array('H', [low])
+        elif isinstance(chunk, int):
+            self._chunks[high] = chunk | (1 << low)
+        else:
+            if chunk[-1] < low:
+                # Ids arrive in increasing order, so this is the usual case
+                chunk.append(low)
+            else:
+                index = bisect.bisect_left(chunk, low)
+                if index == len(chunk) or chunk[index] != low:
+                    chunk.insert(index, low)
+            if len(chunk) > ARRAY_LIMIT:
+                self._chunks[high] = _to_bitset(chunk)
+
+    def discard(self, value: int):
+        high, low = value >> CHUNK_BITS, value & LOW_MASK
+        chunk = self._chunks.get(high)
+        if chunk is None:
+            return
+        if isinstance(chunk, int):
+            chunk &= ~(1 << low)
+            self._chunks[high] = chunk
+        else:
+            index = bisect.bisect_left(chunk, low)
+            if index < len(chunk) and chunk[index] == low:
+                del chunk[index]
+        if not chunk:
+            del self._chunks[high]
+
+    def __and__(self, other: 'Bitmap') -> 'Bitmap':
+        chunks = {}
+        for high in self._chunks.keys() & other._chunks.keys():
+            chunk = _and(self._chunks[high], other._chunks[high])
+            if chunk:
+                chunks[high] = chunk
+        return Bitmap(chunks)
+
+    def __or__(self, other: 'Bitmap') -> 'Bitmap':
+        return union([self, other])
+
+    def copy(self) -> 'Bitmap':
+        return union([self])
+
+    def __len__(self) -> int:
+        return sum(chunk.bit_count() if isinstance(chunk, int) else len(chunk) for chunk in self._chunks.values())
+
+    def __contains__(self, value: int) -> bool:
+        chunk = self._chunks.get(value >> CHUNK_BITS)
+        if chunk is None:
+            return False
+        low = value & LOW_MASK
+        if isinstance(chunk, int):
+            return bool(chunk >> low & 1)
+        index = bisect.bisect_left(chunk, low)
+        return index < len(chunk) and chunk[index] == low
+
+    def descending(self) -> Iterator[int]:
+        """Ids from the highest (newest submission) down"""
+        for high in sorted(self._chunks, reverse=True):
+            chunk, base = self._chunks[high], high << CHUNK_BITS
+            if isinstance(chunk, int):
+                while chunk:
+                    top = chunk.bit_length() - 1
+                    yield base | top
+                    chunk ^= 1 << top
+            else:
+                for low in reversed(chunk):
+                    yield base | low
+
+    def nbytes(self) -> int:
+        """Approximate payload size: two bytes per array entry, the bitset size otherwise"""
+        return sum((chunk.bit_length() + 7) // 8 if isinstance(chunk, int) else chunk.itemsize * len(chunk)
+                   for chunk in self._chunks.values())
+
+
+def union(bitmaps: Iterable[Bitmap]) -> Bitmap:
+    """Union of any number of bitmaps, merging each chunk once"""
+    grouped: Dict[int, List[Container]] = collections.defaultdict(list)
+    for bitmap in bitmaps:
+        for high, chunk in bitmap._chunks.items():
+            grouped[high].append(chunk)
+    return Bitmap({high: _union(containers) for high, containers in grouped.items()})
+
+
+class CohortIndex:
+    """Bitmaps of submission ids per indexed answer, caught up from the store before each search"""
+
+    def __init__(self, layout: RollupLayout):
+        self.flags = {name: layout.labels[metric] for metric, name in layout.flags}
+        self.fields = list(PLACE_FIELDS) + [PIN_FIELD] + CATEGORY_FIELDS + [
+            ('medical_history', name) for name in self.flags]
+        self._lock = threading.Lock()
+        self._bitmaps: Dict[Tuple[str, Any], Bitmap] = {}
+        # Each patient's newest submission; patients are told apart by PIN
+        self._latest = Bitmap()
+        self._latest_by_pin: Dict[str, int] = {}
+        self.last_id = 0
+
+    def _add(self, key: Tuple[str, Any], submission_id: int):
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None:
+            bitmap = self._bitmaps[key] = Bitmap()
+        bitmap.add(submission_id)
+
+    def add(self, submission_id: int, values: Dict[Tuple[str, str], Any]):
+        """Index one submission, given the value of each of ``fields``"""
+        general = {name: values.get((section, name)) for section, name in PLACE_FIELDS}
+        month, municipality, barangay = rollup_key({'general_info': general}, '')
+        self._add((BARANGAY, (municipality, barangay)), submission_id)
+        if month:
+            self._add((MONTH, month), submission_id)
+        for field in CATEGORY_FIELDS:
+            value = values.get(field)
+            self._add((field[1], value if isinstance(value, str) and value else UNANSWERED), submission_id)
+        for name in self.flags:
+            # SQLite hands JSON true back as 1
+            if values.get(('medical_history', name)) in (True, 1):
+                self._add((name, True), submission_id)
+        pin = normalize_pin(values.get(PIN_FIELD))
+        if pin:
+            previous = self._latest_by_pin.get(pin)
+            if previous is not None:
+                self._latest.discard(previous)
+            self._latest_by_pin[pin] = submission_id
+        self._latest.add(submission_id)
+
+    def refresh(self, store: SubmissionStore) -> int:
+        """Index the submissions stored since the last refresh and return how many there were"""
+        added = 0
+        with self._lock:
+            caught_up_from = self.last_id
+            for rows in store.iter_fields(self.fields, after_id=self.last_id):
+                for row in rows:
+                    self.add(row[0], dict(zip(self.fields, row[1:])))
+                added += len(rows)
+                self.last_id = rows[-1][0]
+            # Rows replaced by a newer version (an amendment or a synced update) drop out of every search
+            for submission_id in store.superseded_since(caught_up_from):
+                self._latest.discard(submission_id)
+        return added
+
+    def values(self, field: str) -> List[Any]:
+        """Indexed values of a field (``BARANGAY``, ``MONTH`` or a category field name)"""
+        with self._lock:
+            return sorted(value for name, value in self._bitmaps if name == field)
+
+    def search(self, flags: Iterable[str] = (), any_of: Optional[Dict[str, Iterable[Any]]] = None) -> Bitmap:
+        """Latest submissions with every flag ticked and, for each ``any_of`` field, one of the given values"""
+        empty = Bitmap()
+        with self._lock:
+            result = self._latest
+            for name in flags:
+                result = result & self._bitmaps.get((name, True), empty)
+            for field, values in (any_of or {}).items():
+                values = list(values)
+                if values:
+                    result = result & union(self._bitmaps.get((field, value), empty) for value in values)
+            return result.copy() if result is self._latest else result
+
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(bitmap.nbytes() for bitmap in self._bitmaps.values()) + self._latest.nbytes()
+
+
+@st.cache_resource
+def get_cohort_index() -> CohortIndex:
+    """Return the process-wide cohort index; call ``refresh`` before searching"""
+    return CohortIndex(get_rollup_layout())
+
+
+def months_between(start: str, end: str) -> List[str]:
+    """``YYYY-MM`` months from the month of ``start`` to that of ``end``, both ISO dates"""
+    year, month = int(start[:4]), int(start[5:7])
+    months = []
+    while f"{year:04d}-{month:02d}" <= end[:7]:
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
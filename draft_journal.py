@@ -0,0 +1,150 @@
+"""Crash-safe autosave of in-progress forms.
+
+Every draft is a snapshot file plus an append-only JSONL journal. Sessions
+mark the form_data keys they change, and ``flush`` appends only those keys
+to the journal, at most once per ``AUTOSAVE_INTERVAL``. After
+``COMPACT_EVERY`` entries the journal is folded into a fresh snapshot. A
+session that reconnects with the same ``?draft=`` id resumes from the
+snapshot plus the journal tail.
+"""
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, Optional, Set, Tuple
+
+import streamlit as st
+
+DRAFT_DIR = os.environ.get('KONSULTA_DRAFT_DIR', 'drafts')
+AUTOSAVE_INTERVAL = 5.0
+COMPACT_EVERY = 50
+
+
+def _fsync_write(path: str, text: str):
+    """Atomically replace ``path`` with ``text``"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class DraftJournal:
+    """Snapshot + journal files for one draft"""
+
+    def __init__(self, draft_id: str, directory: str = DRAFT_DIR,
+                 interval: float = AUTOSAVE_INTERVAL, compact_every: int = COMPACT_EVERY):
+        self.draft_id = draft_id
+        self.interval = interval
+        self.compact_every = compact_every
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_path = os.path.join(directory, f"{draft_id}.snapshot.json")
+        self.journal_path = os.path.join(directory, f"{draft_id}.journal.jsonl")
+        self._dirty: Set[Tuple[str, str]] = set()
+        self._seq = 0
+        self._entries_since_snapshot = 0
+        self._last_flush = time.monotonic()
+
+    def mark_dirty(self, section_key: str, name: str):
+        self._dirty.add((section_key, name))
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._dirty)
+
+    def flush(self, form_data: Dict[str, Dict[str, Any]], force: bool = False) -> bool:
+        """Append the changed keys to the journal if the debounce interval has passed"""
+        if not self._dirty or (not force and time.monotonic() - self._last_flush < self.interval):
+            return False
+
+        changes: Dict[str, Dict[str, Any]] = {}
+        deleted = []
+        for section_key, name in self._dirty:
+            section = form_data.get(section_key, {})
+            if name in section:
+                changes.setdefault(section_key, {})[name] = section[name]
+            else:
+                deleted.append([section_key, name])
+        self._seq += 1
+        entry = {'seq': self._seq, 'set': changes}
+        if deleted:
+            entry['del'] = deleted
+
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._dirty.clear()
+        self._last_flush = time.monotonic()
+        self._entries_since_snapshot += 1
+
+        if self._entries_since_snapshot >= self.compact_every:
+            self.compact(form_data)
+        return True
+
+    def compact(self, form_data: Dict[str, Dict[str, Any]]):
+        """Fold the journal into a new snapshot and start an empty journal"""
+        snapshot = {'seq': self._seq, 'form_data': form_data}
+        # Sections may be SectionRecord mappings rather than dicts
+        _fsync_write(self.snapshot_path, json.dumps(snapshot, separators=(',', ':'), default=dict))
+        # Entries are replayed only if newer than the snapshot, so a crash
+        # before this truncation is harmless.
+        open(self.journal_path, 'w').close()
+        self._entries_since_snapshot = 0
+
+    def load(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Rebuild the draft from the snapshot plus the journal tail"""
+        form_data: Dict[str, Dict[str, Any]] = {}
+        found = False
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            form_data = snapshot['form_data']
+            self._seq = snapshot['seq']
+            found = True
+
+        if os.path.exists(self.journal_path):
+            good_bytes = 0
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-write
+                        break
+                    good_bytes += len(line)
+                    if entry['seq'] <= self._seq:
+                        continue
+                    for section_key, values in entry['set'].items():
+                        form_data.setdefault(section_key, {}).update(values)
+                    for section_key, name in entry.get('del', []):
+                        form_data.get(section_key, {}).pop(name, None)
+                    self._seq = entry['seq']
+                    self._entries_since_snapshot += 1
+                    found = True
+            if good_bytes < os.path.getsize(self.journal_path):
+                # Drop the torn tail so new entries start on a clean line
+                with open(self.journal_path, 'r+b') as f:
+                    f.truncate(good_bytes)
+        return form_data if found else None
+
+    def discard(self):
+        """Remove the draft files, e.g. once the assessment is submitted"""
+        for path in (self.snapshot_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._dirty.clear()
+        self._seq = 0
+        self._entries_since_snapshot = 0
+
+
+def get_draft_journal() -> DraftJournal:
+    """Return this session's journal, keyed by the ``draft`` query parameter"""
+    if 'draft_journal' not in st.session_state:
+        draft_id = st.query_params.get('draft')
+        if not draft_id or not draft_id.isalnum():
+            draft_id = uuid.uuid4().hex
+            st.query_params['draft'] = draft_id
+        st.session_state.draft_journal = DraftJournal(draft_id)
+    return st.session_state.draft_journal
@@ -0,0 +1,199 @@
+"""Streaming export of stored submissions to CSV, JSONL or Parquet.
+
+Submissions are read from the store ``CHUNK_SIZE`` at a time and flattened
+into one row each: the General Data and Medical History fields of the form
+schema become columns, in form order, followed by the canonical place codes.
+Each format is a generator of byte chunks, so an export holds one chunk (one
+Parquet row group) in memory whatever the size of the database, and the
+chunks can go straight to a file or an HTTP response.
+
+Periods are by registration date, falling back to the submission date for
+forms without one, so records imported or synced late are reported in the
+month the patient registered, as on the dashboard.
+
+    python exporter.py --format csv --month 2026-09 --output september.csv
+"""
+import argparse
+import csv
+import datetime
+import io
+import json
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from form_schema import FormSchema, build_schema
+from gazetteer import CODE_FIELDS
+from submission_store import DEFAULT_DB_PATH, SubmissionStore
+
+CHUNK_SIZE = 500
+# Rows per Parquet row group; store chunks are buffered as Arrow batches until then
+ROW_GROUP_SIZE = 10_000
+
+EXPORT_SECTIONS = ['general_info', 'medical_history']
+# Stored General Data keys that are not form fields
+EXTRA_FIELDS = {'general_info': CODE_FIELDS}
+
+Column = Tuple[str, str]
+
+
+def export_columns(schema: FormSchema) -> List[Column]:
+    """(section, field) of every exported column, after id and submitted_at"""
+    columns = []
+    for section_key in EXPORT_SECTIONS:
+        names = list(schema.section(section_key).fields) + EXTRA_FIELDS.get(section_key, [])
+        columns += [(section_key, name) for name in names]
+    return columns
+
+
+def flatten(record: Dict[str, Any], columns: List[Column]) -> list:
+    form_data = record['form_data']
+    return [record['id'], record['submitted_at']] + [form_data.get(section, {}).get(name)
+                                                     for section, name in columns]
+
+
+def header(columns: List[Column]) -> List[str]:
+    return ['id', 'submitted_at'] + [name for _, name in columns]
+
+
+def csv_chunks(records: Iterable[List[Dict[str, Any]]], columns: List[Column]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header(columns))
+    for chunk in records:
+        writer.writerows(flatten(record, columns) for record in chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def jsonl_chunks(records: Iterable[List[Dict[str, Any]]], columns: List[Column]) -> Iterator[bytes]:
+    names = header(columns)
+    for chunk in records:
+        yield ''.join(json.dumps(dict(zip(names, flatten(record, columns))), separators=(',', ':')) + '\n'
+                      for record in chunk).encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last drain"""
+
+    def __init__(self):
+        super().__init__()
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def parquet_chunks(records: Iterable[List[Dict[str, Any]]], columns: List[Column],
+                   schema: FormSchema) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    kinds = {(section, name): field.kind for section in EXPORT_SECTIONS
+             for name, field in schema.section(section).fields.items()}
+    types = {'checkbox': pa.bool_(), 'number': pa.float64()}
+    fields = [pa.field('id', pa.int64()), pa.field('submitted_at', pa.string())]
+    fields += [pa.field(name, types.get(kinds.get((section, name)), pa.string())) for section, name in columns]
+    arrow_schema = pa.schema(fields)
+    # Values that do not fit their column (e.g. text left in a number field) are exported as null
+    accepts = {pa.bool_(): lambda v: isinstance(v, bool),
+               pa.float64(): lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+               pa.string(): lambda v: isinstance(v, str), pa.int64(): lambda v: isinstance(v, int)}
+    checks = [accepts[field.type] for field in fields]
+
+    sink = _ChunkSink()
+    # Min/max statistics of every free-text column would pile up in the footer, row group after row group
+    statistics = [field.name for field in fields if field.type != pa.string()] + ['submitted_at']
+    writer = pq.ParquetWriter(sink, arrow_schema, compression='zstd', write_statistics=statistics)
+    batches: List[pa.RecordBatch] = []
+    buffered = 0
+    for chunk in records:
+        rows = [flatten(record, columns) for record in chunk]
+        arrays = [pa.array([value if value is None or check(value) else None for value in column], type=field.type)
+                  for column, check, field in zip(zip(*rows), checks, fields)]
+        batches.append(pa.RecordBatch.from_arrays(arrays, schema=arrow_schema))
+        buffered += len(rows)
+        if buffered >= ROW_GROUP_SIZE:
+            writer.write_table(pa.Table.from_batches(batches))
+            batches, buffered = [], 0
+            yield sink.drain()
+    if batches:
+        writer.write_table(pa.Table.from_batches(batches))
+    writer.close()
+    yield sink.drain()
+
+
+# Export format -> MIME type
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def month_range(month: str) -> Tuple[str, str]:
+    """``YYYY-MM`` -> ISO bounds [first of the month, first of the next)"""
+    start = datetime.date.fromisoformat(f"{month}-01")
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start.isoformat(), end.isoformat()
+
+
+def export_chunks(store: SubmissionStore, fmt: str, schema: FormSchema, since: Optional[str] = None,
+                  until: Optional[str] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Byte chunks of an export of submissions registered within [since, until)"""
+    columns = export_columns(schema)
+    records = store.iter_chunks(chunk_size, since, until, registered=True)
+    if fmt == 'parquet':
+        return parquet_chunks(records, columns, schema)
+    if fmt == 'jsonl':
+        return jsonl_chunks(records, columns)
+    return csv_chunks(records, columns)
+
+
+def export_filename(fmt: str, since: Optional[str] = None, until: Optional[str] = None) -> str:
+    period = '_'.join(bound for bound in (since, until) if bound) or 'all'
+    return f"konsulta_submissions_{period}.{fmt}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export stored submissions to CSV, JSONL or Parquet.")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH)
+    parser.add_argument('--month', help="only submissions registered in this month, YYYY-MM")
+    parser.add_argument('--since', help="only submissions registered on or after this ISO date")
+    parser.add_argument('--until', help="only submissions registered before this ISO date")
+    parser.add_argument('--output', help="file to write; defaults to stdout (CSV and JSONL only)")
+    args = parser.parse_args()
+
+    since, until = month_range(args.month) if args.month else (args.since, args.until)
+    if args.output is None and args.format == 'parquet':
+        parser.error("--output is required for Parquet")
+    store = SubmissionStore(args.db)
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for data in export_chunks(store, args.format, build_schema(), since, until):
+            output.write(data)
+    finally:
+        if args.output:
+            output.close()
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Accredited-facility directory for the preferred-facility typeahead.
+
+The directory is read from a local CSV or JSON file once per process (see
+``get_facility_directory``). Entries are kept as one tuple of display labels
+plus two indexes over their normalised form: a sorted key list searched with
+``bisect`` for prefix matches, and trigram posting lists (``array('I')`` of
+entry ids) that tolerate typos and words typed out of order.
+"""
+import bisect
+import csv
+import heapq
+import json
+import os
+import re
+from array import array
+from collections import Counter
+from operator import itemgetter
+from typing import Dict, Iterable, List, Tuple
+
+import streamlit as st
+
+DEFAULT_FACILITIES_PATH = os.environ.get('KONSULTA_FACILITIES_PATH', 'facilities.csv')
+
+SUGGESTION_LIMIT = 8
+# Trigrams found in more than this share of entries ("hea", "alt", ...) say
+# nothing about which facility is meant and are skipped when counting.
+COMMON_TRIGRAM_SHARE = 0.05
+MIN_TRIGRAM_SCORE = 0.4
+# Candidates rescored against the full query after the posting-list count
+RESCORE_LIMIT = 100
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text: str) -> str:
+    """Lowercase alphanumeric words separated by single spaces"""
+    return _NON_ALNUM.sub(' ', (text or '').lower()).strip()
+
+
+def trigrams(normalized: str) -> List[str]:
+    padded = f"  {normalized} "
+    return list(dict.fromkeys(padded[i:i + 3] for i in range(len(padded) - 2)))
+
+
+def facility_label(name: str, address: str = '') -> str:
+    """The value stored in ``facility_choice{1,2,3}``"""
+    name, address = (name or '').strip(), (address or '').strip()
+    return f"{name}, {address}" if address else name
+
+
+def read_facilities(path: str) -> List[str]:
+    """Labels from a CSV with ``name``/``address`` columns or a JSON list of such objects"""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.endswith('.json'):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+    return [facility_label(row.get('name', ''), row.get('address', '')) for row in rows if row.get('name')]
+
+
+class FacilityDirectory:
+    """Read-only facility labels with prefix and trigram lookups"""
+
+    def __init__(self, labels: Iterable[str]):
+        # Entry ids follow the sorted normalised keys, so a prefix range of
+        # ``_keys`` is also a range of ``labels``
+        keyed = sorted((normalize(label), label) for label in dict.fromkeys(labels))
+        self.labels: Tuple[str, ...] = tuple(label for _, label in keyed)
+        self._keys: List[str] = [key for key, _ in keyed]
+        self._known = frozenset(self.labels)
+
+        postings: Dict[str, array] = {}
+        for i, key in enumerate(self._keys):
+            for gram in trigrams(key):
+                postings.setdefault(gram, array('I')).append(i)
+        self._postings = postings
+        self._common = max(int(len(self.labels) * COMMON_TRIGRAM_SHARE), 50)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __contains__(self, label: str) -> bool:
+        return label in self._known
+
+    def prefix_matches(self, query: str, limit: int = SUGGESTION_LIMIT) -> List[str]:
+        """Labels whose normalised form starts with the normalised query"""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self._keys, prefix)
+        end = start
+        while end < min(start + limit, len(self._keys)) and self._keys[end].startswith(prefix):
+            end += 1
+        return list(self.labels[start:end])
+
+    def fuzzy_matches(self, query: str, limit: int = SUGGESTION_LIMIT) -> List[str]:
+        """Labels sharing the most informative trigrams with the query"""
+        grams = [gram for gram in trigrams(normalize(query)) if gram in self._postings]
+        if not grams:
+            return []
+        lists = sorted((self._postings[gram] for gram in grams), key=len)
+        selective = [ids for ids in lists if len(ids) <= self._common] or lists[:1]
+        counts = Counter()
+        for ids in selective:
+            counts.update(ids)
+        needed = len(selective) * MIN_TRIGRAM_SCORE
+        shortlist = heapq.nlargest(RESCORE_LIMIT, counts.items(), key=itemgetter(1))
+        # Rescore the shortlist with every query trigram, common ones included,
+        # so "Health Station" still beats "Health Center" among similar names
+        scored = []
+        for i, count in shortlist:
+            if count < needed:
+                break
+            padded = f"  {self._keys[i]} "
+            scored.append((-sum(gram in padded for gram in grams), len(padded), i))
+        scored.sort()
+        return [self.labels[i] for _, _, i in scored[:limit]]
+
+    def search(self, query: str, limit: int = SUGGESTION_LIMIT) -> List[str]:
+        """Prefix matches first, topped up with typo-tolerant trigram matches"""
+        matches = self.prefix_matches(query, limit)
+        if len(matches) < limit and len(normalize(query)) >= 3:
+            seen = set(matches)
+            matches += [label for label in self.fuzzy_matches(query, limit) if label not in seen]
+        return matches[:limit]
+
+
+@st.cache_resource
+def get_facility_directory(path: str = DEFAULT_FACILITIES_PATH) -> FacilityDirectory:
+    """Return the process-wide facility directory"""
+    return FacilityDirectory(read_facilities(path))
@@ -0,0 +1,492 @@
+"""Printable PDFs of submitted assessments.
+
+The static part of the paper form -- section titles, headings, labels,
+check boxes, option boxes and answer lines -- is laid out once from the
+form schema and compiled into one compressed content stream per page (see
+``get_template``). Rendering a submission then only writes its answers at
+the positions recorded for each field, so a form costs a few hundred
+text operators. In a merged file the template pages are stored once, as
+form XObjects every page draws, and each page adds only its answers.
+
+Batches (a day's submissions, or a barangay's) are rendered across a
+process pool into one merged PDF or a zip of one PDF per submission:
+
+    python form_pdf.py --date 2026-10-17 --output forms.pdf [--workers 4]
+    python form_pdf.py --barangay Aguso --municipality "Tarlac City" --output aguso.zip
+
+The writer emits plain PDF 1.4 with the standard Helvetica fonts, so no
+PDF library is needed.
+"""
+import argparse
+import collections
+import datetime
+import io
+import multiprocessing
+import os
+import re
+import sys
+import time
+import zipfile
+import zlib
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+import streamlit as st
+
+from form_schema import Action, Field, FormSchema, Markdown, Row, Section, build_schema, get_schema
+from gazetteer import get_gazetteer
+from ncd_risk import score_patient
+from submission_store import DEFAULT_DB_PATH, SubmissionStore
+
+CHUNK_SIZE = 50
+
+# US Letter, in points
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+MARGIN = 36
+LINE = 12
+GAP = 8
+LABEL_SIZE = 7.5
+VALUE_SIZE = 8.5
+TITLE_SIZE = 12
+HEADING_SIZE = 9.5
+BOX = 7
+# Narrowest answer line drawn after a label before the line moves below it
+MIN_ANSWER_WIDTH = 60
+
+# Advance widths of Helvetica for ' ' to '~', per 1000 units of font size
+_HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278, 556, 556, 556, 556, 556, 556, 556,
+    556, 556, 556, 278, 278, 584, 584, 584, 556, 1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833,
+    722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556, 333, 556, 556, 500, 556,
+    556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556, 556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334,
+    260, 334, 584,
+]
+_TAGS = re.compile(r'<[^>]+>')
+_ISO_DATE = re.compile(r'(\d{4})-(\d{2})-(\d{2})$')
+
+# Fields of the NCD risk assessment block, filled from form_data['ncd_assessment']
+NCD_SECTION = 'ncd_assessment'
+NCD_ITEMS = (
+    Row(5, tuple((Field(name, '', label, 'text'),) for name, label in (
+        ('bmi', "BMI:"), ('bmi_category', "Category:"), ('bp_category', "BP:"), ('risk_score', "Risk score:"),
+        ('risk_category', "Risk:")))),
+    Field('risk_factors', '', "Risk factors:", 'text'),
+)
+
+
+def _encode(text: str) -> bytes:
+    # The standard fonts only cover WinAnsi; symbols such as the ballot box are dropped
+    return ' '.join(text.split()).encode('cp1252', 'ignore')
+
+
+def _width(data: bytes, size: float) -> float:
+    return sum(_HELVETICA_WIDTHS[byte - 32] if 32 <= byte <= 126 else 556 for byte in data) * size / 1000
+
+
+def _fit(data: bytes, width: float, size: float) -> bytes:
+    """Cut text that would overrun its answer line, ending it with an ellipsis"""
+    if _width(data, size) <= width:
+        return data
+    while data and _width(data, size) > width - _width(b'\x85', size):
+        data = data[:-1]
+    return data + b'\x85'
+
+
+def _show(x: float, y: float, data: bytes, size: float, bold: bool = False) -> bytes:
+    escaped = data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+    return b'BT /F%d %g Tf %.2f %.2f Td (%s) Tj ET' % (2 if bold else 1, size, x, y, escaped)
+
+
+def _plain(markdown: str) -> str:
+    return ' '.join(_TAGS.sub(' ', markdown).replace('*', '').replace('#', '').split())
+
+
+class Slot(NamedTuple):
+    """Where one answer is written: ``check`` marks a box, ``choice`` one of ``options``, the rest write text"""
+    kind: str
+    x: float
+    y: float
+    width: float = 0
+    options: Optional[Dict[str, Tuple[float, float]]] = None
+
+
+class FormTemplate(NamedTuple):
+    # Compressed content stream of the static drawing of each page
+    pages: List[bytes]
+    # (section, field, slot) of the answers on each page
+    slots: List[List[Tuple[str, str, Slot]]]
+
+
+class _Layout:
+    """Lays the schema out top to bottom, drawing the static parts and recording a slot per field"""
+
+    def __init__(self):
+        self.pages: List[List[bytes]] = []
+        self.slots: List[List[Tuple[str, str, Slot]]] = []
+        self.ops: List[bytes] = []
+        self.found: List[Tuple[str, str, Slot]] = []
+        self.y = 0.0
+
+    def new_page(self):
+        self.ops, self.found = [b'0.5 w 0.35 G'], []
+        self.pages.append(self.ops)
+        self.slots.append(self.found)
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def section(self, section: Section, schema: FormSchema):
+        self.new_page()
+        title = _encode(_plain(section.heading) or section.title.upper())
+        self.ops.append(_show((PAGE_WIDTH - _width(title, TITLE_SIZE)) / 2, self.y - TITLE_SIZE, title, TITLE_SIZE,
+                              bold=True))
+        self.y -= TITLE_SIZE + LINE
+        items = list(section.items)
+        for tab in section.tabs:
+            items += tab.items
+            if tab.with_immunization:
+                items += schema.immunization
+        for index, item in enumerate(items):
+            if isinstance(item, Action) and item.name == NCD_SECTION:
+                for ncd_item in NCD_ITEMS:
+                    self.block(NCD_SECTION, ncd_item)
+                continue
+            # Keep a heading on the same page as what follows it
+            following = items[index + 1] if isinstance(item, Markdown) and index + 1 < len(items) else None
+            self.block(section.key, item, following)
+
+    def block(self, key: str, item, following=None):
+        height = self._measure(key, item) + (self._measure(key, following) if following is not None else 0)
+        if self.y - height < MARGIN:
+            self.new_page()
+        self.y = self._place(key, (item,), MARGIN, PAGE_WIDTH - MARGIN, self.y)
+
+    def _measure(self, key: str, item) -> float:
+        ops, found = self.ops, self.found
+        self.ops, self.found = [], []
+        try:
+            return self.y - self._place(key, (item,), MARGIN, PAGE_WIDTH - MARGIN, self.y)
+        finally:
+            self.ops, self.found = ops, found
+
+    def _place(self, key: str, items, x0: float, x1: float, y: float, details: bool = True) -> float:
+        """Draw items in the column [x0, x1] from ``y`` down and return the y below them"""
+        for item in items:
+            if isinstance(item, Markdown):
+                y = self._markdown(item, x0, y)
+            elif isinstance(item, Row):
+                y = self._row(key, item, x0, x1, y)
+            elif isinstance(item, Field):
+                y = self._field(key, item, x0, x1, y)
+                if details:
+                    y = self._place(key, item.details, x0, x1, y)
+        return y
+
+    def _row(self, key: str, row: Row, x0: float, x1: float, y: float) -> float:
+        widths = [1] * row.widths if isinstance(row.widths, int) else list(row.widths)
+        span = x1 - x0 - GAP * (len(widths) - 1)
+        edges, left = [], x0
+        for width in widths:
+            edges.append((left, left + span * width / sum(widths)))
+            left = edges[-1][1] + GAP
+        bottom = y
+        for (left, right), cell in zip(edges, row.cells):
+            bottom = min(bottom, self._place(key, cell, left, right, y, details=row.details_column is None))
+        if row.details_column is not None:
+            details = [detail for cell in row.cells for item in cell if isinstance(item, Field)
+                       for detail in item.details]
+            bottom = min(bottom, self._place(key, details, *edges[row.details_column], y))
+        return bottom
+
+    def _markdown(self, item: Markdown, x: float, y: float) -> float:
+        text = _plain(item.text)
+        if not text:
+            return y
+        if set(text) == {'_'}:
+            # A signature line
+            self.ops.append(b'%.2f %.2f m %.2f %.2f l S' % (x, y - LINE + 1, x + 100, y - LINE + 1))
+            return y - LINE
+        if item.html or item.text.lstrip().startswith('#'):
+            y -= 4
+            self.ops.append(_show(x, y - HEADING_SIZE, _encode(text), HEADING_SIZE, bold=True))
+            return y - LINE - 2
+        self.ops.append(_show(x, y - 9, _encode(text), LABEL_SIZE, bold='**' in item.text))
+        return y - LINE
+
+    def _field(self, key: str, field: Field, x0: float, x1: float, y: float) -> float:
+        baseline = y - 9
+        label = _encode(field.label)
+        if field.kind == 'checkbox':
+            self.ops.append(b'%.2f %.2f %d %d re S' % (x0, baseline - 1, BOX, BOX))
+            if label:
+                self.ops.append(_show(x0 + BOX + 3, baseline, _fit(label, x1 - x0 - BOX - 3, LABEL_SIZE), LABEL_SIZE))
+            self.found.append((key, field.name, Slot('check', x0 + 1.2, baseline)))
+            return y - LINE
+        x = x0
+        if label:
+            self.ops.append(_show(x0, baseline, _fit(label, x1 - x0, LABEL_SIZE), LABEL_SIZE))
+            x = x0 + _width(label, LABEL_SIZE) + 4
+        if field.kind in ('radio', 'selectbox'):
+            options = {}
+            for option in field.options:
+                text = _encode(option)
+                advance = BOX + 3 + _width(text, LABEL_SIZE) + GAP
+                if x + advance > x1 and x > x0:
+                    baseline -= LINE
+                    x = x0
+                self.ops.append(b'%.2f %.2f %d %d re S' % (x, baseline - 1, BOX, BOX))
+                self.ops.append(_show(x + BOX + 3, baseline, text, LABEL_SIZE))
+                options[option] = (x + 1.2, baseline)
+                x += advance
+            self.found.append((key, field.name, Slot('choice', x0, baseline, options=options)))
+            return baseline - LINE + 9
+        if label and x1 - x < MIN_ANSWER_WIDTH:
+            baseline -= LINE
+            x = x0
+        self.ops.append(b'%.2f %.2f m %.2f %.2f l S' % (x, baseline - 2, x1, baseline - 2))
+        kind = field.kind if field.kind in ('date', 'number') else 'text'
+        self.found.append((key, field.name, Slot(kind, x + 2, baseline, width=x1 - x - 4)))
+        return baseline - LINE + 9
+
+
+def build_template(schema: FormSchema) -> FormTemplate:
+    """Lay out and compile the static pages; use ``get_template`` for the cached copy"""
+    layout = _Layout()
+    for section in schema.sections:
+        layout.section(section, schema)
+    return FormTemplate([zlib.compress(b'\n'.join(ops)) for ops in layout.pages], layout.slots)
+
+
+@st.cache_resource
+def get_template() -> FormTemplate:
+    """Return the process-wide compiled form template"""
+    return build_template(get_schema())
+
+
+def _display(kind: str, value: Any) -> Optional[str]:
+    if value is None or value == '' or isinstance(value, bool):
+        return None
+    if isinstance(value, (list, tuple)):
+        return ', '.join(map(str, value)) or None
+    if kind == 'number' and value == 0:
+        # The widget's default, counted as unanswered by the progress tracker too
+        return None
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else f"{value:g}"
+    if kind == 'date':
+        # Paper forms write dates as MM/DD/YYYY
+        match = _ISO_DATE.match(str(value))
+        if match:
+            return f"{match[2]}/{match[3]}/{match[1]}"
+    return str(value)
+
+
+def form_streams(form_data: Mapping[str, Any], template: FormTemplate) -> List[bytes]:
+    """Compressed content stream per template page: the page's template XObject plus this form's answers"""
+    if not form_data.get(NCD_SECTION):
+        # Imported submissions were never scored in the form
+        form_data = {**form_data, NCD_SECTION: score_patient(form_data)}
+    streams = []
+    for page, slots in enumerate(template.slots):
+        ops = [b'q /T%d Do Q 0 0 0.55 rg' % page]
+        for section, name, slot in slots:
+            value = form_data.get(section, {}).get(name)
+            if slot.kind == 'check':
+                if value is True:
+                    ops.append(_show(slot.x, slot.y, b'X', VALUE_SIZE, bold=True))
+            elif slot.kind == 'choice':
+                if value in slot.options:
+                    ops.append(_show(*slot.options[value], b'X', VALUE_SIZE, bold=True))
+            else:
+                text = _display(slot.kind, value)
+                if text:
+                    ops.append(_show(slot.x, slot.y, _fit(_encode(text), slot.width, VALUE_SIZE), VALUE_SIZE))
+        streams.append(zlib.compress(b'\n'.join(ops)))
+    return streams
+
+
+class PdfWriter:
+    """Writes PDF objects straight to a binary file, keeping only their offsets for the cross-reference table"""
+
+    def __init__(self, output: BinaryIO):
+        self._output = output
+        self._offsets: Dict[int, int] = {}
+        self._position = 0
+        self._count = 0
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data: bytes):
+        self._output.write(data)
+        self._position += len(data)
+
+    def reserve(self) -> int:
+        """Number an object to be written later, e.g. one that refers to objects not written yet"""
+        self._count += 1
+        return self._count
+
+    def add(self, body: bytes, number: Optional[int] = None) -> int:
+        number = number or self.reserve()
+        self._offsets[number] = self._position
+        self._write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+        return number
+
+    def add_stream(self, compressed: bytes, entries: bytes = b'') -> int:
+        return self.add(b'<< /Length %d /Filter /FlateDecode%s >>\nstream\n%s\nendstream'
+                        % (len(compressed), entries, compressed))
+
+    def close(self, root: int):
+        xref = self._position
+        entries = b''.join(b'%010d 00000 n \n' % self._offsets[number] for number in range(1, self._count + 1))
+        self._write(b'xref\n0 %d\n0000000000 65535 f \n%strailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                    % (self._count + 1, entries, self._count + 1, root, xref))
+
+
+class FormPdf:
+    """A PDF of any number of forms that share one copy of the template pages"""
+
+    def __init__(self, output: BinaryIO, template: FormTemplate):
+        self._writer = PdfWriter(output)
+        self._pages = self._writer.reserve()
+        self._kids: List[int] = []
+        fonts = b'/Font << /F1 %d 0 R /F2 %d 0 R >>' % tuple(
+            self._writer.add(b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % name)
+            for name in (b'Helvetica', b'Helvetica-Bold'))
+        pages = [self._writer.add_stream(page, b' /Type /XObject /Subtype /Form /BBox [0 0 %d %d] /Resources << %s >>'
+                                         % (PAGE_WIDTH, PAGE_HEIGHT, fonts)) for page in template.pages]
+        self._resources = self._writer.add(b'<< %s /XObject << %s >> >>' % (
+            fonts, b' '.join(b'/T%d %d 0 R' % (index, number) for index, number in enumerate(pages))))
+
+    def add_form(self, streams: List[bytes]):
+        """Add one form's pages, as returned by ``form_streams``"""
+        for stream in streams:
+            contents = self._writer.add_stream(stream)
+            self._kids.append(self._writer.add(b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources %d 0 R '
+                                               b'/Contents %d 0 R >>' % (self._pages, PAGE_WIDTH, PAGE_HEIGHT,
+                                                                         self._resources, contents)))
+
+    def close(self) -> int:
+        """Finish the file and return its page count"""
+        self._writer.add(b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % kid for kid in self._kids), len(self._kids)), self._pages)
+        self._writer.close(self._writer.add(b'<< /Type /Catalog /Pages %d 0 R >>' % self._pages))
+        return len(self._kids)
+
+
+def render_pdf(form_data: Mapping[str, Any], template: Optional[FormTemplate] = None) -> bytes:
+    """A printable PDF of one submission"""
+    template = template or get_template()
+    output = io.BytesIO()
+    pdf = FormPdf(output, template)
+    pdf.add_form(form_streams(form_data, template))
+    pdf.close()
+    return output.getvalue()
+
+
+def pdf_filename(record: Mapping[str, Any]) -> str:
+    last_name = record['form_data'].get('general_info', {}).get('last_name') or ''
+    return '_'.join(filter(None, ['konsulta', str(record['id']), re.sub(r'[^A-Za-z0-9]+', '', last_name)])) + '.pdf'
+
+
+_template: Optional[FormTemplate] = None
+
+
+def _init_worker():
+    global _template
+    _template = build_template(build_schema())
+
+
+def render_chunk(task: Tuple[bool, List[Dict[str, Any]]]) -> list:
+    """Per record, its page streams for a merged file, or its (file name, PDF) for a zip"""
+    as_files, records = task
+    if as_files:
+        return [(pdf_filename(record), render_pdf(record['form_data'], _template)) for record in records]
+    return [form_streams(record['form_data'], _template) for record in records]
+
+
+def _rendered_chunks(chunks: Iterable[List[Dict[str, Any]]], as_files: bool, workers: int) -> Iterator[list]:
+    if workers <= 1:
+        _init_worker()
+        yield from (render_chunk((as_files, chunk)) for chunk in chunks)
+        return
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers, initializer=_init_worker) as pool:
+        # A few chunks in flight per worker keeps memory flat and the output in submission order
+        in_flight: collections.deque = collections.deque()
+        for chunk in chunks:
+            in_flight.append(pool.apply_async(render_chunk, ((as_files, chunk),)))
+            if len(in_flight) >= workers * 2:
+                yield in_flight.popleft().get()
+        while in_flight:
+            yield in_flight.popleft().get()
+
+
+def render_batch(chunks: Iterable[List[Dict[str, Any]]], output_path: str,
+                 workers: int = os.cpu_count() or 1) -> Dict[str, Any]:
+    """Render stored submissions into one merged PDF, or a zip of PDFs when ``output_path`` ends in .zip"""
+    started = time.perf_counter()
+    as_files = output_path.lower().endswith('.zip')
+    # Records are small to pickle; fewer, larger tasks amortise the round trips to the pool
+    chunks = (chunk[start:start + CHUNK_SIZE] for chunk in chunks for start in range(0, len(chunk), CHUNK_SIZE))
+    counts = {'forms': 0, 'pages': 0}
+    with open(output_path, 'wb') as f:
+        if as_files:
+            # The PDFs are compressed already
+            with zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED) as archive:
+                for rendered in _rendered_chunks(chunks, True, workers):
+                    for name, data in rendered:
+                        archive.writestr(name, data)
+                    counts['forms'] += len(rendered)
+            counts['pages'] = counts['forms'] * len(get_template().pages)
+        else:
+            pdf = FormPdf(f, get_template())
+            for rendered in _rendered_chunks(chunks, False, workers):
+                for streams in rendered:
+                    pdf.add_form(streams)
+                counts['forms'] += len(rendered)
+            counts['pages'] = pdf.close()
+    counts['bytes'] = os.path.getsize(output_path)
+    counts['seconds'] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+def select_records(store: SubmissionStore, date: Optional[str] = None, barangay: Optional[str] = None,
+                   municipality: Optional[str] = None) -> Iterator[List[Dict[str, Any]]]:
+    """Chunks of the submissions stored on ``date`` and/or registered in a barangay, oldest first"""
+    since = until = None
+    if date:
+        day = datetime.date.fromisoformat(date)
+        since, until = day.isoformat(), (day + datetime.timedelta(days=1)).isoformat()
+    place = address = None
+    if barangay:
+        # Stored addresses carry gazetteer codes, so any spelling of a known barangay finds all of its forms
+        gazetteer = get_gazetteer()
+        barangay_code = gazetteer.barangay_code(municipality, barangay)
+        if barangay_code:
+            place = (gazetteer.municipality_code(municipality), barangay_code)
+        else:
+            address = (barangay, municipality or '')
+    yield from store.iter_chunks(1000, since=since, until=until, place=place, address=address)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render stored submissions as printable Konsulta forms.")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH)
+    parser.add_argument('--date', help="submissions stored on this ISO date")
+    parser.add_argument('--barangay', help="submissions from this barangay (with --municipality)")
+    parser.add_argument('--municipality')
+    parser.add_argument('--output', required=True, help="merged .pdf, or .zip of one PDF per submission")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    if not args.date and not args.barangay:
+        parser.error("give --date, --barangay or both")
+    if args.barangay and not args.municipality:
+        parser.error("--barangay needs --municipality")
+
+    store = SubmissionStore(args.db)
+    counts = render_batch(select_records(store, args.date, args.barangay, args.municipality), args.output, args.workers)
+    store.close()
+    print(f"{counts['forms']} forms, {counts['pages']} pages in {counts['seconds']} s "
+          f"({counts['forms'] / max(counts['seconds'], 1e-9):.0f}/s): {args.output}, {counts['bytes'] / 2 ** 20:.1f} MiB")
+    if not counts['forms']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Compact per-session storage for the schema-backed form sections.
+
+A plain ``form_data`` section is a dict with one entry per rendered field,
+which for the Health Assessment section means well over a hundred entries
+per session, most of them checkbox booleans. ``SectionRecord`` keeps the
+same mapping interface but stores checkbox fields as bits of two ints
+(present and ticked) and every other schema field in a fixed slot list.
+Names outside the schema, and non-boolean values assigned to a checkbox,
+go to a small overflow dict that is only created when needed.
+
+The name -> bit/slot layout is built once per process from the form schema
+(see ``get_layouts``). Records are not dicts, so serialise them with
+``plain_form_data`` or ``json.dumps(..., default=dict)``.
+"""
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Optional
+
+import streamlit as st
+
+from form_schema import FormSchema, Section, get_schema
+
+# Every form_data section, including those the schema does not render yet
+SECTION_KEYS = ['general_info', 'medical_history', 'social_history', 'immunization', 'physical_exam',
+                'ncd_assessment']
+
+_MISSING = object()
+
+
+class RecordLayout:
+    """Bit and slot positions of one section's schema fields"""
+
+    __slots__ = ('key', 'bits', 'slots', 'order')
+
+    def __init__(self, section: Section):
+        self.key = section.key
+        self.bits: Dict[str, int] = {}
+        self.slots: Dict[str, int] = {}
+        for name, field in section.fields.items():
+            if field.kind == 'checkbox':
+                self.bits[name] = 1 << len(self.bits)
+            else:
+                self.slots[name] = len(self.slots)
+        self.order = tuple(section.fields)
+
+
+class SectionRecord(MutableMapping):
+    """Mapping of one form section backed by bitsets and a slot list"""
+
+    __slots__ = ('_layout', '_values', '_present', '_checked', '_extra')
+
+    def __init__(self, layout: RecordLayout, values: Optional[Dict[str, Any]] = None):
+        self._layout = layout
+        self._values = [_MISSING] * len(layout.slots)
+        self._present = 0
+        self._checked = 0
+        self._extra: Optional[Dict[str, Any]] = None
+        if values:
+            self.update(values)
+
+    def __getitem__(self, name: str) -> Any:
+        bit = self._layout.bits.get(name)
+        if bit is not None and self._present & bit:
+            return bool(self._checked & bit)
+        slot = self._layout.slots.get(name)
+        if slot is not None and self._values[slot] is not _MISSING:
+            return self._values[slot]
+        if self._extra is not None and name in self._extra:
+            return self._extra[name]
+        raise KeyError(name)
+
+    def __setitem__(self, name: str, value: Any):
+        bit = self._layout.bits.get(name)
+        if bit is not None and (value is True or value is False):
+            self._present |= bit
+            self._checked = self._checked | bit if value else self._checked & ~bit
+            if self._extra:
+                self._extra.pop(name, None)
+            return
+        slot = self._layout.slots.get(name)
+        if slot is not None:
+            self._values[slot] = value
+            return
+        if bit is not None:
+            self._present &= ~bit
+        if self._extra is None:
+            self._extra = {}
+        self._extra[name] = value
+
+    def __delitem__(self, name: str):
+        bit = self._layout.bits.get(name)
+        if bit is not None and self._present & bit:
+            self._present &= ~bit
+            self._checked &= ~bit
+            return
+        slot = self._layout.slots.get(name)
+        if slot is not None and self._values[slot] is not _MISSING:
+            self._values[slot] = _MISSING
+            return
+        if self._extra is not None and name in self._extra:
+            del self._extra[name]
+            return
+        raise KeyError(name)
+
+    def __contains__(self, name: object) -> bool:
+        bit = self._layout.bits.get(name)
+        if bit is not None and self._present & bit:
+            return True
+        slot = self._layout.slots.get(name)
+        if slot is not None and self._values[slot] is not _MISSING:
+            return True
+        return self._extra is not None and name in self._extra
+
+    def get(self, name: str, default: Any = None) -> Any:
+        # Inlined __getitem__: this is the hot path of rendering and progress
+        bit = self._layout.bits.get(name)
+        if bit is not None and self._present & bit:
+            return bool(self._checked & bit)
+        slot = self._layout.slots.get(name)
+        if slot is not None and self._values[slot] is not _MISSING:
+            return self._values[slot]
+        if self._extra is not None:
+            return self._extra.get(name, default)
+        return default
+
+    def __iter__(self) -> Iterator[str]:
+        for name in self._layout.order:
+            if name in self:
+                yield name
+        if self._extra:
+            yield from list(self._extra)
+
+    def __len__(self) -> int:
+        filled = sum(value is not _MISSING for value in self._values)
+        return bin(self._present).count('1') + filled + (len(self._extra) if self._extra else 0)
+
+    def __repr__(self) -> str:
+        return f"SectionRecord({dict(self)!r})"
+
+    def __reduce__(self):
+        return _restore_record, (self._layout.key, dict(self))
+
+
+def _restore_record(section_key: str, values: Dict[str, Any]):
+    """Unpickle a record against this process's layout of its section"""
+    layout = get_layouts().get(section_key)
+    return SectionRecord(layout, values) if layout is not None else values
+
+
+@st.cache_resource
+def get_layouts() -> Dict[str, RecordLayout]:
+    """Return the process-wide record layout of every schema section"""
+    return build_layouts(get_schema())
+
+
+def build_layouts(schema: FormSchema) -> Dict[str, RecordLayout]:
+    return {section.key: RecordLayout(section) for section in schema.sections}
+
+
+def new_form_data() -> Dict[str, MutableMapping]:
+    """An empty form: compact records for schema sections, dicts for the rest"""
+    layouts = get_layouts()
+    return {key: SectionRecord(layouts[key]) if key in layouts else {} for key in SECTION_KEYS}
+
+
+def plain_form_data(form_data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Copy of form_data with every section as a plain dict"""
+    return {key: dict(section) for key, section in form_data.items()}
@@ -0,0 +1,438 @@
+"""Declarative layout of the Konsulta health assessment form.
+
+The schema is built once per process (see ``get_schema``) and shared by the
+renderer, the progress calculator and the validators, so a rerun never has to
+rebuild condition tables or slug widget keys again.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple, Union
+
+import streamlit as st
+
+
+@dataclass(frozen=True)
+class Markdown:
+    """Static text rendered with ``st.markdown``"""
+    text: str
+    html: bool = False
+
+
+@dataclass(frozen=True)
+class Field:
+    """A single widget bound to ``form_data[section][name]``"""
+    name: str
+    widget_key: str
+    label: str
+    kind: str
+    required: bool = False
+    options: Tuple[str, ...] = ()
+    params: Dict[str, Any] = field(default_factory=dict)
+    details: Tuple['Field', ...] = ()
+    show_details_when: Any = True
+    # "None of the above" checkbox whose tick answers this checkbox when it is left unticked
+    answered_by: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class Row:
+    """A row of ``st.columns``; each cell holds markdown and fields"""
+    widths: Union[int, Tuple[int, ...]]
+    cells: Tuple[Tuple[Union[Markdown, Field], ...], ...]
+    # Column that receives detail fields of a toggled field; None renders
+    # them full width below the row.
+    details_column: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class Action:
+    """A named hook the renderer fills in, e.g. the returning-patient prompt"""
+    name: str
+
+
+Item = Union[Markdown, Field, Row, Action]
+
+
+@dataclass(frozen=True)
+class Tab:
+    title: str
+    items: Tuple[Item, ...]
+    with_immunization: bool = False
+
+
+@dataclass(frozen=True)
+class Section:
+    key: str
+    title: str
+    heading: str
+    items: Tuple[Item, ...] = ()
+    tabs: Tuple[Tab, ...] = ()
+    fields: Dict[str, Field] = field(default_factory=dict)
+    required: Tuple[Field, ...] = ()
+    # Maps each required field, its detail sub-fields and its "none of the
+    # above" checkbox to the required fields whose progress they affect.
+    progress_owner: Dict[str, Tuple[Field, ...]] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class FormSchema:
+    sections: Tuple[Section, ...]
+    immunization: Tuple[Item, ...]
+
+    def section(self, key: str) -> Optional[Section]:
+        for section in self.sections:
+            if section.key == key:
+                return section
+        return None
+
+
+def slugify(text: str) -> str:
+    """Turn a display label into the form_data key fragment used by the app"""
+    return text.lower().replace(' ', '_').replace('/', '_').replace('-', '_')
+
+
+PAST_CONDITIONS = {
+    'Allergy': True,
+    'Asthma': False,
+    'Cancer': True,
+    'Cerebrovascular Disease': False,
+    'Coronary Artery Disease': False,
+    'Diabetes Mellitus': False,
+    'Emphysema': False,
+    'Epilepsy / Seizure Disorder': False,
+    'Hepatitis': True,
+    'Hyperlipidemia': False,
+    'Hypertension': True,
+    'Peptic Ulcer': False,
+    'Pneumonia': False,
+    'Thyroid Disease': False,
+    'PTB': True,
+    'Urinary Tract Infection': False,
+    'Mental Illnesses': False,
+    'Others': True
+}
+
+FAMILY_CONDITIONS = {
+    'Allergy': True,
+    'Asthma': False,
+    'Cancer': True,
+    'Cerebrovascular Disease': False,
+    'Coronary Artery Disease': False,
+    'Diabetes Mellitus': True,
+    'Emphysema': False,
+    'Epilepsy / Seizure Disorder': False,
+    'Hepatitis': True,
+    'Hyperlipidemia': False,
+    'Hypertension': True,
+    'Peptic Ulcer': False,
+    'Pneumonia': False,
+    'Thyroid Disease': False,
+    'PTB': True,
+    'Urinary Tract Infection': False,
+    'Mental Illnesses': False,
+    'Other': True
+}
+
+SOCIAL_ITEMS = ['Smoking', 'Alcohol', 'Illicit Drugs', 'Sexually Active']
+
+PEDIA_MEASUREMENTS = [
+    "Body Length", "Head Circumference", "Chest Circumference",
+    "Abdominal Circumference", "Hip Circumference",
+    "Mid-Upper Arm Circumference", "Limbs Circumference"
+]
+
+BLOOD_TYPES = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+
+# (label, form_data key) per column of the immunization block
+IMMUNIZATION_CHILDREN = [
+    [("BCG", 'bcg'), ("DPT1", 'dpt1'), ("Hepa1", 'hepa1')],
+    [("OPV1", 'opv1'), ("DPT2", 'dpt2'), ("Hepa2", 'hepa2')],
+    [("OPV2", 'opv2'), ("DPT3", 'dpt3'), ("Hepa3", 'hepa3')],
+    [("OPV3", 'opv3'), ("Measles", 'measles'), ("Varicella", 'varicella')],
+]
+IMMUNIZATION_ADULT = [("HPV", 'hpv'), ("MMR", 'mmr'), ("None", 'none')]
+IMMUNIZATION_ELDERLY = [("Pneumococcal Vaccine", 'pneumococcal'), ("Flu Vaccine", 'flu')]
+
+
+def _text(key, name, label, required=False, **params) -> Field:
+    return Field(name, f"{key}_{name}", label, 'text', required=required, params=params)
+
+
+def _facility(key, name, label, required=False) -> Field:
+    return Field(name, f"{key}_{name}", label, 'facility', required=required)
+
+
+def _place(key, name, label, required=False) -> Field:
+    return Field(name, f"{key}_{name}", label, 'place', required=required)
+
+
+def _number(key, name, label, required=False, **params) -> Field:
+    return Field(name, f"{key}_{name}", label, 'number', required=required, params=params)
+
+
+def _date(key, name, label, required=False) -> Field:
+    return Field(name, f"{key}_{name}", label, 'date', required=required)
+
+
+def _radio(key, name, label, options, required=False, **params) -> Field:
+    return Field(name, f"{key}_{name}", label, 'radio', required=required, options=tuple(options), params=params)
+
+
+def _checkbox(key, name, label, required=False) -> Field:
+    return Field(name, f"{key}_{name}", label, 'checkbox', required=required)
+
+
+def _condition_rows(conditions, name_prefix, widget_prefix, special, required, none_name=None):
+    """Checkbox rows for a condition table with their conditional sub-fields
+
+    With ``none_name`` the table ends in a "none of the above" checkbox, and
+    an unticked condition only counts as answered once that is ticked.
+    """
+    rows = []
+    for condition, needs_specify in conditions.items():
+        name = f"{name_prefix}{slugify(condition)}" if name_prefix else slugify(condition)
+        widget_key = f"{widget_prefix}{name}"
+        details = ()
+        if needs_specify:
+            suffix, label = special.get(condition, ('specify', "Specify:"))
+            details = (Field(f"{name}_{suffix}", f"{widget_key}_{suffix}", label, 'text'),)
+        checkbox = Field(name, widget_key, condition, 'checkbox', required=required, details=details,
+                         answered_by=none_name)
+        rows.append(Row((1, 3), ((checkbox,), ()), details_column=1))
+    if none_name:
+        rows.append(Field(none_name, f"{widget_prefix}{none_name}", "None of the above (or none besides those ticked)",
+                          'checkbox'))
+    return rows
+
+
+def _general_info_section() -> Section:
+    key = 'general_info'
+    items = [
+        Markdown("**FULL NAME**"),
+        Row((1, 1, 1), (
+            (_text(key, 'last_name', "LAST", required=True),),
+            (_text(key, 'first_name', "FIRST", required=True),),
+            (_text(key, 'middle_name', "MIDDLE", required=True),),
+        )),
+        Row((1, 2, 2), (
+            (Markdown("**AGE**"),
+             _number(key, 'age', "", required=True, min_value=0, max_value=150)),
+            (Markdown("**SEX**"),
+             _radio(key, 'sex', "", ['F', 'M'], required=True, horizontal=True, index=None)),
+            (Markdown("**BIRTHDATE** (MM/DD/YYYY)"), _date(key, 'birthdate', "", required=True)),
+        )),
+        Markdown("**ADDRESS**"),
+        Row((1, 1, 1), (
+            (_place(key, 'purok', "PUROK", required=True),),
+            (_place(key, 'barangay', "BARANGAY", required=True),),
+            (_place(key, 'municipality', "MUNICIPALITY", required=True),),
+        )),
+        Row((1, 1), (
+            (_text(key, 'contact', "CONTACT #", required=True),),
+            (_text(key, 'email', "E-MAIL", required=True),),
+        )),
+        _text(key, 'philhealth_pin', "PHILHEALTH PIN", required=True),
+        Action('returning_patient'),
+        Row((2, 2, 1), (
+            (Markdown("**MEMBER TYPE**"),
+             _radio(key, 'member_type', "", ['MEMBER', 'DEPENDENT'], required=True,
+                    horizontal=True, index=None),
+             _text(key, 'member_specify', "Specify:")),
+            (Markdown("**REGISTRATION DATE** (MM/DD/YYYY)"),
+             _date(key, 'registration_date', "", required=True)),
+            (Markdown("**KPP SIGN**"), Markdown("________")),
+        )),
+        Markdown("""
+                    <div style='background-color: white; padding: 5px;'>
+                        <h4>KONSULTA REGISTRATION</h4>
+                    </div>
+                """, html=True),
+        Markdown("**PREFERRED FACILITY AND ADDRESS**"),
+    ]
+    for i in range(1, 4):
+        items.append(Row((4, 1), (
+            (_facility(key, f'facility_choice{i}', f"CHOICE {i}:", required=True),),
+            (_checkbox(key, f'choice{i}_check', ""),),
+        )))
+    items += [
+        Markdown("**AUTHORIZATION TRANSACTION**"),
+        Row((1, 2, 2), (
+            (_checkbox(key, 'atc', "AT CODE:"),),
+            (Markdown("**DATE OF APPOINTMENT**"), _date(key, 'appointment_date', "", required=True)),
+            (_checkbox(key, 'face_capture', "If no ATC, ☐ FACE CAPTURE"),),
+        )),
+    ]
+    return _finish_section(key, "General Data and Konsulta Registration", tuple(items), (),
+                           heading="<h3 style='text-align: center;'>GENERAL DATA AND KONSULTA REGISTRATION</h3>")
+
+
+def _medical_history_section() -> Section:
+    key = 'medical_history'
+
+    past = [Markdown("##### PAST MEDICAL HISTORY")]
+    past += _condition_rows(PAST_CONDITIONS, 'past_', 'past_med_',
+                            {'Hypertension': ('bp', "Highest BP (mmHg):"),
+                             'PTB': ('extra', "Specify Extra PTB:")}, required=True,
+                            none_name='no_past_conditions')
+    past += [
+        Markdown("**Past Surgery/ies Done:**"),
+        Row((1, 1), (
+            (_text(key, 'surgeries', "Surgery:"),),
+            (_text(key, 'surgery_date', "Date Done:"),),
+        )),
+    ]
+
+    family = [Markdown("##### FAMILY HISTORY")]
+    family += _condition_rows(FAMILY_CONDITIONS, 'fam_', 'family_hist_',
+                              {'Diabetes Mellitus': ('fbs', "If yes, perform FBS:"),
+                               'Hypertension': ('bp', "Highest BP (mmHg):")}, required=True,
+                              none_name='no_family_conditions')
+
+    social = [Markdown("##### PERSONAL/SOCIAL HISTORY")]
+    social_details = {
+        'Smoking': (_text(key, 'pack_years', "No. of pack-years:"),),
+        'Alcohol': (_text(key, 'alcohol_servings', "No. of servings/day:"),),
+    }
+    for item in SOCIAL_ITEMS:
+        status = Field(f"{slugify(item)}_status", f"{key}_{slugify(item)}_status", f"{item} Status", 'radio',
+                       required=True, options=('Yes', 'No', 'Quit'), params={'horizontal': True, 'index': None},
+                       details=social_details.get(item, ()), show_details_when='Yes')
+        social.append(Row((2, 2, 1), ((Markdown(f"**{item}**"),), (status,), ())))
+
+    planning = [
+        Markdown("##### FAMILY PLANNING"),
+        _checkbox(key, 'fp_counseling', "With access to family planning counseling"),
+        Row(2, (
+            (_text(key, 'fp_provider', "Provider:"),),
+            (_text(key, 'birth_control', "Birth Control Method used:"),),
+        )),
+    ]
+
+    menstrual = [
+        Markdown("##### MENSTRUAL HISTORY"),
+        Row(2, (
+            (_number(key, 'menarche', "Menarche (years old):", min_value=0, max_value=100),),
+            (_number(key, 'sexual_onset', "Onset of sexual intercourse (years old):", min_value=0, max_value=100),),
+        )),
+        Row(2, (
+            (_date(key, 'last_period', "Last Menstrual Period:"),),
+            (_number(key, 'period_duration', "Period Duration (days):", min_value=0, max_value=30),),
+        )),
+        Row(2, (
+            (_number(key, 'interval_cycle', "Interval cycle (days):", min_value=0, max_value=100),),
+            (_radio(key, 'menopause', "Menopause:", ["Yes", "No"], horizontal=True),),
+        )),
+    ]
+
+    pregnancy = [
+        Markdown("##### PREGNANCY HISTORY"),
+        _text(key, 'pregnancy_history', "G___ P___ A___ L___",
+              help="G=Gravida, P=Para, A=Abortion, L=Living children"),
+        Row(2, (
+            (_text(key, 'delivery_type', "Type of Delivery:"),),
+            (_radio(key, 'induced_htn', "Pregnancy Induced Hypertension:", ["Yes", "No"], horizontal=True),),
+        )),
+    ]
+
+    physical = [
+        Markdown("##### PERTINENT PHYSICAL EXAMINATION FINDINGS"),
+        Markdown("**Vital Signs**"),
+        Row(4, (
+            (_number(key, 'height', "Height (cm):", required=True, min_value=0.0),),
+            (_number(key, 'weight', "Weight (kg):", required=True, min_value=0.0),),
+            (_text(key, 'bp', "BP (mmHg):", required=True),),
+            (_number(key, 'temp', "Temp (°C):", required=True, min_value=35.0, max_value=42.0),),
+        )),
+        Row(2, (
+            (_number(key, 'rr', "RR (cpm):", required=True, min_value=0),),
+            (Markdown("**Blood Type**"),
+             Field('blood_type', f"{key}_blood_type", "", 'selectbox', required=True, options=tuple(BLOOD_TYPES),
+                   params={'index': None})),
+        )),
+        Markdown("**Visual Acuity**"),
+        Row(2, (
+            (_text(key, 'right_eye', "Right Eye:"),),
+            (_text(key, 'left_eye', "Left Eye:"),),
+        )),
+        Markdown("**NCD Risk Assessment**"),
+        Action('ncd_assessment'),
+    ]
+
+    pedia = [Markdown("##### PEDIA CLIENT AGED 0-24 MOS")]
+    for measurement in PEDIA_MEASUREMENTS:
+        pedia.append(Row((3, 1), (
+            (_number(key, slugify(measurement), f"{measurement} (cm):", min_value=0.0),),
+            (),
+        )))
+    pedia += _condition_rows(PAST_CONDITIONS, '', f"{key}_",
+                             {'Hypertension': ('bp', "Highest BP (mmHg):"),
+                              'PTB': ('extra', "Specify Extra PTB:")}, required=False)
+
+    tabs = (
+        Tab("Medical History", tuple(past)),
+        Tab("Family History", tuple(family)),
+        Tab("Social History", tuple(social)),
+        Tab("Family Planning", tuple(planning), with_immunization=True),
+        Tab("Menstrual History", tuple(menstrual)),
+        Tab("Pregnancy History", tuple(pregnancy)),
+        Tab("Physical Examination", tuple(physical)),
+        Tab("Pediatric Assessment", tuple(pedia)),
+    )
+    return _finish_section(key, "Health Assessment Tool", (), tabs,
+                           heading="<h3 style='text-align: center;'>HEALTH ASSESSMENT TOOL</h3>")
+
+
+def _immunization_items(key: str) -> Tuple[Item, ...]:
+    return (
+        Markdown("##### IMMUNIZATION"),
+        Markdown("**Children**"),
+        Row(4, tuple(tuple(_checkbox(key, name, label) for label, name in column)
+                     for column in IMMUNIZATION_CHILDREN)),
+        Markdown("**Adult**"),
+        Row(3, tuple((_checkbox(key, name, label),) for label, name in IMMUNIZATION_ADULT)),
+        Markdown("**Elderly and Immunocompromised**"),
+        Row(2, tuple((_checkbox(key, name, label),) for label, name in IMMUNIZATION_ELDERLY)),
+        _text(key, 'immunization_others', "Others:"),
+    )
+
+
+def iter_fields(items):
+    """Yield every field (including detail sub-fields) in a list of items"""
+    for item in items:
+        if isinstance(item, Row):
+            for cell in item.cells:
+                yield from iter_fields(cell)
+        elif isinstance(item, Field):
+            yield item
+            yield from item.details
+
+
+def _finish_section(key, title, items, tabs, heading='') -> Section:
+    all_items = list(items)
+    for tab in tabs:
+        all_items += tab.items
+        if tab.with_immunization:
+            all_items += _immunization_items(key)
+    fields = {f.name: f for f in iter_fields(all_items)}
+    required = tuple(f for f in fields.values() if f.required)
+    progress_owner: Dict[str, Tuple[Field, ...]] = {}
+    for f in required:
+        progress_owner[f.name] = (f,)
+        if f.kind == 'checkbox':
+            progress_owner.update((detail.name, (f,)) for detail in f.details)
+            if f.answered_by:
+                progress_owner[f.answered_by] = progress_owner.get(f.answered_by, ()) + (f,)
+    return Section(key, title, heading, items, tabs, fields, required, progress_owner)
+
+
+def build_schema() -> FormSchema:
+    """Build the full form schema; use ``get_schema`` for the cached copy"""
+    return FormSchema(
+        sections=(_general_info_section(), _medical_history_section()),
+        immunization=_immunization_items('medical_history'),
+    )
+
+
+@st.cache_resource
+def get_schema() -> FormSchema:
+    """Return the process-wide form schema"""
+    return build_schema()
@@ -0,0 +1,175 @@
+"""Municipality -> barangay -> purok gazetteer for the address block.
+
+The gazetteer is read from a local CSV once per process (see
+``get_gazetteer``) with one row per purok, or per barangay when its puroks
+are not listed::
+
+    municipality_code,municipality,barangay_code,barangay,purok[,province]
+
+Codes are the PSGC codes of the municipality and barangay. Puroks have no
+official code, so their canonical id is ``<barangay_code>-<purok key>``.
+Names repeat across provinces (San Jose, Santa Cruz, ...): places whose
+names share a key are labelled with their province (the optional column,
+or the province part of the PSGC code), or a barangay with its code, and
+only the labelled name resolves to a code.
+Names are interned and children are kept as tuples. Every spelling variant
+resolves through precomputed dictionaries keyed by ``place_key``, so
+canonicalising an address on submit is three dictionary lookups.
+"""
+import collections
+import csv
+import os
+import re
+import sys
+import unicodedata
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import streamlit as st
+
+DEFAULT_GAZETTEER_PATH = os.environ.get('KONSULTA_GAZETTEER_PATH', 'gazetteer.csv')
+
+# General Data keys filled in by ``canonicalize``, next to the name fields
+CODE_FIELDS = ['municipality_code', 'barangay_code', 'purok_code']
+
+# Address fields cleared when the place above them changes
+PLACE_CHILDREN = {'municipality': ('barangay', 'purok'), 'barangay': ('purok',), 'purok': ()}
+
+# Words dropped from keys and abbreviations expanded, so "Brgy. Sto. Niño
+# (Pob.)" and "Santo Nino Poblacion" share a key. "City" is kept: "San Jose"
+# and "San Jose City" are different places, while "City of San Fernando"
+# and "San Fernando City" share a key.
+_NOISE = {'barangay', 'brgy', 'bgy', 'brg', 'municipality', 'of', 'purok', 'prk', 'sitio'}
+_EXPAND = {'sto': 'santo', 'sta': 'santa', 'sn': 'san', 'pob': 'poblacion', 'ext': 'extension', 'st': 'saint'}
+_ROMAN = {'i': '1', 'ii': '2', 'iii': '3', 'iv': '4', 'v': '5', 'vi': '6', 'vii': '7', 'viii': '8', 'ix': '9',
+          'x': '10'}
+_WORD = re.compile(r'[0-9a-z]+')
+
+
+def place_key(name: Optional[str]) -> str:
+    """Spelling-insensitive lookup key for a place name"""
+    if not name:
+        return ''
+    ascii_name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii').lower()
+    words = []
+    for word in _WORD.findall(ascii_name):
+        if word in _NOISE:
+            continue
+        words.append(_ROMAN.get(word) or _EXPAND.get(word, word))
+    if len(words) > 1 and words[0] == 'city':
+        words.append(words.pop(0))
+    return ' '.join(words)
+
+
+def _labels(names: Dict[str, str], qualifier: Callable[[str], str]) -> Tuple[Dict[str, str], Dict[str, Optional[str]]]:
+    """Display label and lookup key per code; names that share a key get a qualifier and the shared key no code"""
+    codes_by_key: Dict[str, List[str]] = collections.defaultdict(list)
+    for code, name in names.items():
+        codes_by_key[place_key(name)].append(code)
+    labels: Dict[str, str] = {}
+    lookup: Dict[str, Optional[str]] = {}
+    qualified: Dict[str, str] = {}
+    for key, codes in codes_by_key.items():
+        if len(codes) == 1:
+            labels[codes[0]] = names[codes[0]]
+            lookup[key] = codes[0]
+            continue
+        lookup[key] = None
+        for code in codes:
+            labels[code] = qualified[code] = sys.intern(f"{names[code]} ({qualifier(code)})")
+    for code, label in qualified.items():
+        key = place_key(label)
+        # A qualified label can still clash, e.g. with another place named "San Jose Tarlac"
+        lookup[key] = code if lookup.setdefault(key, code) == code else None
+    return labels, lookup
+
+
+class Gazetteer:
+    """Read-only place hierarchy with canonical names and codes"""
+
+    def __init__(self, rows: List[Dict[str, str]]):
+        municipalities: Dict[str, str] = {}
+        provinces: Dict[str, str] = {}
+        barangays: Dict[str, Dict[str, str]] = {}
+        puroks: Dict[str, Dict[str, str]] = {}
+        for row in rows:
+            municipality_code = (row.get('municipality_code') or '').strip()
+            barangay_code = (row.get('barangay_code') or '').strip()
+            if not municipality_code or not barangay_code:
+                continue
+            municipalities.setdefault(municipality_code, sys.intern(row['municipality'].strip()))
+            # The PSGC code without its municipality and barangay digits identifies the province
+            provinces.setdefault(municipality_code, (row.get('province') or '').strip() or municipality_code[:-5])
+            barangays.setdefault(municipality_code, {}).setdefault(barangay_code,
+                                                                   sys.intern(row['barangay'].strip()))
+            purok = (row.get('purok') or '').strip()
+            if purok:
+                puroks.setdefault(barangay_code, {}).setdefault(place_key(purok), sys.intern(purok))
+
+        def by_name(names: Dict[str, str]) -> Tuple[str, ...]:
+            return tuple(sorted(names, key=lambda code: names[code]))
+
+        self.municipality_names, self._municipality_lookup = _labels(municipalities, provinces.__getitem__)
+        self.barangay_names: Dict[str, str] = {}
+        self._barangay_lookup: Dict[Tuple[str, str], Optional[str]] = {}
+        for municipality_code, children in barangays.items():
+            labels, lookup = _labels(children, str)
+            self.barangay_names.update(labels)
+            self._barangay_lookup.update(((municipality_code, key), code) for key, code in lookup.items())
+        self.municipality_codes = by_name(self.municipality_names)
+        self.barangay_codes = {code: by_name({child: self.barangay_names[child] for child in children})
+                               for code, children in barangays.items()}
+        self.purok_names = {code: tuple(sorted(children.values())) for code, children in puroks.items()}
+        self._purok_lookup = puroks
+
+    def __len__(self) -> int:
+        return len(self.barangay_names)
+
+    def municipalities(self) -> List[str]:
+        return [self.municipality_names[code] for code in self.municipality_codes]
+
+    def barangays(self, municipality: Optional[str]) -> List[str]:
+        """Barangay names of a municipality, in any spelling"""
+        municipality_code = self.municipality_code(municipality)
+        return [self.barangay_names[code] for code in self.barangay_codes.get(municipality_code, ())]
+
+    def puroks(self, municipality: Optional[str], barangay: Optional[str]) -> List[str]:
+        return list(self.purok_names.get(self.barangay_code(municipality, barangay), ()))
+
+    def municipality_code(self, municipality: Optional[str]) -> Optional[str]:
+        return self._municipality_lookup.get(place_key(municipality))
+
+    def barangay_code(self, municipality: Optional[str], barangay: Optional[str]) -> Optional[str]:
+        return self._barangay_lookup.get((self.municipality_code(municipality), place_key(barangay)))
+
+    def canonicalize(self, general_info: Dict[str, Any]) -> Dict[str, Any]:
+        """Canonical names and codes for an address; unknown parts keep their text and get no code"""
+        result: Dict[str, Any] = dict.fromkeys(CODE_FIELDS)
+        municipality_code = self.municipality_code(general_info.get('municipality'))
+        if municipality_code is None:
+            return result
+        result['municipality'] = self.municipality_names[municipality_code]
+        result['municipality_code'] = municipality_code
+        barangay_code = self._barangay_lookup.get((municipality_code, place_key(general_info.get('barangay'))))
+        if barangay_code is None:
+            return result
+        result['barangay'] = self.barangay_names[barangay_code]
+        result['barangay_code'] = barangay_code
+        purok = place_key(general_info.get('purok'))
+        canonical_purok = self._purok_lookup.get(barangay_code, {}).get(purok)
+        if canonical_purok is not None:
+            result['purok'] = canonical_purok
+            result['purok_code'] = f"{barangay_code}-{purok.replace(' ', '-')}"
+        return result
+
+
+def read_gazetteer(path: str) -> List[Dict[str, str]]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+@st.cache_resource
+def get_gazetteer(path: str = DEFAULT_GAZETTEER_PATH) -> Gazetteer:
+    """Return the process-wide gazetteer"""
+    return Gazetteer(read_gazetteer(path))
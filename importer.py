@@ -0,0 +1,396 @@
+"""Bulk import of paper-form backlogs encoded in CSV or XLSX spreadsheets.
+
+Spreadsheet columns are matched to the form's field keys (``last_name``,
+``philhealth_pin``, ``past_hypertension_bp``, ...), ignoring case, spaces and
+punctuation; ``general_info.last_name`` style headers work too, so an
+``exporter.py`` CSV imports as is.
+
+The parent only splits the file into chunks of ``CHUNK_SIZE`` records (raw
+text for CSV, which the workers parse) and writes results; a process pool
+does the rest. Workers coerce values column by column to what the form
+would have stored (booleans for checkboxes, numbers, ISO dates, canonical
+options and gazetteer places) and serialise each valid row for the store.
+The parent writes valid rows in ``TRANSACTION_SIZE`` transactions and every
+rejected row, with its reasons, to an error report that can be corrected
+and imported again.
+
+    python importer.py backlog.xlsx --errors rejected.csv [--workers 4] [--dry-run]
+"""
+import argparse
+import collections
+import csv
+import datetime
+import io
+import multiprocessing
+import os
+import re
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from form_record import SECTION_KEYS
+from form_schema import Field, FormSchema, build_schema
+from gazetteer import DEFAULT_GAZETTEER_PATH, Gazetteer, read_gazetteer
+from matching import normalize_pin
+from submission_store import DEFAULT_DB_PATH, SubmissionStore, prepare_submission
+
+CHUNK_SIZE = 2000
+TRANSACTION_SIZE = 20_000
+IMPORT_SECTIONS = ['general_info', 'medical_history']
+# A row without these cannot be matched to a patient and is rejected
+IDENTITY_FIELDS = ['last_name', 'first_name', 'sex', 'birthdate']
+
+TRUE_WORDS = {'1', 'y', 'yes', 'true', 't', 'x', '/', '✓'}
+FALSE_WORDS = {'', '0', 'n', 'no', 'false', 'f', '-'}
+BP_PATTERN = re.compile(r'\d{2,3}\s*/\s*\d{2,3}')
+
+Rejected = Tuple[int, list, List[str]]
+# Raw CSV text from its first line, or parsed XLSX rows with their line numbers
+Chunk = Union[Tuple[int, str], Tuple[List[int], List[list]]]
+
+
+def header_key(header: Any) -> str:
+    """Case, spacing and punctuation insensitive form of a column header"""
+    return re.sub(r'[^a-z0-9]+', '', str(header or '').lower())
+
+
+def map_columns(header: Sequence[Any], schema: FormSchema) -> Tuple[List[Optional[Tuple[str, str]]], List[str]]:
+    """(section, field) for every spreadsheet column, None when unmapped, plus the unmapped headers"""
+    lookup = {}
+    for section_key in IMPORT_SECTIONS:
+        for name in schema.section(section_key).fields:
+            lookup[header_key(name)] = (section_key, name)
+            lookup[header_key(f"{section_key}.{name}")] = (section_key, name)
+    mapping = [lookup.get(header_key(column)) for column in header]
+    return mapping, [str(column) for column, target in zip(header, mapping) if target is None and column]
+
+
+def _parse_date(value: Any) -> str:
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    text = str(value).strip()
+    if '/' in text:
+        # Paper forms are dated MM/DD/YYYY
+        month, day, year = text.split('/')
+        return datetime.date(int(year), int(month), int(day)).isoformat()
+    return datetime.date.fromisoformat(text[:10]).isoformat()
+
+
+def _spellings(words: Iterable[str]) -> Iterator[str]:
+    for word in words:
+        yield from {word, word.lower(), word.upper(), word.capitalize()}
+
+
+class RowValidator:
+    """Coerces spreadsheet rows to form_data, built once per worker process"""
+
+    def __init__(self, header: Sequence[Any], schema: FormSchema, gazetteer: Gazetteer):
+        self.mapping, _ = map_columns(header, schema)
+        self.gazetteer = gazetteer
+        self.fields: Dict[Tuple[str, str], Field] = {(section.key, name): field
+                                                     for section in schema.sections if section.key in IMPORT_SECTIONS
+                                                     for name, field in section.fields.items()}
+        # (section, detail field, its checkbox, the checkbox value that opens it) for mapped details
+        mapped = set(self.mapping)
+        self.parents: List[Tuple[str, str, str, Any]] = [
+            (section, detail.name, field.name, field.show_details_when)
+            for (section, _), field in self.fields.items() for detail in field.details
+            if (section, detail.name) in mapped]
+        self.options = {key: {option.lower(): option for option in field.options}
+                        for key, field in self.fields.items() if field.options}
+        self.converters = [(index, key, self._column_converter(key))
+                           for index, key in enumerate(self.mapping) if key is not None]
+        self.submitted_at = datetime.datetime.now().isoformat(timespec='seconds')
+
+    def coerce(self, key: Tuple[str, str], value: Any) -> Any:
+        """The value the form would store for one cell; raises ValueError"""
+        field = self.fields[key]
+        kind = field.kind
+        if kind == 'checkbox':
+            if value is None or isinstance(value, bool):
+                return bool(value)
+            word = str(value).strip().lower()
+            if word in TRUE_WORDS:
+                return True
+            if word in FALSE_WORDS:
+                return False
+            raise ValueError("expected yes/no")
+        if value is None or value == '':
+            return None if kind in ('radio', 'selectbox', 'number', 'date') else ''
+        if kind == 'number':
+            number = float(value)
+            low, high = field.params.get('min_value'), field.params.get('max_value')
+            if (low is not None and number < low) or (high is not None and number > high):
+                raise ValueError(f"out of range {low}..{high}")
+            # st.number_input stores ints when its bounds are ints
+            if isinstance(low, float):
+                return number
+            if not number.is_integer():
+                raise ValueError("expected a whole number")
+            return int(number)
+        if kind == 'date':
+            return _parse_date(value)
+        if kind in ('radio', 'selectbox'):
+            option = self.options[key].get(str(value).strip().lower())
+            if option is None:
+                raise ValueError(f"expected one of {', '.join(field.options)}")
+            return option
+        text = str(value).strip()
+        if key[1] == 'philhealth_pin':
+            digits = normalize_pin(text)
+            if not (digits.isdigit() and len(digits) == 12):
+                raise ValueError("expected a 12-digit PIN")
+            return digits
+        if (key[1] == 'bp' or key[1].endswith('_bp')) and not BP_PATTERN.fullmatch(text):
+            raise ValueError("expected systolic/diastolic, e.g. 140/90")
+        return text
+
+    def _column_converter(self, key: Tuple[str, str]) -> Callable[[Sequence[Any]], list]:
+        """Converts a whole column at once, raising if any cell needs ``coerce`` to explain it"""
+        field = self.fields[key]
+        if field.kind == 'checkbox' or field.options:
+            if field.kind == 'checkbox':
+                table: Dict[Any, Any] = {None: False, True: True, False: False}
+                table.update(dict.fromkeys(_spellings(TRUE_WORDS), True))
+                table.update(dict.fromkeys(_spellings(FALSE_WORDS), False))
+            else:
+                table = {None: None, '': None}
+                for option in field.options:
+                    table.update(dict.fromkeys(_spellings([option]), option))
+            return lambda column: [table[value] for value in column]
+        if field.kind == 'number':
+            low, high = field.params.get('min_value'), field.params.get('max_value')
+            low = float('-inf') if low is None else low
+            high = float('inf') if high is None else high
+            as_float = isinstance(field.params.get('min_value'), float)
+
+            def convert(column):
+                numbers = [None if value is None or value == '' else float(value) for value in column]
+                if not all(number is None or low <= number <= high for number in numbers):
+                    raise ValueError
+                if as_float:
+                    return numbers
+                return [None if number is None else _whole(number) for number in numbers]
+            return convert
+        if field.kind == 'date' or key[1] == 'philhealth_pin' or key[1] == 'bp' or key[1].endswith('_bp'):
+            return lambda column: [self.coerce(key, value) for value in column]
+        return lambda column: [value.strip() if value.__class__ is str else '' if value is None else str(value).strip()
+                               for value in column]
+
+    def validate_rows(self, rows: List[Sequence[Any]]) -> List[Tuple[Optional[Dict[str, Dict[str, Any]]], List[str]]]:
+        """(form_data, []) or (None, errors) per row, converting column by column"""
+        width = len(self.mapping)
+        columns = list(zip(*(row if len(row) >= width else list(row) + [''] * (width - len(row)) for row in rows)))
+        errors: Dict[int, List[str]] = collections.defaultdict(list)
+        sections: Dict[str, Tuple[List[str], List[list]]] = {key: ([], []) for key in SECTION_KEYS}
+        for index, key, convert in self.converters:
+            column = columns[index] if columns else ()
+            try:
+                values = convert(column)
+            except (ValueError, TypeError, KeyError):
+                values = []
+                for row_index, value in enumerate(column):
+                    try:
+                        values.append(self.coerce(key, value))
+                    except (ValueError, TypeError) as exc:
+                        errors[row_index].append(f"{key[1]}: {value!r} {exc}")
+                        values.append(None)
+            names, lists = sections[key[0]]
+            names.append(key[1])
+            lists.append(values)
+        per_section = {key: [dict(zip(names, values)) for values in zip(*lists)] if names else [{} for _ in rows]
+                       for key, (names, lists) in sections.items()}
+
+        results = []
+        for row_index in range(len(rows)):
+            form_data = {key: per_section[key][row_index] for key in SECTION_KEYS}
+            row_errors = errors.get(row_index, [])
+            general = form_data['general_info']
+            row_errors += [f"{name}: required" for name in IDENTITY_FIELDS
+                           if not general.get(name) and not any(error.startswith(f"{name}:") for error in row_errors)]
+            for section, name, parent, opens_when in self.parents:
+                data = form_data[section]
+                if data.get(name) and data.get(parent) != opens_when:
+                    row_errors.append(f"{name}: given but {parent} is not {opens_when!r}")
+            if row_errors:
+                results.append((None, row_errors))
+                continue
+            general.update(self.gazetteer.canonicalize(general))
+            results.append((form_data, []))
+        return results
+
+
+def _whole(number: float) -> int:
+    if not number.is_integer():
+        raise ValueError
+    return int(number)
+
+
+_validator: Optional[RowValidator] = None
+
+
+def _init_worker(header: Sequence[Any], gazetteer_path: str):
+    global _validator
+    _validator = RowValidator(header, build_schema(), Gazetteer(read_gazetteer(gazetteer_path)))
+
+
+def _is_blank(row: Sequence[Any]) -> bool:
+    return all(value is None or value == '' for value in row)
+
+
+def parse_block(first_line: int, text: str) -> Tuple[List[int], List[list]]:
+    """(spreadsheet line numbers, rows) of the non-blank records in a block of CSV text"""
+    reader = csv.reader(io.StringIO(text))
+    lines, rows = [], []
+    offset = 0
+    for row in reader:
+        if not _is_blank(row):
+            lines.append(first_line + offset)
+            rows.append(row)
+        offset = reader.line_num
+    return lines, rows
+
+
+def validate_chunk(chunk: Chunk) -> Tuple[list, List[Rejected]]:
+    """Worker: prepared store rows for the valid rows of a chunk, and the rejected ones"""
+    lines, rows = parse_block(*chunk) if isinstance(chunk[1], str) else chunk
+    prepared, rejected = [], []
+    for line, row, (form_data, errors) in zip(lines, rows, _validator.validate_rows(rows)):
+        if errors:
+            rejected.append((line, row, errors))
+        else:
+            prepared.append(prepare_submission(form_data, _validator.submitted_at))
+    return prepared, rejected
+
+
+def read_chunks(path: str, size: int = CHUNK_SIZE) -> Iterator[Any]:
+    """The header row of a CSV or XLSX file, then its chunks of ``size`` records"""
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        try:
+            import openpyxl
+        except ImportError as exc:
+            raise ImportError("Importing XLSX needs openpyxl: pip install openpyxl") from exc
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = (list(row) for row in workbook.active.iter_rows(values_only=True))
+            yield next(rows, [])
+            yield from _row_chunks(rows, size)
+        finally:
+            workbook.close()
+    else:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            yield next(reader, [])
+            yield from _text_chunks(f, size, reader.line_num + 1)
+
+
+def _text_chunks(f, size: int, first_line: int) -> Iterator[Tuple[int, str]]:
+    """(first line, raw text) of ``size`` CSV records at a time; the workers parse them"""
+    lines: List[str] = []
+    records = quotes = 0
+    start = line_number = first_line
+    for line in f:
+        lines.append(line)
+        line_number += 1
+        # A newline inside a quoted field leaves an odd number of quotes so far
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        records += 1
+        quotes = 0
+        if records >= size:
+            yield start, ''.join(lines)
+            lines, records, start = [], 0, line_number
+    if lines:
+        yield start, ''.join(lines)
+
+
+def _row_chunks(rows: Iterable[list], size: int) -> Iterator[Tuple[List[int], List[list]]]:
+    """(spreadsheet line numbers, rows) of ``size`` parsed rows at a time, skipping blank rows"""
+    lines, chunk = [], []
+    for line, row in enumerate(rows, 2):
+        if _is_blank(row):
+            continue
+        lines.append(line)
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield lines, chunk
+            lines, chunk = [], []
+    if chunk:
+        yield lines, chunk
+
+
+def import_file(path: str, store: Optional[SubmissionStore], errors_path: str, workers: int = os.cpu_count() or 1,
+                gazetteer_path: str = DEFAULT_GAZETTEER_PATH) -> Dict[str, Any]:
+    """Import a spreadsheet into ``store`` (validate only when None) and return counts"""
+    started = time.perf_counter()
+    chunks = read_chunks(path)
+    header = next(chunks)
+    _, unmapped = map_columns(header, build_schema())
+    counts = {'rows': 0, 'imported': 0, 'rejected': 0, 'unmapped_columns': unmapped}
+    pending: List[tuple] = []
+
+    def flush():
+        if store is not None:
+            store.insert_prepared(pending)
+        counts['imported'] += len(pending)
+        pending.clear()
+
+    with open(errors_path, 'w', encoding='utf-8', newline='') as f:
+        report = csv.writer(f)
+        report.writerow(['source_row', 'errors'] + list(header))
+        for prepared, rejected in _validated_chunks(header, chunks, workers, gazetteer_path):
+            counts['rows'] += len(prepared) + len(rejected)
+            counts['rejected'] += len(rejected)
+            report.writerows([line, '; '.join(errors)] + list(row) for line, row, errors in rejected)
+            pending += prepared
+            if len(pending) >= TRANSACTION_SIZE:
+                flush()
+        flush()
+    counts['seconds'] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+def _validated_chunks(header, chunks: Iterator[Chunk], workers: int,
+                      gazetteer_path: str) -> Iterator[Tuple[list, List[Rejected]]]:
+    if workers <= 1:
+        _init_worker(header, gazetteer_path)
+        yield from map(validate_chunk, chunks)
+        return
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers, initializer=_init_worker, initargs=(header, gazetteer_path)) as pool:
+        # Keep a few chunks in flight per worker instead of reading the whole file ahead, in file order
+        in_flight: collections.deque = collections.deque()
+        for chunk in chunks:
+            in_flight.append(pool.apply_async(validate_chunk, (chunk,)))
+            if len(in_flight) >= workers * 2:
+                yield in_flight.popleft().get()
+        while in_flight:
+            yield in_flight.popleft().get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import encoded paper forms from CSV or XLSX.")
+    parser.add_argument('path')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH)
+    parser.add_argument('--errors', default='import_errors.csv', help="report of rejected rows")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--gazetteer', default=DEFAULT_GAZETTEER_PATH)
+    parser.add_argument('--dry-run', action='store_true', help="validate and report without storing")
+    args = parser.parse_args()
+
+    store = None if args.dry_run else SubmissionStore(args.db)
+    counts = import_file(args.path, store, args.errors, args.workers, args.gazetteer)
+    if counts['unmapped_columns']:
+        print(f"Ignored columns: {', '.join(counts['unmapped_columns'])}", file=sys.stderr)
+    print(f"{counts['rows']} rows in {counts['seconds']} s ({counts['rows'] / max(counts['seconds'], 1e-9):.0f}/s): "
+          f"{counts['imported']} {'valid' if args.dry_run else 'imported'}, {counts['rejected']} rejected"
+          + (f" (see {args.errors})" if counts['rejected'] else ""))
+    if store is not None:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
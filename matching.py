@@ -0,0 +1,162 @@
+"""Fuzzy patient matching for duplicate-registration checks.
+
+Records are grouped into blocks by PhilHealth PIN and by phonetic name keys
+paired with the birth year or birthdate, so a new registration is only compared against the few
+stored records that share a block instead of the whole registry. The store
+keeps the block table up to date as submissions are inserted.
+"""
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+MATCH_THRESHOLD = 0.85
+
+PIN_SEPARATORS = re.compile(r'[\s-]')
+
+# Soundex digit for each consonant; vowels separate runs, H/W/Y are ignored
+_SOUNDEX_CODES = {}
+for _letters, _digit in (('BFPV', '1'), ('CGJKQSXZ', '2'), ('DT', '3'), ('L', '4'), ('MN', '5'), ('R', '6'),
+                         ('AEIOU', '0')):
+    for _letter in _letters:
+        _SOUNDEX_CODES[_letter] = _digit
+
+
+def normalize_pin(pin: Optional[str]) -> str:
+    """PhilHealth PIN without spaces or dashes, so '19-012345678-9' and '190123456789' compare equal"""
+    return PIN_SEPARATORS.sub('', pin or '')
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """Uppercase ASCII letters only, so 'De la Cruz' and 'DELACRUZ' compare equal"""
+    if not name:
+        return ''
+    ascii_name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    return ''.join(c for c in ascii_name.upper() if 'A' <= c <= 'Z')
+
+
+def phonetic_key(name: Optional[str]) -> str:
+    """Soundex-style code that also folds the first letter (C/K/Q, B/V, ...)"""
+    letters = normalize_name(name).replace('PH', 'F')
+    if not letters:
+        return ''
+    code = []
+    previous = ''
+    for letter in letters:
+        digit = _SOUNDEX_CODES.get(letter)
+        if digit is None:
+            continue
+        if digit != previous and digit != '0':
+            code.append(digit)
+        previous = digit
+    return ''.join(code[:4]).ljust(4, '0')
+
+
+def birth_year(birthdate: Optional[str]) -> str:
+    return (birthdate or '')[:4]
+
+
+def blocking_keys(general_info: Dict[str, Any]) -> List[str]:
+    """Block keys a record is filed under and searched by
+
+    Besides the PIN, each key pairs two identifying parts so that common names
+    such as Maria or Santos do not produce huge blocks: both phonetic names with
+    the birth year, or one phonetic name with the full birthdate for patients
+    whose first or last name changed (nickname, marriage).
+    """
+    keys = []
+    pin = normalize_pin(general_info.get('philhealth_pin'))
+    if pin:
+        keys.append(f"pin:{pin}")
+    birthdate = general_info.get('birthdate') or ''
+    year = birth_year(birthdate)
+    last, first = phonetic_key(general_info.get('last_name')), phonetic_key(general_info.get('first_name'))
+    if last and first and year:
+        keys.append(f"name:{last}:{first}:{year}")
+    if birthdate:
+        keys.extend(f"{prefix}:{code}:{birthdate}" for prefix, code in (('ln', last), ('fn', first)) if code)
+    return keys
+
+
+def jaro_winkler(a: str, b: str) -> float:
+    if a == b:
+        return 1.0 if a else 0.0
+    if not a or not b:
+        return 0.0
+    window = max(max(len(a), len(b)) // 2 - 1, 0)
+    a_matched = [False] * len(a)
+    b_matched = [False] * len(b)
+    matches = 0
+    for i, char in enumerate(a):
+        for j in range(max(0, i - window), min(len(b), i + window + 1)):
+            if not b_matched[j] and b[j] == char:
+                a_matched[i] = b_matched[j] = True
+                matches += 1
+                break
+    if not matches:
+        return 0.0
+    transpositions = 0
+    j = 0
+    for i, char in enumerate(a):
+        if a_matched[i]:
+            while not b_matched[j]:
+                j += 1
+            if char != b[j]:
+                transpositions += 1
+            j += 1
+    jaro = (matches / len(a) + matches / len(b) + (matches - transpositions / 2) / matches) / 3
+    prefix = 0
+    for char_a, char_b in zip(a[:4], b[:4]):
+        if char_a != char_b:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+def match_score(new: Dict[str, Any], stored: Dict[str, Any]) -> float:
+    """Similarity between two General Data records, from 0 to 1"""
+    pin = normalize_pin(new.get('philhealth_pin'))
+    if pin and pin == normalize_pin(stored.get('philhealth_pin')):
+        return 1.0
+
+    weights = {'last_name': 0.5, 'first_name': 0.35, 'middle_name': 0.15}
+    name_score = weight_total = 0.0
+    for name, weight in weights.items():
+        a, b = normalize_name(new.get(name)), normalize_name(stored.get(name))
+        if a and b:
+            name_score += weight * jaro_winkler(a, b)
+            weight_total += weight
+    if not weight_total:
+        return 0.0
+    name_score /= weight_total
+
+    new_birthdate, stored_birthdate = new.get('birthdate') or '', stored.get('birthdate') or ''
+    if new_birthdate and new_birthdate == stored_birthdate:
+        birth_score = 1.0
+    elif birth_year(new_birthdate) and birth_year(new_birthdate) == birth_year(stored_birthdate):
+        birth_score = 0.5
+    else:
+        birth_score = 0.0
+
+    barangay = normalize_name(new.get('barangay'))
+    barangay_score = 1.0 if barangay and barangay == normalize_name(stored.get('barangay')) else 0.0
+
+    return 0.6 * name_score + 0.3 * birth_score + 0.1 * barangay_score
+
+
+def find_likely_duplicates(general_info: Dict[str, Any], store, threshold: float = MATCH_THRESHOLD,
+                           limit: int = 5) -> List[Dict[str, Any]]:
+    """Stored patients that probably are the same person, best match first
+
+    Each result is the latest stored record of a patient (grouped by PIN when
+    one is present) with its ``score``.
+    """
+    best: Dict[str, Dict[str, Any]] = {}
+    for candidate in store.find_block_candidates(blocking_keys(general_info)):
+        score = match_score(general_info, candidate)
+        if score < threshold:
+            continue
+        patient = normalize_pin(candidate.get('philhealth_pin')) or f"id:{candidate['id']}"
+        current = best.get(patient)
+        if current is None or (score, candidate['id']) > (current['score'], current['id']):
+            best[patient] = dict(candidate, score=score)
+    return sorted(best.values(), key=lambda match: (-match['score'], -match['id']))[:limit]
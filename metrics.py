@@ -0,0 +1,133 @@
+"""In-process timings of the render hot path and per-session form sizes.
+
+``timed`` wraps a block and appends ``(metric, label, seconds)`` to a fixed
+size ring buffer shared by every session of the process (see
+``get_metrics``); a sample costs two ``perf_counter`` calls and a deque
+append. Quantiles are computed from the buffer only when read, while the
+counts and sums behind them are cumulative, as Prometheus expects. The
+admin page reads ``summary`` and ``export_prometheus`` periodically writes
+the same figures in the Prometheus text format.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Tuple
+
+import streamlit as st
+
+METRICS_PATH = os.environ.get('KONSULTA_METRICS_PATH', 'metrics.prom')
+RING_SIZE = 20_000
+EXPORT_INTERVAL = 15.0
+# Sessions that have not reported their form size for this long are dropped
+SESSION_TTL = 3600.0
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+HELP = {
+    'render': "Wall time of one section, tab or block render",
+    'progress': "Wall time of a progress calculation",
+}
+
+
+def _quantile(ordered: List[float], q: float) -> float:
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+class Metrics:
+    """Ring buffer of timing samples plus per-session form_data sizes"""
+
+    def __init__(self, size: int = RING_SIZE):
+        self._samples: Deque[Tuple[str, str, float]] = deque(maxlen=size)
+        self._totals: Dict[Tuple[str, str], List[float]] = {}
+        self._sessions: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._last_export = 0.0
+
+    def observe(self, metric: str, label: str, seconds: float):
+        self._samples.append((metric, label, seconds))
+        with self._lock:
+            totals = self._totals.setdefault((metric, label), [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    @contextmanager
+    def timed(self, metric: str, label: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(metric, label, time.perf_counter() - started)
+
+    def record_session_size(self, session_id: str, size: int):
+        """Serialized size of a session's form_data, in bytes"""
+        with self._lock:
+            self._sessions[session_id] = (size, time.monotonic())
+
+    def session_sizes(self) -> Dict[str, int]:
+        cutoff = time.monotonic() - SESSION_TTL
+        with self._lock:
+            for session_id in [s for s, (_, seen) in self._sessions.items() if seen < cutoff]:
+                del self._sessions[session_id]
+            return {session_id: size for session_id, (size, _) in self._sessions.items()}
+
+    def summary(self) -> List[Dict[str, object]]:
+        """Per metric and label: cumulative count/sum and quantiles over the ring buffer, slowest first"""
+        recent: Dict[Tuple[str, str], List[float]] = {}
+        for metric, label, seconds in list(self._samples):
+            recent.setdefault((metric, label), []).append(seconds)
+        with self._lock:
+            totals = {key: tuple(value) for key, value in self._totals.items()}
+        rows = []
+        for (metric, label), (count, total) in totals.items():
+            ordered = sorted(recent.get((metric, label), ())) or [0.0]
+            rows.append({'metric': metric, 'label': label, 'count': count, 'sum': total,
+                         **{f"p{int(q * 100)}": _quantile(ordered, q) for q in QUANTILES}})
+        rows.sort(key=lambda row: row['p90'], reverse=True)
+        return rows
+
+    def prometheus_text(self) -> str:
+        lines = []
+        rows = self.summary()
+        for metric in sorted({row['metric'] for row in rows}):
+            name = f"konsulta_{metric}_seconds"
+            lines += [f"# HELP {name} {HELP.get(metric, metric)}", f"# TYPE {name} summary"]
+            for row in (row for row in rows if row['metric'] == metric):
+                label = row['label'].replace('\\', '\\\\').replace('"', '\\"')
+                for q in QUANTILES:
+                    lines.append(f'{name}{{part="{label}",quantile="{q}"}} {row[f"p{int(q * 100)}"]:.6f}')
+                lines.append(f'{name}_sum{{part="{label}"}} {row["sum"]:.6f}')
+                lines.append(f'{name}_count{{part="{label}"}} {row["count"]}')
+        sizes = self.session_sizes()
+        name = 'konsulta_session_form_data_bytes'
+        lines += [f"# HELP {name} Serialized size of a session's form_data",
+                  f"# TYPE {name} gauge"]
+        lines += [f'{name}{{session="{session_id[:8]}"}} {size}' for session_id, size in sorted(sizes.items())]
+        lines += ["# HELP konsulta_sessions Sessions that reported a form size within the last hour",
+                  "# TYPE konsulta_sessions gauge", f"konsulta_sessions {len(sizes)}"]
+        return '\n'.join(lines) + '\n'
+
+    def export_prometheus(self, path: str = METRICS_PATH, interval: float = EXPORT_INTERVAL) -> bool:
+        """Rewrite the Prometheus text file if ``interval`` seconds have passed"""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_export < interval:
+                return False
+            self._last_export = now
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+        return True
+
+
+@st.cache_resource
+def get_metrics() -> Metrics:
+    """Return the process-wide metrics buffer"""
+    return Metrics()
+
+
+def timed(metric: str, label: str):
+    """Time a block into the process-wide buffer"""
+    return get_metrics().timed(metric, label)
@@ -0,0 +1,218 @@
+"""NCD risk screening derived from the Health Assessment answers.
+
+Fills the ``ncd_assessment`` section from fields the form already collects:
+BMI from height and weight (Asia-Pacific cut-offs), blood pressure parsed
+from the free-text ``bp`` field, and a point score over the usual NCD risk
+factors (age, weight, blood pressure, smoking, alcohol, a history of diabetes
+or hypertension, a family history of diabetes or cardiovascular disease).
+
+The scoring works on whole NumPy columns: ``score_patient`` runs it on
+one-element arrays for the live form, ``score_frame`` on a DataFrame, and
+``rescore_registry`` on every stored submission, ``CHUNK_SIZE`` at a time,
+saving the results to the store's ``ncd_scores`` table.
+
+    python ncd_risk.py --db konsulta.db
+"""
+import argparse
+import collections
+import datetime
+import math
+import re
+import time
+from typing import Any, Dict, Mapping, Tuple
+
+import numpy as np
+import pandas as pd
+
+from submission_store import DEFAULT_DB_PATH, SubmissionStore
+
+CHUNK_SIZE = 50_000
+
+# (section, field) of every answer the score reads
+INPUT_FIELDS = [
+    ('general_info', 'age'),
+    ('medical_history', 'height'), ('medical_history', 'weight'), ('medical_history', 'bp'),
+    ('medical_history', 'smoking_status'), ('medical_history', 'alcohol_status'),
+    ('medical_history', 'past_diabetes_mellitus'), ('medical_history', 'past_hypertension'),
+    ('medical_history', 'fam_diabetes_mellitus'), ('medical_history', 'fam_hypertension'),
+    ('medical_history', 'fam_coronary_artery_disease'), ('medical_history', 'fam_cerebrovascular_disease'),
+]
+FLAG_FIELDS = ['past_diabetes_mellitus', 'past_hypertension', 'fam_diabetes_mellitus', 'fam_hypertension',
+               'fam_coronary_artery_disease', 'fam_cerebrovascular_disease']
+FAMILY_FIELDS = FLAG_FIELDS[2:]
+# Status answers the score reads; an unanswered one (None) is unknown and adds no points
+STATUS_FIELDS = {'smoking_status': "Smoking status", 'alcohol_status': "Alcohol status"}
+
+BP_PATTERN = re.compile(r'\s*(\d{2,3})\s*/\s*(\d{2,3})\s*')
+
+# Lower bounds of each category after the first
+BMI_CUTOFFS = [18.5, 23.0, 25.0]
+BMI_CATEGORIES = ['Underweight', 'Normal', 'Overweight', 'Obese']
+RISK_CUTOFFS = [3, 6]
+RISK_CATEGORIES = ['Low', 'Moderate', 'High']
+
+# Risk factor -> (label, points)
+RISK_POINTS = {
+    'age_40_59': ("Age 40-59", 1),
+    'age_60_plus': ("Age 60 or over", 2),
+    'overweight': ("Overweight", 1),
+    'obese': ("Obese", 2),
+    'high_normal_bp': ("High-normal BP", 1),
+    'raised_bp': ("Raised BP", 2),
+    'smoker': ("Current smoker", 2),
+    'former_smoker': ("Former smoker", 1),
+    'alcohol': ("Drinks alcohol", 1),
+    'diabetes': ("Diabetes", 2),
+    'hypertension': ("Known hypertension", 2),
+    'family_history': ("Family history of diabetes or CVD", 1),
+}
+
+# ncd_assessment keys, in the order of the ncd_scores table after submission_id
+SCORE_COLUMNS = ['bmi', 'bmi_category', 'systolic', 'diastolic', 'bp_category', 'risk_score', 'risk_category']
+
+
+def _categorize(values: np.ndarray, cutoffs, labels) -> np.ndarray:
+    """Label of each value's band; None where the value is missing"""
+    index = np.searchsorted(cutoffs, values, side='right')
+    return np.array(labels + [None], dtype=object)[np.where(np.isnan(values), len(labels), index)]
+
+
+def _bp_category(systolic: np.ndarray, diastolic: np.ndarray) -> np.ndarray:
+    return np.select([(systolic >= 140) | (diastolic >= 90), (systolic >= 130) | (diastolic >= 85),
+                      ~np.isnan(systolic)], ['Raised', 'High-normal', 'Normal'], None).astype(object)
+
+
+def risk_factors(columns: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Boolean column per ``RISK_POINTS`` factor"""
+    age, bmi, bp = columns['age'], columns['bmi'], columns['bp_category']
+    family = np.zeros(len(age), dtype=bool)
+    for name in FAMILY_FIELDS:
+        family |= columns[name]
+    return {
+        'age_40_59': (age >= 40) & (age < 60),
+        'age_60_plus': age >= 60,
+        'overweight': (bmi >= BMI_CUTOFFS[1]) & (bmi < BMI_CUTOFFS[2]),
+        'obese': bmi >= BMI_CUTOFFS[2],
+        'high_normal_bp': bp == 'High-normal',
+        'raised_bp': bp == 'Raised',
+        'smoker': columns['smoking_status'] == 'Yes',
+        'former_smoker': columns['smoking_status'] == 'Quit',
+        'alcohol': columns['alcohol_status'] == 'Yes',
+        'diabetes': columns['past_diabetes_mellitus'],
+        'hypertension': columns['past_hypertension'],
+        'family_history': family,
+    }
+
+
+def score(columns: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Score columns of clean inputs: float age/height/weight/systolic/diastolic (NaN when missing),
+    boolean ``FLAG_FIELDS`` and object status columns"""
+    height, weight = columns['height'], columns['weight']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bmi = np.where((height > 0) & (weight > 0), np.round(weight / (height / 100) ** 2, 1), np.nan)
+    results = {'bmi': bmi, 'bmi_category': _categorize(bmi, BMI_CUTOFFS, BMI_CATEGORIES),
+               'systolic': columns['systolic'], 'diastolic': columns['diastolic'],
+               'bp_category': _bp_category(columns['systolic'], columns['diastolic'])}
+    factors = risk_factors({**columns, **results})
+    total = np.zeros(len(bmi), dtype=np.int64)
+    for name, present in factors.items():
+        total += present * RISK_POINTS[name][1]
+    results['risk_score'] = total
+    results['risk_category'] = _categorize(total.astype(float), RISK_CUTOFFS, RISK_CATEGORIES)
+    results['factors'] = factors
+    return results
+
+
+def _number(value: Any) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return math.nan
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+def parse_bp(text: Any) -> Tuple[float, float]:
+    """(systolic, diastolic) of a ``120/80`` reading, NaN when it is not one"""
+    match = BP_PATTERN.fullmatch(text) if isinstance(text, str) else None
+    return (float(match[1]), float(match[2])) if match else (math.nan, math.nan)
+
+
+def _scalar(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        value = value.item()
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+
+def score_patient(form_data: Mapping[str, Mapping[str, Any]]) -> Dict[str, Any]:
+    """``ncd_assessment`` values for one form, with the labels of the risk factors found"""
+    general, history = form_data.get('general_info', {}), form_data.get('medical_history', {})
+    systolic, diastolic = parse_bp(history.get('bp'))
+    columns = {'age': np.array([_number(general.get('age'))]), 'systolic': np.array([systolic]),
+               'diastolic': np.array([diastolic]),
+               'height': np.array([_number(history.get('height'))]),
+               'weight': np.array([_number(history.get('weight'))]),
+               'smoking_status': np.array([history.get('smoking_status')], dtype=object),
+               'alcohol_status': np.array([history.get('alcohol_status')], dtype=object)}
+    columns.update((name, np.array([history.get(name) is True])) for name in FLAG_FIELDS)
+    results = score(columns)
+    assessment = {name: _scalar(results[name][0]) for name in SCORE_COLUMNS}
+    assessment['risk_factors'] = [RISK_POINTS[name][0] for name, present in results['factors'].items() if present[0]]
+    assessment['unanswered'] = [label for name, label in STATUS_FIELDS.items() if history.get(name) is None]
+    return assessment
+
+
+def score_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """``SCORE_COLUMNS`` for a frame with one column per ``INPUT_FIELDS`` name, as stored in form_data"""
+    bp = frame['bp'].astype(object)
+    readings = bp.where(bp.map(type) == str).str.extract(rf'\A{BP_PATTERN.pattern}\Z')
+    columns = {name: pd.to_numeric(frame[name], errors='coerce').to_numpy(dtype=float)
+               for name in ('age', 'height', 'weight')}
+    columns['systolic'] = readings[0].astype(float).to_numpy()
+    columns['diastolic'] = readings[1].astype(float).to_numpy()
+    for name in ('smoking_status', 'alcohol_status'):
+        columns[name] = frame[name].to_numpy(dtype=object)
+    for name in FLAG_FIELDS:
+        # Stored JSON true comes back from SQLite as 1
+        columns[name] = frame[name].isin([True, 1]).to_numpy()
+    results = score(columns)
+    return pd.DataFrame({name: results[name] for name in SCORE_COLUMNS}, index=frame.index)
+
+
+def rescore_registry(store: SubmissionStore, chunk_size: int = CHUNK_SIZE) -> Dict[str, int]:
+    """Score every stored submission into ``ncd_scores`` and return the count per risk category"""
+    names = ['id'] + [name for _, name in INPUT_FIELDS]
+    scored_at = datetime.datetime.now().isoformat(timespec='seconds')
+    counts: Dict[str, int] = collections.Counter()
+    for rows in store.iter_fields(INPUT_FIELDS, chunk_size):
+        frame = pd.DataFrame.from_records(rows, columns=names)
+        scores = score_frame(frame)
+        counts.update(scores['risk_category'].value_counts().to_dict())
+        # Missing readings go in as NULL
+        values = scores.astype(object).where(scores.notna(), None)
+        values.insert(0, 'submission_id', frame['id'])
+        values['scored_at'] = scored_at
+        store.save_ncd_scores(list(values.itertuples(index=False, name=None)))
+    return dict(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score the NCD risk of every stored submission.")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    store = SubmissionStore(args.db)
+    started = time.perf_counter()
+    try:
+        counts = rescore_registry(store, args.chunk_size)
+    finally:
+        store.close()
+    total = sum(counts.values())
+    print(f"scored {total} submissions in {time.perf_counter() - started:.1f} s")
+    for category in RISK_CATEGORIES:
+        print(f"{category:>9}: {counts.get(category, 0)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Returning-patient lookup by PhilHealth PIN.
+
+A bounded LRU cache with a TTL sits in front of the submission store so the
+PIN check that runs on every General Data rerun only touches SQLite once per
+patient per ``CACHE_TTL`` seconds. Misses are cached too, so a new patient's
+PIN is not looked up again on every keystroke elsewhere in the form.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import streamlit as st
+
+from matching import normalize_pin
+from submission_store import get_store
+
+CACHE_SIZE = 2048
+CACHE_TTL = 300.0
+
+# General Data keys copied from the most recent encounter
+PREFILL_FIELDS = [
+    'last_name', 'first_name', 'middle_name', 'sex', 'birthdate',
+    'purok', 'barangay', 'municipality', 'contact', 'email',
+    'member_type', 'member_specify',
+    'facility_choice1', 'facility_choice2', 'facility_choice3',
+    'choice1_check', 'choice2_check', 'choice3_check'
+]
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = _MISSING) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+@st.cache_resource
+def get_patient_cache() -> TTLCache:
+    """Return the process-wide PIN -> latest form_data cache"""
+    return TTLCache()
+
+
+def find_returning_patient(pin: str) -> Optional[Dict[str, Any]]:
+    """Return the form_data of the most recent encounter for a PIN, if any"""
+    pin = normalize_pin(pin)
+    if not pin:
+        return None
+    cache = get_patient_cache()
+    cached = cache.get(pin)
+    if cached is not _MISSING:
+        return cached
+    records = get_store().find_by_pin(pin, limit=1)
+    latest = records[0]['form_data'] if records else None
+    cache.put(pin, latest)
+    return latest
+
+
+def remember_submission(form_data: Dict[str, Any]):
+    """Make a just-stored submission the cached latest encounter for its PIN"""
+    pin = normalize_pin(form_data.get('general_info', {}).get('philhealth_pin'))
+    if pin:
+        get_patient_cache().put(pin, copy.deepcopy(form_data))
@@ -0,0 +1,84 @@
+"""Incremental per-section completion counters.
+
+Instead of rescanning every required field on each rerun, the tracker keeps a
+filled/total counter per section and adjusts it whenever a single field
+changes, so reading a section's progress is O(1).
+"""
+from typing import Any, Dict, Tuple
+
+import streamlit as st
+
+from form_schema import FormSchema, Section, get_schema
+
+
+def field_contribution(field, section_data) -> Tuple[int, int]:
+    """Return the (filled, total) a required field adds to its section"""
+    value = section_data.get(field.name)
+    if field.kind == 'checkbox':
+        if value:
+            for detail in field.details:
+                if section_data.get(detail.name):
+                    return 2, 2
+            return 1, 1
+        # Unticked is the widget default, so it only means "no" once the table's "none of the above" is ticked
+        return (1, 1) if field.answered_by and section_data.get(field.answered_by) else (0, 1)
+    return (1, 1) if value else (0, 1)
+
+
+class ProgressTracker:
+    """Filled/total counters for every section of the form schema"""
+
+    def __init__(self, schema: FormSchema):
+        self._sections: Dict[str, Section] = {s.key: s for s in schema.sections}
+        self._filled: Dict[str, int] = {}
+        self._total: Dict[str, int] = {}
+        self._contribution: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        for key in self._sections:
+            self.rebuild(key, {})
+
+    def rebuild(self, section_key: str, section_data: Dict[str, Any]):
+        """Recount a section from scratch, e.g. after a bulk prefill"""
+        section = self._sections.get(section_key)
+        if section is None:
+            return
+        filled = total = 0
+        for field in section.required:
+            contribution = field_contribution(field, section_data)
+            self._contribution[(section_key, field.name)] = contribution
+            filled += contribution[0]
+            total += contribution[1]
+        self._filled[section_key] = filled
+        self._total[section_key] = total
+
+    def update(self, section_key: str, name: str, section_data: Dict[str, Any]):
+        """Adjust the counters after ``section_data[name]`` changed"""
+        section = self._sections.get(section_key)
+        if section is None:
+            return
+        for owner in section.progress_owner.get(name, ()):
+            old_filled, old_total = self._contribution[(section_key, owner.name)]
+            new_filled, new_total = field_contribution(owner, section_data)
+            self._contribution[(section_key, owner.name)] = (new_filled, new_total)
+            self._filled[section_key] += new_filled - old_filled
+            self._total[section_key] += new_total - old_total
+
+    def counts(self, section_key: str) -> Tuple[int, int]:
+        return self._filled.get(section_key, 0), self._total.get(section_key, 0)
+
+    def percent(self, section_key: str) -> int:
+        """Completion percentage of a section, rounded to a whole number"""
+        filled, total = self.counts(section_key)
+        return round(filled / total * 100) if total > 0 else 0
+
+    def overall_percent(self) -> float:
+        """Average completion over every section that has required fields"""
+        if not self._sections:
+            return 0.0
+        return sum(self.percent(key) for key in self._sections) / len(self._sections)
+
+
+def get_progress_tracker() -> ProgressTracker:
+    """Return this session's tracker, creating it on first use"""
+    if 'progress_tracker' not in st.session_state:
+        st.session_state.progress_tracker = ProgressTracker(get_schema())
+    return st.session_state.progress_tracker
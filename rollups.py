@@ -0,0 +1,125 @@
+"""Per-barangay monthly health indicators for the supervisors' dashboard.
+
+Every stored submission adds to a few counters in the store's ``rollups``
+table, keyed by (month, municipality, barangay, metric), inside the
+transaction that stores it: one for the submission itself, its completion
+percentage, and one per ticked past/family condition, smoking and alcohol
+answer and immunization. The dashboard reads only those counters, so its
+cost grows with the number of barangays and metrics, never with the number
+of submissions. ``SubmissionStore.rebuild_rollups`` recomputes them from the
+raw records.
+
+Places are keyed by their gazetteer code, or by the typed name when the
+place is not in the gazetteer. The month is that of the registration date,
+falling back to the submission date, so imported backlogs land in the month
+they were registered.
+"""
+import re
+from typing import Any, Dict, List, Mapping, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from form_schema import FormSchema, get_schema, iter_fields
+from gazetteer import Gazetteer
+from progress_tracker import field_contribution
+
+SUBMISSIONS = 'submissions'
+COMPLETION = 'completion'
+STATUS_FIELDS = ['smoking_status', 'alcohol_status']
+# Value counted for a choice left unanswered, so it is not mistaken for any answer
+UNANSWERED = 'Not answered'
+
+_MONTH = re.compile(r'\d{4}-\d{2}')
+
+# (month, municipality, barangay)
+RollupKey = Tuple[str, str, str]
+
+
+class RollupLayout:
+    """The metrics a submission counts towards, derived once from the form schema"""
+
+    def __init__(self, schema: FormSchema):
+        self.sections = schema.sections
+        history = schema.section('medical_history')
+        # metric -> dashboard label, in column order
+        self.labels: Dict[str, str] = {SUBMISSIONS: "Submissions", COMPLETION: "Completion %"}
+        # (metric, field) of the checkbox metrics
+        self.flags: List[Tuple[str, str]] = []
+        for prefix, group in (('past_', "Past"), ('fam_', "Family")):
+            for name, field in history.fields.items():
+                if field.kind == 'checkbox' and name.startswith(prefix):
+                    self.flags.append((name, name))
+                    self.labels[name] = f"{group}: {field.label}"
+        self.statuses = {name: history.fields[name].options + (UNANSWERED,) for name in STATUS_FIELDS}
+        for name, options in self.statuses.items():
+            self.labels.update((f"{name}:{option}", f"{history.fields[name].label}: {option}") for option in options)
+        for field in iter_fields(schema.immunization):
+            if field.kind == 'checkbox':
+                self.flags.append((f"immunization:{field.name}", field.name))
+                self.labels[f"immunization:{field.name}"] = f"Immunized: {field.label}"
+
+    def completion(self, form_data: Mapping[str, Mapping[str, Any]]) -> float:
+        """Overall completion percentage, as the progress summary computes it"""
+        percents = []
+        for section in self.sections:
+            data = form_data.get(section.key, {})
+            filled = total = 0
+            for field in section.required:
+                contribution = field_contribution(field, data)
+                filled += contribution[0]
+                total += contribution[1]
+            percents.append(round(filled / total * 100) if total else 0)
+        return sum(percents) / len(percents) if percents else 0.0
+
+    def values(self, form_data: Mapping[str, Mapping[str, Any]]) -> Dict[str, float]:
+        """What one submission adds to each metric it counts towards"""
+        history = form_data.get('medical_history', {})
+        values = {SUBMISSIONS: 1, COMPLETION: self.completion(form_data)}
+        values.update((metric, 1) for metric, name in self.flags if history.get(name) is True)
+        for name, options in self.statuses.items():
+            answer = history.get(name) or UNANSWERED
+            if answer in options:
+                values[f"{name}:{answer}"] = 1
+        return values
+
+
+def rollup_key(form_data: Mapping[str, Mapping[str, Any]], submitted_at: str) -> RollupKey:
+    general = form_data.get('general_info', {})
+    registered = general.get('registration_date')
+    month = registered[:7] if isinstance(registered, str) and _MONTH.match(registered) else submitted_at[:7]
+    municipality = general.get('municipality_code') or (general.get('municipality') or '').strip()
+    barangay = general.get('barangay_code') or (general.get('barangay') or '').strip()
+    return month, municipality, barangay
+
+
+def rollup_deltas(form_data: Mapping[str, Mapping[str, Any]],
+                  submitted_at: str) -> Tuple[RollupKey, Dict[str, float]]:
+    """Rollup key of a submission and what it adds there"""
+    return rollup_key(form_data, submitted_at), get_rollup_layout().values(form_data)
+
+
+@st.cache_resource
+def get_rollup_layout() -> RollupLayout:
+    """Return the process-wide rollup layout"""
+    return RollupLayout(get_schema())
+
+
+def dashboard_table(rows: List[Dict[str, Any]], layout: RollupLayout, gazetteer: Gazetteer) -> pd.DataFrame:
+    """One row per barangay: submissions, average completion and the percentage of submissions per metric"""
+    columns = ['Municipality', 'Barangay'] + list(layout.labels.values())
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    counts = (pd.DataFrame(rows).pivot_table(index=['municipality', 'barangay'], columns='metric', values='value',
+                                             aggfunc='sum', fill_value=0)
+              .reindex(columns=list(layout.labels), fill_value=0))
+    submissions = counts[SUBMISSIONS]
+    table = counts.div(submissions, axis=0).mul(100).round(1)
+    table[SUBMISSIONS] = submissions.astype(int)
+    table[COMPLETION] = (counts[COMPLETION] / submissions).round(1)
+    table = table.rename(columns=layout.labels).rename_axis(columns=None).reset_index()
+    table.insert(0, 'Municipality', table.pop('municipality').map(
+        lambda key: gazetteer.municipality_names.get(key, key) or "Unknown"))
+    table.insert(1, 'Barangay', table.pop('barangay').map(
+        lambda key: gazetteer.barangay_names.get(key, key) or "Unknown"))
+    return table.sort_values(['Municipality', 'Barangay'], ignore_index=True)
@@ -1,556 +1,635 @@
 import streamlit as st
+import csv
 import datetime
+import hmac
+import io
+import itertools
 import json
+import os
+import pathlib
+import queue
 from typing import Dict, List, Any
 
-def calculate_section_progress(section_data, section_key='general_info'):
-    """Calculate the completion percentage of a form section"""
-    if not section_data:
-        return 0
-    
-    if section_key == 'general_info':
-        required_fields = [
-            'last_name', 'first_name', 'middle_name', 'age', 'sex', 'birthdate',
-            'purok', 'barangay', 'municipality', 'contact', 'email', 'philhealth_pin',
-            'member_type', 'registration_date', 'facility_choice1', 'facility_choice2', 
-            'facility_choice3', 'appointment_date'
-        ]
-    elif section_key == 'medical_history':
-        # Track all medical conditions and their specifications
-        base_fields = [
-            'past_allergy', 'past_asthma', 'past_cancer', 'past_cerebrovascular_disease',
-            'past_coronary_artery_disease', 'past_diabetes_mellitus', 'past_emphysema',
-            'past_epilepsy_seizure_disorder', 'past_hepatitis', 'past_hyperlipidemia',
-            'past_hypertension', 'past_peptic_ulcer', 'past_pneumonia', 'past_thyroid_disease',
-            'past_ptb', 'past_urinary_tract_infection', 'past_mental_illnesses', 'past_others',
-            # Family history fields
-            'fam_allergy', 'fam_asthma', 'fam_cancer', 'fam_cerebrovascular_disease',
-            'fam_coronary_artery_disease', 'fam_diabetes_mellitus', 'fam_emphysema',
-            'fam_epilepsy_seizure_disorder', 'fam_hepatitis', 'fam_hyperlipidemia',
-            'fam_hypertension', 'fam_peptic_ulcer', 'fam_pneumonia', 'fam_thyroid_disease',
-            'fam_ptb', 'fam_urinary_tract_infection', 'fam_mental_illnesses', 'fam_other',
-            # Social history fields
-            'smoking_status', 'alcohol_status', 'drugs_status', 'sexually_active_status',
-            # Physical exam fields
-            'height', 'weight', 'bp', 'temp', 'rr', 'blood_type'
-        ]
-        required_fields = base_fields
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from cohort_index import BARANGAY, CATEGORY_FIELDS, MONTH, get_cohort_index, months_between
+from draft_journal import AUTOSAVE_INTERVAL, get_draft_journal
+from exporter import FORMATS, export_chunks, export_filename, month_range
+from facility_directory import get_facility_directory
+from form_pdf import pdf_filename, render_pdf
+from form_record import new_form_data, plain_form_data
+from form_schema import Action, Field, Markdown, Section, get_schema
+from gazetteer import PLACE_CHILDREN, get_gazetteer
+from matching import find_likely_duplicates, normalize_pin
+from metrics import METRICS_PATH, get_metrics, timed
+from ncd_risk import score_patient
+from patient_lookup import PREFILL_FIELDS, find_returning_patient, remember_submission
+from progress_tracker import get_progress_tracker
+from rollups import UNANSWERED, dashboard_table, get_rollup_layout
+from submission_queue import FAILED, OFFLINE_MODE, RETRYING, SAVED, SENT, STATUS_POLL_INTERVAL, get_submission_queue
+from submission_store import get_store
+from sync_bundle import STATION_ID, BundleError, export_bundle, import_bundle, list_bundles
+
+def _widget_value(field: Field, value):
+    """Convert a raw widget value into what form_data stores"""
+    if field.kind == 'date':
+        return value.strftime('%Y-%m-%d')
+    return value
+
+def _record_change(key: str, name: str, data):
+    """Update the progress counters and the autosave journal for one field"""
+    with timed('progress', f"{key} update"):
+        get_progress_tracker().update(key, name, data)
+    get_draft_journal().mark_dirty(key, name)
+
+def _on_field_change(key: str, field: Field):
+    """Widget callback: store the new value and update the progress counters"""
+    data = st.session_state.form_data[key]
+    data[field.name] = _widget_value(field, st.session_state[field.widget_key])
+    if field.details and data[field.name] != field.show_details_when:
+        # Hidden detail widgets lose their state, so drop the stale values too
+        for detail in field.details:
+            if data.pop(detail.name, None) is not None:
+                get_draft_journal().mark_dirty(key, detail.name)
+    _record_change(key, field.name, data)
+
+def _restore_widget_state(field: Field, stored):
+    """Seed a widget's session state from the value kept in form_data"""
+    if field.kind == 'date':
+        stored = datetime.date.fromisoformat(stored)
+    elif field.options and stored not in field.options:
+        return
+    st.session_state[field.widget_key] = stored
+
+def render_field(field: Field, key: str):
+    """Render one schema field and store its value in the section's form data"""
+    data = st.session_state.form_data[key]
+    params = dict(field.params)
+    params['on_change'] = _on_field_change
+    params['args'] = (key, field)
+
+    # Widgets that were not rendered in the previous run (inactive wizard
+    # steps, prefilled records) have no state; restore it from form_data.
+    if field.widget_key not in st.session_state and field.name in data:
+        _restore_widget_state(field, data[field.name])
+
+    if field.kind == 'text':
+        value = st.text_input(field.label, key=field.widget_key, **params)
+    elif field.kind == 'place':
+        value = render_place_field(field, key, params)
+    elif field.kind == 'facility':
+        value = st.text_input(field.label, key=field.widget_key, **params)
+        render_facility_suggestions(field, key, value)
+    elif field.kind == 'number':
+        value = st.number_input(field.label, key=field.widget_key, **params)
+    elif field.kind == 'radio':
+        value = st.radio(field.label, field.options, key=field.widget_key, **params)
+    elif field.kind == 'selectbox':
+        value = st.selectbox(field.label, field.options, key=field.widget_key, **params)
+    elif field.kind == 'checkbox':
+        value = st.checkbox(field.label, key=field.widget_key, **params)
+    elif field.kind == 'date':
+        value = st.date_input(field.label, key=field.widget_key, **params)
     else:
-        return 0
-
-    filled_fields = 0
-    total_fields = len(required_fields)
-
-    # Count filled fields
-    for field in required_fields:
-        if field in section_data and section_data[field]:
-            # For boolean fields (checkboxes), count them if they're explicitly set
-            if isinstance(section_data[field], bool):
-                filled_fields += 1
-            # For other fields, count them if they have a value
-            elif section_data[field]:
-                filled_fields += 1
-        
-        # Check for specification fields if main field is checked
-        if field.startswith(('past_', 'fam_')) and field in section_data and section_data[field]:
-            spec_field = f"{field}_specify"
-            bp_field = f"{field}_bp"
-            fbs_field = f"{field}_fbs"
-            
-            if spec_field in section_data and section_data[spec_field]:
-                filled_fields += 1
-                total_fields += 1
-            elif bp_field in section_data and section_data[bp_field]:
-                filled_fields += 1
-                total_fields += 1
-            elif fbs_field in section_data and section_data[fbs_field]:
-                filled_fields += 1
-                total_fields += 1
-
-    percentage = (filled_fields / total_fields) * 100 if total_fields > 0 else 0
-    return round(percentage)
+        raise ValueError(f"Unknown field kind: {field.kind}")
+
+    value = _widget_value(field, value)
+    # Callbacks keep the counters current for user edits; this catches the
+    # widget defaults stored on first render.
+    if data.get(field.name) != value or field.name not in data:
+        data[field.name] = value
+        _record_change(key, field.name, data)
+    return value
+
+def _on_place_change(key: str, field: Field):
+    """Place callback: store the value and clear the places below it"""
+    _on_field_change(key, field)
+    data = st.session_state.form_data[key]
+    section = get_schema().section(key)
+    for name in PLACE_CHILDREN[field.name]:
+        st.session_state.pop(section.fields[name].widget_key, None)
+        if data.pop(name, None) is not None:
+            _record_change(key, name, data)
+
+def render_place_field(field: Field, key: str, params):
+    """Cascading gazetteer dropdown; unlisted places can still be typed in"""
+    gazetteer = get_gazetteer()
+    if not len(gazetteer):
+        return st.text_input(field.label, key=field.widget_key, **params)
+    data = st.session_state.form_data[key]
+    if field.name == 'municipality':
+        options = gazetteer.municipalities()
+    elif field.name == 'barangay':
+        options = gazetteer.barangays(data.get('municipality'))
+    else:
+        options = gazetteer.puroks(data.get('municipality'), data.get('barangay'))
+    params['on_change'] = _on_place_change
+    return st.selectbox(field.label, options, index=None, accept_new_options=True,
+                        placeholder="Choose or type a place", key=field.widget_key, **params)
+
+def _pick_facility(key: str, field: Field):
+    """Suggestion callback: copy the chosen facility into the text field"""
+    st.session_state[field.widget_key] = st.session_state[f"{field.widget_key}_suggestion"]
+    _on_field_change(key, field)
+
+def render_facility_suggestions(field: Field, key: str, value: str):
+    """Offer accredited facilities matching what was typed into a facility choice"""
+    directory = get_facility_directory()
+    if not value or not len(directory) or value in directory:
+        return
+    matches = directory.search(value)
+    if not matches:
+        st.caption("No accredited facility matches this entry")
+        return
+    st.selectbox("Matching accredited facilities", matches, index=None, placeholder="Pick a matching facility",
+                 key=f"{field.widget_key}_suggestion", on_change=_pick_facility, args=(key, field),
+                 label_visibility="collapsed")
+
+def render_items(items, key: str):
+    """Render a sequence of schema items (markdown, fields and column rows)"""
+    for item in items:
+        if isinstance(item, Markdown):
+            st.markdown(item.text, unsafe_allow_html=item.html)
+        elif isinstance(item, Action):
+            ACTIONS[item.name](key)
+        elif isinstance(item, Field):
+            value = render_field(item, key)
+            if item.details and value == item.show_details_when:
+                render_items(item.details, key)
+        else:
+            cols = st.columns(list(item.widths) if isinstance(item.widths, tuple) else item.widths)
+            open_details = []
+            for col, cell in zip(cols, item.cells):
+                with col:
+                    for cell_item in cell:
+                        if isinstance(cell_item, Markdown):
+                            st.markdown(cell_item.text, unsafe_allow_html=cell_item.html)
+                            continue
+                        value = render_field(cell_item, key)
+                        if cell_item.details and value == cell_item.show_details_when:
+                            open_details.extend(cell_item.details)
+            if open_details:
+                if item.details_column is not None:
+                    with cols[item.details_column]:
+                        render_items(open_details, key)
+                else:
+                    render_items(open_details, key)
+
+def apply_prefill(key: str, previous):
+    """Copy General Data (and optionally history) from a previous encounter"""
+    schema = get_schema()
+    copies = {key: [name for name in PREFILL_FIELDS if name in previous.get(key, {})]}
+    if st.session_state.get(f"{key}_prefill_history"):
+        history = previous.get('medical_history', {})
+        copies['medical_history'] = [name for name in history
+                                     if name.startswith(('past_', 'fam_', 'no_past_', 'no_family_'))]
+
+    for section_key, names in copies.items():
+        section = schema.section(section_key)
+        data = st.session_state.form_data[section_key]
+        for name in names:
+            data[name] = previous[section_key][name]
+            get_draft_journal().mark_dirty(section_key, name)
+            field = section.fields.get(name)
+            if field is not None:
+                # Drop the widget state so render_field restores it from form_data
+                st.session_state.pop(field.widget_key, None)
+        with timed('progress', f"{section_key} rescan"):
+            get_progress_tracker().rebuild(section_key, data)
+
+def render_returning_patient(key: str):
+    """Offer to prefill the form when the PIN belongs to a previous patient"""
+    previous = find_returning_patient(st.session_state.form_data[key].get('philhealth_pin'))
+    if not previous:
+        return
+    general = previous.get('general_info', {})
+    with st.container(border=True):
+        st.info(f"Returning patient: {general.get('last_name', '')}, {general.get('first_name', '')} "
+                f"(last registered {general.get('registration_date', 'unknown')})")
+        cols = st.columns([2, 1])
+        with cols[0]:
+            st.checkbox("Also copy past medical and family history", key=f"{key}_prefill_history")
+        with cols[1]:
+            if st.button("Prefill from last visit", key=f"{key}_prefill",
+                         on_click=apply_prefill, args=(key, previous)):
+                # Other sections are separate fragments; redraw them as well
+                st.rerun()
+
+def render_ncd_assessment(key: str):
+    """Live NCD risk screening from the vitals, habits and histories entered so far"""
+    form_data = st.session_state.form_data
+    with timed('render', 'ncd_assessment'):
+        assessment = score_patient(form_data)
+    # Derived answers: recomputed here and again on submit, so never journaled
+    form_data['ncd_assessment'].clear()
+    form_data['ncd_assessment'].update(assessment)
+    cols = st.columns(3)
+    with cols[0]:
+        st.metric("BMI", assessment['bmi'] or "—")
+        st.caption(assessment['bmi_category'] or "Enter height and weight")
+    with cols[1]:
+        bp = assessment['systolic'] and f"{assessment['systolic']:.0f}/{assessment['diastolic']:.0f}"
+        st.metric("BP (mmHg)", bp or "—")
+        st.caption(assessment['bp_category'] or "Enter BP as e.g. 120/80")
+    with cols[2]:
+        st.metric("NCD risk", assessment['risk_category'])
+        st.caption(f"{assessment['risk_score']} points")
+    if assessment['risk_factors']:
+        st.caption("Risk factors: " + ", ".join(assessment['risk_factors']))
+    if assessment['unanswered']:
+        st.caption("Not answered yet, so not scored: " + ", ".join(assessment['unanswered']))
+
+ACTIONS = {
+    'returning_patient': render_returning_patient,
+    'ncd_assessment': render_ncd_assessment,
+}
 
 def render_immunization_section(key):
     """Render immunization section without nested columns"""
-    st.markdown("##### IMMUNIZATION")
-    
-    st.markdown("**Children**")
-    # Instead of nesting columns, create a single row of columns
-    cols = st.columns(4)
-    
+    with timed('render', f"{key}/immunization"):
+        render_items(get_schema().immunization, key)
+
+def render_section_progress(slot, section_key: str):
+    """Redraw a section's progress bar from the stored counters"""
+    with timed('progress', section_key):
+        current_progress = get_progress_tracker().percent(section_key)
+        slot.progress(current_progress/100, text=f"Section Progress: {current_progress}%")
+
+def render_progress_summary(slot):
+    """Redraw the top-level completion summary from the stored counters"""
+    tracker = get_progress_tracker()
+    with timed('progress', 'summary'), slot.container():
+        overall = tracker.overall_percent()
+        st.progress(overall/100, text=f"Overall Progress: {overall:.1f}%")
+        cols = st.columns(len(get_schema().sections))
+        for col, section in zip(cols, get_schema().sections):
+            col.caption(f"{section.title}: {tracker.percent(section.key)}%")
+
+def _is_fragment_rerun() -> bool:
+    """True while Streamlit is rerunning only some fragments of the page"""
+    ctx = get_script_run_ctx()
+    return bool(ctx and ctx.fragment_ids_this_run)
+
+@st.fragment
+def tab_fragment(section_key: str, tab_index: int, progress_slot, summary_slot):
+    """Render one tab; widget changes inside it rerun only this tab"""
+    section = get_schema().section(section_key)
+    tab = section.tabs[tab_index]
+    with timed('render', f"{section_key}/{tab.title}"):
+        render_items(tab.items, section_key)
+        if tab.with_immunization:
+            render_immunization_section(section_key)
+    if _is_fragment_rerun():
+        render_section_progress(progress_slot, section_key)
+        render_progress_summary(summary_slot)
+
+def _set_step(step_key: str, title: str):
+    st.session_state[step_key] = title
+
+def render_wizard(section: Section, progress_slot, summary_slot):
+    """Render only the active tab of a section, one step at a time"""
+    titles = [tab.title for tab in section.tabs]
+    step_key = f"{section.key}_step"
+    step = st.radio("Step", titles, horizontal=True, key=step_key, label_visibility="collapsed")
+    tab_index = titles.index(step)
+
+    tab_fragment(section.key, tab_index, progress_slot, summary_slot)
+
+    cols = st.columns([1, 4, 1])
     with cols[0]:
-        bcg = st.checkbox("BCG", key=f"{key}_bcg")
-        dpt1 = st.checkbox("DPT1", key=f"{key}_dpt1")
-        hepa1 = st.checkbox("Hepa1", key=f"{key}_hepa1")
-        st.session_state.form_data[key].update({'bcg': bcg, 'dpt1': dpt1, 'hepa1': hepa1})
-    
-    with cols[1]:
-        opv1 = st.checkbox("OPV1", key=f"{key}_opv1")
-        dpt2 = st.checkbox("DPT2", key=f"{key}_dpt2")
-        hepa2 = st.checkbox("Hepa2", key=f"{key}_hepa2")
-        st.session_state.form_data[key].update({'opv1': opv1, 'dpt2': dpt2, 'hepa2': hepa2})
-
+        st.button("Previous", key=f"{step_key}_previous", disabled=tab_index == 0,
+                  on_click=_set_step, args=(step_key, titles[tab_index - 1]))
     with cols[2]:
-        opv2 = st.checkbox("OPV2", key=f"{key}_opv2")
-        dpt3 = st.checkbox("DPT3", key=f"{key}_dpt3")
-        hepa3 = st.checkbox("Hepa3", key=f"{key}_hepa3")
-        st.session_state.form_data[key].update({'opv2': opv2, 'dpt3': dpt3, 'hepa3': hepa3})
-
-    with cols[3]:
-        opv3 = st.checkbox("OPV3", key=f"{key}_opv3")
-        measles = st.checkbox("Measles", key=f"{key}_measles")
-        varicella = st.checkbox("Varicella", key=f"{key}_varicella")
-        st.session_state.form_data[key].update({'opv3': opv3, 'measles': measles, 'varicella': varicella})
-
-    st.markdown("**Adult**")
-    adult_cols = st.columns(3)
-    with adult_cols[0]:
-        hpv = st.checkbox("HPV", key=f"{key}_hpv")
-        st.session_state.form_data[key]['hpv'] = hpv
-    with adult_cols[1]:
-        mmr = st.checkbox("MMR", key=f"{key}_mmr")
-        st.session_state.form_data[key]['mmr'] = mmr
-    with adult_cols[2]:
-        none = st.checkbox("None", key=f"{key}_none")
-        st.session_state.form_data[key]['none'] = none
-
-    st.markdown("**Elderly and Immunocompromised**")
-    elderly_cols = st.columns(2)
-    with elderly_cols[0]:
-        pneumo = st.checkbox("Pneumococcal Vaccine", key=f"{key}_pneumococcal")
-        st.session_state.form_data[key]['pneumococcal'] = pneumo
-    with elderly_cols[1]:
-        flu = st.checkbox("Flu Vaccine", key=f"{key}_flu")
-        st.session_state.form_data[key]['flu'] = flu
-
-    others = st.text_input("Others:", key=f"{key}_immunization_others")
-    st.session_state.form_data[key]['immunization_others'] = others
+        st.button("Next", key=f"{step_key}_next", disabled=tab_index == len(titles) - 1,
+                  on_click=_set_step, args=(step_key, titles[min(tab_index + 1, len(titles) - 1)]))
+
+@st.fragment
+def section_fragment(section_key: str, summary_slot):
+    """Render one section; widget changes outside its tabs rerun only this section"""
+    section = get_schema().section(section_key)
+    current_progress = get_progress_tracker().percent(section_key)
+
+    with timed('render', section_key), st.expander(f"{section.title} - {current_progress}% Complete"):
+        progress_slot = st.empty()
+        st.markdown(section.heading, unsafe_allow_html=True)
+        render_items(section.items, section_key)
+
+        if section.tabs and st.session_state.get('wizard_mode'):
+            render_wizard(section, progress_slot, summary_slot)
+        elif section.tabs:
+            tabs = st.tabs([tab.title for tab in section.tabs])
+            for tab_index, tab_container in enumerate(tabs):
+                with tab_container:
+                    tab_fragment(section_key, tab_index, progress_slot, summary_slot)
+
+        render_section_progress(progress_slot, section_key)
+    if _is_fragment_rerun():
+        render_progress_summary(summary_slot)
+
+@st.fragment(run_every=AUTOSAVE_INTERVAL)
+def autosave_fragment():
+    """Periodically append this session's unsaved edits to its draft journal"""
+    get_draft_journal().flush(st.session_state.form_data)
+    ctx = get_script_run_ctx()
+    if ctx:
+        size = len(json.dumps(st.session_state.form_data, separators=(',', ':'), default=dict))
+        get_metrics().record_session_size(ctx.session_id, size)
+    get_metrics().export_prometheus()
+
+def _final_form_data() -> Dict[str, Any]:
+    """Canonicalise the address and PIN, score the NCD risk and return a plain copy of the form to store"""
+    general_info = st.session_state.form_data['general_info']
+    general_info.update(get_gazetteer().canonicalize(general_info))
+    if general_info.get('philhealth_pin'):
+        general_info['philhealth_pin'] = normalize_pin(general_info['philhealth_pin'])
+    st.session_state.form_data['ncd_assessment'].update(score_patient(st.session_state.form_data))
+    return plain_form_data(st.session_state.form_data)
+
+def _save_correction(ticket: str, submission_id: int):
+    """Button callback: store the form as it is now as the next version of a stored submission"""
+    overall = get_progress_tracker().overall_percent()
+    if overall < 80:
+        st.session_state[f"correction_error_{ticket}"] = (f"Please complete at least 80% of the form. "
+                                                          f"Current progress: {overall:.1f}%")
+        return
+    form_data = _final_form_data()
+    try:
+        new_id = get_submission_queue().amend(submission_id, form_data)
+    except KeyError:
+        st.session_state[f"correction_error_{ticket}"] = (f"Reference #{submission_id} was replaced elsewhere "
+                                                          "and cannot be corrected")
+        return
+    remember_submission(form_data)
+    st.session_state.setdefault('corrections', {})[ticket] = new_id
+
+def render_stored_submission(ticket: str, status: Dict[str, Any]):
+    """PDF download and correction button for a stored submission, following its later corrections"""
+    submission_id = st.session_state.get('corrections', {}).get(ticket, status['submission_id'])
+    record = get_store().get(submission_id)
+    if record is None:
+        # Replaced by a version that came in with a sync bundle
+        st.caption(f"Reference #{submission_id} has since been replaced by a newer version")
+        return
+    if submission_id != status['submission_id']:
+        st.caption(f"Corrected as reference #{submission_id}")
+    cols = st.columns(2)
+    cols[0].download_button("Printable form (PDF)", data=lambda record=record: render_pdf(record['form_data']),
+                            file_name=pdf_filename(record), mime='application/pdf', key=f"pdf_{ticket}")
+    cols[1].button("Save form changes as a correction", key=f"correct_{ticket}", on_click=_save_correction,
+                   args=(ticket, submission_id))
+    error = st.session_state.pop(f"correction_error_{ticket}", None)
+    if error:
+        st.error(error)
+
+@st.fragment(run_every=STATUS_POLL_INTERVAL)
+def submission_status_fragment():
+    """Report this session's queued submissions as the background worker stores and sends them"""
+    statuses = get_submission_queue().status(st.session_state.submissions)
+    for ticket in st.session_state.submissions:
+        status = statuses.get(ticket)
+        if status is None:
+            continue
+        reference = f"reference #{status['submission_id']}"
+        if status['state'] == FAILED:
+            st.error(status['error'] if status['submission_id'] is None else f"Saved as {reference}. {status['error']}")
+        elif status['state'] == RETRYING:
+            st.warning(f"Saved as {reference}; upstream unavailable, retry {status['attempts']} ({status['error']})")
+        elif status['state'] == SENT:
+            st.caption(f"Saved as {reference} and sent upstream")
+        elif status['state'] == SAVED and OFFLINE_MODE:
+            st.caption(f"Saved on this device as {reference}; it goes to the server with the next sync bundle")
+        elif status['state'] == SAVED:
+            st.caption(f"Saved as {reference}" + (", sending upstream..." if get_submission_queue().sink else ""))
+        else:
+            st.caption("Saving your assessment...")
+        if status['submission_id'] is not None:
+            render_stored_submission(ticket, status)
+        # The draft is kept until the queued copy is safely stored
+        stored = st.session_state.setdefault('stored_submissions', set())
+        if status['submission_id'] is not None and ticket not in stored:
+            stored.add(ticket)
+            get_draft_journal().discard()
+
+def _is_admin() -> bool:
+    """True when ?admin= matches KONSULTA_ADMIN_TOKEN; without a token there is no admin page"""
+    token = os.environ.get('KONSULTA_ADMIN_TOKEN')
+    return bool(token) and hmac.compare_digest(st.query_params.get('admin', ''), token)
+
+def render_metrics_page():
+    """Admin view of the hot-path timings and per-session form sizes"""
+    st.title("Konsulta Metrics")
+    metrics = get_metrics()
+    st.subheader("Render and progress timings")
+    st.caption("Slowest first by p90; quantiles cover the most recent samples, counts and totals the whole process")
+    st.dataframe([{'metric': row['metric'], 'part': row['label'], 'count': row['count'],
+                   **{name: round(row[name] * 1000, 2) for name in ('p50', 'p90', 'p99')},
+                   'total s': round(row['sum'], 2)} for row in metrics.summary()],
+                 column_config={name: st.column_config.NumberColumn(f"{name} ms") for name in ('p50', 'p90', 'p99')})
+    st.subheader("Session form_data size")
+    sizes = metrics.session_sizes()
+    st.dataframe([{'session': session_id[:8], 'bytes': size}
+                  for session_id, size in sorted(sizes.items(), key=lambda item: -item[1])])
+    st.caption(f"{len(sizes)} active sessions. Prometheus text file: {os.path.abspath(METRICS_PATH)}")
+    if st.button("Write Prometheus file now"):
+        metrics.export_prometheus(interval=0)
+    render_export_panel()
+
+def render_dashboard_page():
+    """Per-barangay indicators for supervisors, read from the precomputed rollups"""
+    st.title("Barangay Health Dashboard")
+    store = get_store()
+    if st.sidebar.button("Rebuild rollups", help="Recount every stored submission, e.g. after editing the database"):
+        with st.spinner("Rebuilding rollups..."):
+            counted = store.rebuild_rollups()
+        st.sidebar.success(f"Rebuilt rollups from {counted} submissions")
+    month = st.selectbox("Month", ["All months"] + store.rollup_months())
+    with timed('render', 'dashboard'):
+        table = dashboard_table(store.rollup_rows(None if month == "All months" else month), get_rollup_layout(),
+                                get_gazetteer())
+    st.caption("Completion is the average overall completion; the other columns are % of submissions")
+    st.dataframe(table, hide_index=True)
+
+# Outreach list columns, from General Data
+OUTREACH_FIELDS = ['last_name', 'first_name', 'middle_name', 'sex', 'age', 'purok', 'barangay', 'municipality',
+                   'contact', 'philhealth_pin', 'registration_date']
+COHORT_PAGE_SIZE = 200
+
+def _outreach_rows(records):
+    return [{'id': record['id'], **{name: record['form_data'].get('general_info', {}).get(name)
+                                    for name in OUTREACH_FIELDS}} for record in records]
+
+def _outreach_csv(ids) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, ['id'] + OUTREACH_FIELDS)
+    writer.writeheader()
+    for start in range(0, len(ids), 1000):
+        writer.writerows(_outreach_rows(get_store().find_by_ids(ids[start:start + 1000])))
+    return buffer.getvalue().encode('utf-8')
+
+def render_cohort_page():
+    """Outreach lists: each patient's latest submission matching every chosen answer"""
+    st.title("Cohort Search")
+    index = get_cohort_index()
+    with timed('render', 'cohort refresh'):
+        index.refresh(get_store())
+    flags = st.multiselect("Has all of", list(index.flags), format_func=index.flags.get,
+                           placeholder="Past or family conditions, immunizations")
+    schema = get_schema()
+    any_of = {}
+    cols = st.columns(4)
+    for i, (section_key, name) in enumerate(CATEGORY_FIELDS):
+        field = schema.section(section_key).fields[name]
+        label = field.label or name.replace('_', ' ').capitalize()
+        any_of[name] = cols[i % 4].multiselect(label, field.options + (UNANSWERED,), placeholder="Any")
+    gazetteer = get_gazetteer()
+    any_of[BARANGAY] = st.multiselect(
+        "Barangay", index.values(BARANGAY), placeholder="Any",
+        format_func=lambda place: f"{gazetteer.barangay_names.get(place[1], place[1]) or 'Unknown'}, "
+                                  f"{gazetteer.municipality_names.get(place[0], place[0]) or 'Unknown'}")
+    registered = st.date_input("Registered between", value=(), help="Matched by registration month")
+    if len(registered) == 2:
+        any_of[MONTH] = months_between(registered[0].isoformat(), registered[1].isoformat())
+
+    with timed('render', 'cohort search'):
+        cohort = index.search(flags, any_of)
+        size = len(cohort)
+        page = list(itertools.islice(cohort.descending(), COHORT_PAGE_SIZE))
+    st.subheader(f"{size} patients")
+    if not size:
+        return
+    st.caption(f"Newest first, showing {len(page)}")
+    st.dataframe(_outreach_rows(get_store().find_by_ids(page)), hide_index=True)
+    st.download_button("Download outreach list (CSV)", data=lambda: _outreach_csv(list(cohort.descending())),
+                       file_name="outreach.csv", mime='text/csv')
+
+def _sync_pending(store) -> int:
+    return store.count(after_id=int(store.sync_value('exported_through', '0')))
+
+def render_sync_page():
+    """Offline stations bundle their new records; the server merges the bundles they bring in"""
+    st.title("Offline Sync")
+    store = get_store()
+    st.subheader("Send from this station")
+    st.caption(f"Station {STATION_ID}: {_sync_pending(store)} records not in a bundle yet")
+    full = st.checkbox("Bundle every record", help="For a new server, or one that lost earlier bundles")
+    if st.button("Create sync bundle"):
+        header = export_bundle(store, full=full)
+        if header is None:
+            st.info("Nothing to sync: no records stored since the last bundle")
+        else:
+            st.success(f"Bundled {header['records']} records ({header['bytes'] / 1024:.1f} KiB)")
+    for path in list_bundles()[:10]:
+        # Bundles stay on disk so a copy lost on the way can be downloaded again
+        st.download_button(f"Download {os.path.basename(path)}", data=lambda path=path: pathlib.Path(path).read_bytes(),
+                           file_name=os.path.basename(path), mime='application/octet-stream', key=f"bundle_{path}")
+
+    st.subheader("Merge bundles into this server")
+    uploads = st.file_uploader("Sync bundles", type=['ksync'], accept_multiple_files=True)
+    if uploads and st.button("Merge bundles"):
+        results = []
+        for upload in uploads:
+            try:
+                counts = import_bundle(store, upload.getvalue())
+            except BundleError as exc:
+                st.error(f"{upload.name}: {exc}")
+                continue
+            if counts.get('missing'):
+                st.warning(f"{upload.name}: earlier bundles from {counts['station']} not merged yet: "
+                           f"{', '.join(map(str, counts['missing']))}")
+            results.append({'bundle': upload.name, **{name: value for name, value in counts.items()
+                                                      if name != 'missing'}})
+        if results:
+            st.dataframe(results, hide_index=True)
+
+def render_export_panel():
+    """Monthly export of stored submissions for PhilHealth reporting"""
+    st.subheader("Export submissions")
+    last_month = datetime.date.today().replace(day=1) - datetime.timedelta(days=1)
+    columns = st.columns(2)
+    month = columns[0].text_input("Registration month (YYYY-MM, blank for all)", value=last_month.strftime('%Y-%m'))
+    fmt = columns[1].radio("Format", list(FORMATS), horizontal=True)
+    try:
+        since, until = month_range(month) if month else (None, None)
+    except ValueError:
+        st.error("Enter the month as YYYY-MM")
+        return
+    if os.environ.get('KONSULTA_STREAMING_EXPORT'):
+        query = f"admin={st.query_params['admin']}" + (f"&month={month}" if month else "")
+        st.link_button(f"Download {fmt.upper()}", f"/export/{fmt}?{query}")
+    else:
+        # Served by `streamlit run`: the file is built in memory when clicked
+        st.download_button(f"Download {fmt.upper()}", file_name=export_filename(fmt, since, until),
+                           mime=FORMATS[fmt],
+                           data=lambda: b''.join(export_chunks(get_store(), fmt, get_schema(), since, until)))
+        st.caption("Serve the app with `uvicorn asgi:app` to stream large exports instead of building them in memory")
 
 def main():
     st.set_page_config(page_title="Health Assessment Tool", layout="wide")
-    
+    if _is_admin():
+        page = st.sidebar.radio("Admin page", ["Metrics", "Barangay dashboard", "Cohort search", "Offline sync"],
+                                key='admin_page')
+        if page == "Barangay dashboard":
+            render_dashboard_page()
+        elif page == "Cohort search":
+            render_cohort_page()
+        elif page == "Offline sync":
+            render_sync_page()
+        else:
+            render_metrics_page()
+        return
+
     if 'form_data' not in st.session_state:
-        st.session_state.form_data = {
-            'general_info': {},
-            'medical_history': {},
-            'social_history': {},
-            'immunization': {},
-            'physical_exam': {},
-            'ncd_assessment': {}
-        }
+        st.session_state.form_data = new_form_data()
+        # Resume a draft left behind by a dropped tab or a server restart
+        draft = get_draft_journal().load()
+        if draft:
+            for section_key, values in draft.items():
+                st.session_state.form_data.setdefault(section_key, {}).update(values)
+            tracker = get_progress_tracker()
+            for section in get_schema().sections:
+                tracker.rebuild(section.key, st.session_state.form_data[section.key])
+            st.toast("Restored your unsaved draft")
 
     st.title("Konsulta Health Assessment Tool")
-
-    sections = [
-        ("General Data and Konsulta Registration", 'general_info'),
-        ("Health Assessment Tool", 'medical_history')
-    ]
-
-    for title, key in sections:
-        current_progress = calculate_section_progress(st.session_state.form_data[key], key)
-        
-        with st.expander(f"{title} - {current_progress}% Complete"):
-            st.progress(current_progress/100)
-            
-            if key == 'general_info':
-                st.markdown("<h3 style='text-align: center;'>GENERAL DATA AND KONSULTA REGISTRATION</h3>", unsafe_allow_html=True)
-                
-                # Full Name
-                st.markdown("**FULL NAME**")
-                cols = st.columns([1, 1, 1])
-                with cols[0]:
-                    last_name = st.text_input("LAST", key=f"{key}_last_name", 
-                        value=st.session_state.form_data[key].get('last_name', ''))
-                    st.session_state.form_data[key]['last_name'] = last_name
-                with cols[1]:
-                    first_name = st.text_input("FIRST", key=f"{key}_first_name",
-                        value=st.session_state.form_data[key].get('first_name', ''))
-                    st.session_state.form_data[key]['first_name'] = first_name
-                with cols[2]:
-                    middle_name = st.text_input("MIDDLE", key=f"{key}_middle_name",
-                        value=st.session_state.form_data[key].get('middle_name', ''))
-                    st.session_state.form_data[key]['middle_name'] = middle_name
-
-                # Age and Sex and Birthdate in one line
-                cols = st.columns([1, 2, 2])
-                with cols[0]:
-                    st.markdown("**AGE**")
-                    age = st.number_input("", min_value=0, max_value=150, key=f"{key}_age",
-                        value=int(st.session_state.form_data[key].get('age', 0)))
-                    st.session_state.form_data[key]['age'] = age
-                with cols[1]:
-                    st.markdown("**SEX**")
-                    sex = st.radio("", ['F', 'M'], horizontal=True, key=f"{key}_sex",
-                        index=0 if st.session_state.form_data[key].get('sex', 'F') == 'F' else 1)
-                    st.session_state.form_data[key]['sex'] = sex
-                with cols[2]:
-                    st.markdown("**BIRTHDATE** (MM/DD/YYYY)")
-                    birthdate = st.date_input("", key=f"{key}_birthdate")
-                    st.session_state.form_data[key]['birthdate'] = birthdate.strftime('%Y-%m-%d')
-
-                # Address
-                st.markdown("**ADDRESS**")
-                cols = st.columns([1, 1, 1])
-                with cols[0]:
-                    purok = st.text_input("PUROK", key=f"{key}_purok",
-                        value=st.session_state.form_data[key].get('purok', ''))
-                    st.session_state.form_data[key]['purok'] = purok
-                with cols[1]:
-                    barangay = st.text_input("BARANGAY", key=f"{key}_barangay",
-                        value=st.session_state.form_data[key].get('barangay', ''))
-                    st.session_state.form_data[key]['barangay'] = barangay
-                with cols[2]:
-                    municipality = st.text_input("MUNICIPALITY", key=f"{key}_municipality",
-                        value=st.session_state.form_data[key].get('municipality', ''))
-                    st.session_state.form_data[key]['municipality'] = municipality
-
-                # Contact and Email
-                cols = st.columns([1, 1])
-                with cols[0]:
-                    contact = st.text_input("CONTACT #", key=f"{key}_contact",
-                        value=st.session_state.form_data[key].get('contact', ''))
-                    st.session_state.form_data[key]['contact'] = contact
-                with cols[1]:
-                    email = st.text_input("E-MAIL", key=f"{key}_email",
-                        value=st.session_state.form_data[key].get('email', ''))
-                    st.session_state.form_data[key]['email'] = email
-
-                # PhilHealth PIN
-                philhealth_pin = st.text_input("PHILHEALTH PIN", key=f"{key}_philhealth_pin",
-                    value=st.session_state.form_data[key].get('philhealth_pin', ''))
-                st.session_state.form_data[key]['philhealth_pin'] = philhealth_pin
-
-                # Member Type and Registration Date with KPP Sign
-                cols = st.columns([2, 2, 1])
-                with cols[0]:
-                    st.markdown("**MEMBER TYPE**")
-                    member_type = st.radio("", ['MEMBER', 'DEPENDENT'], key=f"{key}_member_type", horizontal=True,
-                        index=0 if st.session_state.form_data[key].get('member_type', 'MEMBER') == 'MEMBER' else 1)
-                    st.session_state.form_data[key]['member_type'] = member_type
-                    specify = st.text_input("Specify:", key=f"{key}_member_specify",
-                        value=st.session_state.form_data[key].get('member_specify', ''))
-                    st.session_state.form_data[key]['member_specify'] = specify
-                with cols[1]:
-                    st.markdown("**REGISTRATION DATE** (MM/DD/YYYY)")
-                    registration_date = st.date_input("", key=f"{key}_registration_date")
-                    st.session_state.form_data[key]['registration_date'] = registration_date.strftime('%Y-%m-%d')
-                with cols[2]:
-                    st.markdown("**KPP SIGN**")
-                    st.markdown("________")
-
-                # KONSULTA REGISTRATION header
-                st.markdown("""
-                    <div style='background-color: white; padding: 5px;'>
-                        <h4>KONSULTA REGISTRATION</h4>
-                    </div>
-                """, unsafe_allow_html=True)
-
-                # Preferred Facility
-                st.markdown("**PREFERRED FACILITY AND ADDRESS**")
-                
-                # Facility choices with checkboxes
-                for i in range(1, 4):
-                    cols = st.columns([4, 1])
-                    with cols[0]:
-                        facility = st.text_input(f"CHOICE {i}:", key=f"{key}_facility_choice{i}",
-                            value=st.session_state.form_data[key].get(f'facility_choice{i}', ''))
-                        st.session_state.form_data[key][f'facility_choice{i}'] = facility
-                    with cols[1]:
-                        choice_check = st.checkbox("", key=f"{key}_choice{i}_check",
-                            value=st.session_state.form_data[key].get(f'choice{i}_check', False))
-                        st.session_state.form_data[key][f'choice{i}_check'] = choice_check
-
-                # Authorization Transaction
-                st.markdown("**AUTHORIZATION TRANSACTION**")
-                cols = st.columns([1, 2, 2])
-                with cols[0]:
-                    atc = st.checkbox("AT CODE:", key=f"{key}_atc",
-                        value=st.session_state.form_data[key].get('atc', False))
-                    st.session_state.form_data[key]['atc'] = atc
-                with cols[1]:
-                    st.markdown("**DATE OF APPOINTMENT**")
-                    appointment_date = st.date_input("", key=f"{key}_appointment_date")
-                    st.session_state.form_data[key]['appointment_date'] = appointment_date.strftime('%Y-%m-%d')
-                with cols[2]:
-                    face_capture = st.checkbox("If no ATC, ☐ FACE CAPTURE", key=f"{key}_face_capture",
-                        value=st.session_state.form_data[key].get('face_capture', False))
-                    st.session_state.form_data[key]['face_capture'] = face_capture
-
-            elif key == 'medical_history':
-                st.markdown("<h3 style='text-align: center;'>HEALTH ASSESSMENT TOOL</h3>", unsafe_allow_html=True)
-                
-                tabs = st.tabs([
-                    "Medical History", "Family History", "Social History", 
-                    "Family Planning", "Menstrual History", "Pregnancy History",
-                    "Physical Examination", "Pediatric Assessment"
-                ])
-                
-                with tabs[0]:
-                    st.markdown("##### PAST MEDICAL HISTORY")
-                    conditions = {
-                        'Allergy': True,
-                        'Asthma': False,
-                        'Cancer': True,
-                        'Cerebrovascular Disease': False,
-                        'Coronary Artery Disease': False,
-                        'Diabetes Mellitus': False,
-                        'Emphysema': False,
-                        'Epilepsy / Seizure Disorder': False,
-                        'Hepatitis': True,
-                        'Hyperlipidemia': False,
-                        'Hypertension': True,
-                        'Peptic Ulcer': False,
-                        'Pneumonia': False,
-                        'Thyroid Disease': False,
-                        'PTB': True,
-                        'Urinary Tract Infection': False,
-                        'Mental Illnesses': False,
-                        'Others': True
-                    }
-
-                    for condition, needs_specify in conditions.items():
-                        cols = st.columns([1, 3])
-                        # Ensure unique keys by adding 'past_' prefix
-                        key_base = f"past_{condition.lower().replace(' ', '_').replace('/', '_')}"
-                        
-                        with cols[0]:
-                            selected = st.checkbox(condition, key=f"past_med_{key_base}")
-                            st.session_state.form_data[key][key_base] = selected
-                        
-                        with cols[1]:
-                            if needs_specify and selected:
-                                if condition == 'Hypertension':
-                                    bp_value = st.text_input("Highest BP (mmHg):", key=f"past_med_{key_base}_bp")
-                                    st.session_state.form_data[key][f"{key_base}_bp"] = bp_value
-                                elif condition == 'PTB':
-                                    extra_value = st.text_input("Specify Extra PTB:", key=f"past_med_{key_base}_extra")
-                                    st.session_state.form_data[key][f"{key_base}_extra"] = extra_value
-                                else:
-                                    spec_value = st.text_input("Specify:", key=f"past_med_{key_base}_specify")
-                                    st.session_state.form_data[key][f"{key_base}_specify"] = spec_value
-                    
-                    # Past Surgery
-                    st.markdown("**Past Surgery/ies Done:**")
-                    cols = st.columns([1, 1])
-                    with cols[0]:
-                        surgery = st.text_input("Surgery:", key=f"{key}_surgeries")
-                        st.session_state.form_data[key]['surgeries'] = surgery
-                    with cols[1]:
-                        date = st.text_input("Date Done:", key=f"{key}_surgery_date")
-                        st.session_state.form_data[key]['surgery_date'] = date
-
-                with tabs[1]:
-                    st.markdown("##### FAMILY HISTORY")
-                    family_conditions = {
-                        'Allergy': True,
-                        'Asthma': False,
-                        'Cancer': True,
-                        'Cerebrovascular Disease': False,
-                        'Coronary Artery Disease': False,
-                        'Diabetes Mellitus': True,
-                        'Emphysema': False,
-                        'Epilepsy / Seizure Disorder': False,
-                        'Hepatitis': True,
-                        'Hyperlipidemia': False,
-                        'Hypertension': True,
-                        'Peptic Ulcer': False,
-                        'Pneumonia': False,
-                        'Thyroid Disease': False,
-                        'PTB': True,
-                        'Urinary Tract Infection': False,
-                        'Mental Illnesses': False,
-                        'Other': True
-                    }
-
-                    for condition, needs_specify in family_conditions.items():
-                        cols = st.columns([1, 3])
-                        # Ensure unique keys by adding 'fam_' prefix and avoiding conflict with past medical history
-                        key_base = f"fam_{condition.lower().replace(' ', '_').replace('/', '_')}"
-                        
-                        with cols[0]:
-                            selected = st.checkbox(condition, key=f"family_hist_{key_base}")
-                            st.session_state.form_data[key][key_base] = selected
-                        
-                        with cols[1]:
-                            if needs_specify and selected:
-                                if condition == 'Diabetes Mellitus':
-                                    fbs = st.text_input("If yes, perform FBS:", key=f"family_hist_{key_base}_fbs")
-                                    st.session_state.form_data[key][f"{key_base}_fbs"] = fbs
-                                elif condition == 'Hypertension':
-                                    bp = st.text_input("Highest BP (mmHg):", key=f"family_hist_{key_base}_bp")
-                                    st.session_state.form_data[key][f"{key_base}_bp"] = bp
-                                else:
-                                    spec = st.text_input("Specify:", key=f"family_hist_{key_base}_specify")
-                                    st.session_state.form_data[key][f"{key_base}_specify"] = spec
-
-                with tabs[2]:
-                    st.markdown("##### PERSONAL/SOCIAL HISTORY")
-                    social_items = ['Smoking', 'Alcohol', 'Illicit Drugs', 'Sexually Active']
-                    
-                    for item in social_items:
-                        cols = st.columns([2, 2, 1])
-                        item_key = item.lower().replace(' ', '_')
-                        
-                        with cols[0]:
-                            st.markdown(f"**{item}**")
-                        with cols[1]:
-                            status = st.radio(
-                                f"{item} Status",
-                                ['Yes', 'No', 'Quit'],
-                                key=f"{key}_{item_key}_status",
-                                horizontal=True
-                            )
-                            st.session_state.form_data[key][f"{item_key}_status"] = status
-                        
-                        if status == 'Yes':
-                            if item == 'Smoking':
-                                pack_years = st.text_input("No. of pack-years:", key=f"{key}_pack_years")
-                                st.session_state.form_data[key]['pack_years'] = pack_years
-                            elif item == 'Alcohol':
-                                servings = st.text_input("No. of servings/day:", key=f"{key}_alcohol_servings")
-                                st.session_state.form_data[key]['alcohol_servings'] = servings
-
-                with tabs[3]:
-                    st.markdown("##### FAMILY PLANNING")
-                    counseling = st.checkbox("With access to family planning counseling", key=f"{key}_fp_counseling")
-                    st.session_state.form_data[key]['fp_counseling'] = counseling
-                    
-                    cols = st.columns(2)
-                    with cols[0]:
-                        provider = st.text_input("Provider:", key=f"{key}_fp_provider")
-                        st.session_state.form_data[key]['fp_provider'] = provider
-                    with cols[1]:
-                        method = st.text_input("Birth Control Method used:", key=f"{key}_birth_control")
-                        st.session_state.form_data[key]['birth_control'] = method
-
-                with tabs[4]:
-                    st.markdown("##### MENSTRUAL HISTORY")
-                    cols1 = st.columns(2)
-                    with cols1[0]:
-                        menarche = st.number_input("Menarche (years old):", min_value=0, max_value=100, key=f"{key}_menarche")
-                        st.session_state.form_data[key]['menarche'] = menarche
-                    with cols1[1]:
-                        onset = st.number_input("Onset of sexual intercourse (years old):", min_value=0, max_value=100, key=f"{key}_sexual_onset")
-                        st.session_state.form_data[key]['sexual_onset'] = onset
-
-                    cols2 = st.columns(2)
-                    with cols2[0]:
-                        last_period = st.date_input("Last Menstrual Period:", key=f"{key}_last_period")
-                        st.session_state.form_data[key]['last_period'] = last_period.strftime('%Y-%m-%d')
-                    with cols2[1]:
-                        duration = st.number_input("Period Duration (days):", min_value=0, max_value=30, key=f"{key}_period_duration")
-                        st.session_state.form_data[key]['period_duration'] = duration
-
-                    cols3 = st.columns(2)
-                    with cols3[0]:
-                        interval = st.number_input("Interval cycle (days):", min_value=0, max_value=100, key=f"{key}_interval_cycle")
-                        st.session_state.form_data[key]['interval_cycle'] = interval
-                    with cols3[1]:
-                        menopause = st.radio("Menopause:", ["Yes", "No"], horizontal=True, key=f"{key}_menopause")
-                        st.session_state.form_data[key]['menopause'] = menopause
-
-                with tabs[5]:
-                    st.markdown("##### PREGNANCY HISTORY")
-                    st.text_input("G___ P___ A___ L___", key=f"{key}_pregnancy_history",
-                        help="G=Gravida, P=Para, A=Abortion, L=Living children")
-                    
-                    cols = st.columns(2)
-                    with cols[0]:
-                        delivery_type = st.text_input("Type of Delivery:", key=f"{key}_delivery_type")
-                        st.session_state.form_data[key]['delivery_type'] = delivery_type
-                    with cols[1]:
-                        induced_htn = st.radio("Pregnancy Induced Hypertension:", ["Yes", "No"], 
-                            horizontal=True, key=f"{key}_induced_htn")
-                        st.session_state.form_data[key]['induced_htn'] = induced_htn
-
-                with tabs[6]:
-                    st.markdown("##### PERTINENT PHYSICAL EXAMINATION FINDINGS")
-                    
-                    # Vital Signs
-                    st.markdown("**Vital Signs**")
-                    cols1 = st.columns(4)
-                    with cols1[0]:
-                        height = st.number_input("Height (cm):", min_value=0.0, key=f"{key}_height")
-                        st.session_state.form_data[key]['height'] = height
-                    with cols1[1]:
-                        weight = st.number_input("Weight (kg):", min_value=0.0, key=f"{key}_weight")
-                        st.session_state.form_data[key]['weight'] = weight
-                    with cols1[2]:
-                        bp = st.text_input("BP (mmHg):", key=f"{key}_bp")
-                        st.session_state.form_data[key]['bp'] = bp
-                    with cols1[3]:
-                        temp = st.number_input("Temp (°C):", min_value=35.0, max_value=42.0, key=f"{key}_temp")
-                        st.session_state.form_data[key]['temp'] = temp
-
-                    cols2 = st.columns(2)
-                    with cols2[0]:
-                        rr = st.number_input("RR (cpm):", min_value=0, key=f"{key}_rr")
-                        st.session_state.form_data[key]['rr'] = rr
-                    with cols2[1]:
-                        st.markdown("**Blood Type**")
-                        blood_options = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
-                        blood_type = st.selectbox("", blood_options, key=f"{key}_blood_type")
-                        st.session_state.form_data[key]['blood_type'] = blood_type
-
-                    # Visual Acuity
-                    st.markdown("**Visual Acuity**")
-                    cols3 = st.columns(2)
-                    with cols3[0]:
-                        right_eye = st.text_input("Right Eye:", key=f"{key}_right_eye")
-                        st.session_state.form_data[key]['right_eye'] = right_eye
-                    with cols3[1]:
-                        left_eye = st.text_input("Left Eye:", key=f"{key}_left_eye")
-                        st.session_state.form_data[key]['left_eye'] = left_eye
-
-                with tabs[7]:
-                    st.markdown("##### PEDIA CLIENT AGED 0-24 MOS")
-                    measurements = [
-                        "Body Length", "Head Circumference", "Chest Circumference",
-                        "Abdominal Circumference", "Hip Circumference",
-                        "Mid-Upper Arm Circumference", "Limbs Circumference"
-                    ]
-                    
-                    for measurement in measurements:
-                        cols = st.columns([3, 1])
-                        field_key = measurement.lower().replace(' ', '_').replace('-', '_')
-                        
-                        with cols[0]:
-                            value = st.number_input(f"{measurement} (cm):", 
-                                min_value=0.0, key=f"{key}_{field_key}")
-                            st.session_state.form_data[key][field_key] = value
-                    
-                    for condition, needs_specify in conditions.items():
-                        cols = st.columns([1, 3])
-                        condition_key = condition.lower().replace(' ', '_').replace('/', '_')
-                        
-                        with cols[0]:
-                            selected = st.checkbox(condition, key=f"{key}_{condition_key}")
-                            st.session_state.form_data[key][condition_key] = selected
-                        
-                        with cols[1]:
-                            if needs_specify and selected:
-                                if condition == 'Hypertension':
-                                    bp_value = st.text_input("Highest BP (mmHg):", key=f"{key}_{condition_key}_bp")
-                                    st.session_state.form_data[key][f"{condition_key}_bp"] = bp_value
-                                elif condition == 'PTB':
-                                    extra_value = st.text_input("Specify Extra PTB:", key=f"{key}_{condition_key}_extra")
-                                    st.session_state.form_data[key][f"{condition_key}_extra"] = extra_value
-                                else:
-                                    spec_value = st.text_input("Specify:", key=f"{key}_{condition_key}_specify")
-                                    st.session_state.form_data[key][f"{condition_key}_specify"] = spec_value
-
-                with tabs[3]:
-                    render_immunization_section(key)
-
-            st.caption(f"Section Progress: {current_progress}%")
-
+    st.sidebar.toggle("Step-by-step Health Assessment", key='wizard_mode',
+                      help="Show one Health Assessment tab at a time; hidden steps keep their answers")
+    if OFFLINE_MODE:
+        st.sidebar.caption(f"Offline mode: {_sync_pending(get_store())} submissions on this device wait for the "
+                           f"next sync bundle")
+
+    # Sections and tabs are fragments: editing a field reruns only the part
+    # of the form it belongs to, and each fragment refreshes this summary.
+    summary_slot = st.empty()
+    for section in get_schema().sections:
+        section_fragment(section.key, summary_slot)
+    render_progress_summary(summary_slot)
+    autosave_fragment()
+
+    tracker = get_progress_tracker()
     if st.button("Submit Assessment", type="primary"):
-        overall_progress = sum(calculate_section_progress(st.session_state.form_data[key]) 
-                             for key in st.session_state.form_data.keys()) / len(st.session_state.form_data)
+        overall_progress = tracker.overall_percent()
         if overall_progress < 80:
             st.error(f"Please complete at least 80% of the form. Current progress: {overall_progress:.1f}%")
         else:
-            st.success(f"Assessment submitted successfully! Overall completion: {overall_progress:.1f}%")
+            form_data = _final_form_data()
+            duplicates = find_likely_duplicates(form_data['general_info'], get_store())
+            try:
+                ticket = get_submission_queue().submit(form_data)
+            except queue.Full:
+                st.error("The server is busy saving other assessments. Please press Submit again in a moment.")
+                duplicates = []
+            else:
+                remember_submission(form_data)
+                st.session_state.setdefault('submissions', []).append(ticket)
+                st.success(f"Assessment submitted successfully! Overall completion: {overall_progress:.1f}%")
+            if duplicates:
+                lines = [f"- #{match['id']}: {match['last_name']}, {match['first_name']} {match['middle_name'] or ''} "
+                         f"born {match['birthdate']}, {match['barangay'] or 'no barangay'}, "
+                         f"PIN {match['philhealth_pin'] or 'none'} (score {match['score']:.2f})"
+                         for match in duplicates]
+                st.warning("Possible duplicate registration, please review:\n" + "\n".join(lines))
+    if st.session_state.get('submissions'):
+        submission_status_fragment()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,301 @@
+"""Background persistence and upstream transmission of submissions.
+
+Pressing Submit Assessment only enqueues the form (``SubmissionQueue.submit``)
+and gets a ticket back. A writer thread drains the bounded intake queue in
+batches and stores each batch in one SQLite transaction; sender threads then
+hand the stored batches to the upstream sink, retrying transient failures
+with exponential backoff. Sessions poll ``status`` with their tickets.
+Corrections (``amend``) are stored at once and sent upstream the same way.
+
+A sink is any object with ``send(batch)`` that raises on failure. ``HttpSink``
+POSTs JSON batches to an eKonsulta-style endpoint over a small pool of
+keep-alive connections; without KONSULTA_UPSTREAM_URL there is no sink and
+submissions are final once stored. Every item carries its local reference
+so the endpoint can drop a batch it already accepted before a retry. With
+KONSULTA_OFFLINE set nothing is sent either: the station's submissions reach
+the server in sync bundles (see ``sync_bundle``).
+
+The intake queue lives in memory: submissions still in it when the process
+dies are lost, which is why a session's draft is only discarded once its
+submission is stored. Stored submissions wait in the store's outbox, written
+in the same transaction, until the sink accepts them; the queue resends
+whatever is left there when it starts, including batches that ran out of
+attempts.
+"""
+import http.client
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Protocol
+
+import streamlit as st
+
+from submission_store import SubmissionStore, get_store
+
+UPSTREAM_URL = os.environ.get('KONSULTA_UPSTREAM_URL')
+UPSTREAM_TOKEN = os.environ.get('KONSULTA_UPSTREAM_TOKEN')
+OFFLINE_MODE = bool(os.environ.get('KONSULTA_OFFLINE'))
+
+QUEUE_SIZE = 1000
+BATCH_SIZE = 50
+# How long the writer waits for more submissions to join a batch
+BATCH_WINDOW = 0.05
+# How long submit waits for room in a full queue before giving up
+SUBMIT_TIMEOUT = 2.0
+SENDERS = 2
+HTTP_TIMEOUT = 10.0
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+# How often a session refreshes the status of its submissions
+STATUS_POLL_INTERVAL = 2.0
+# Finished tickets are forgotten after this long
+STATUS_TTL = 3600.0
+
+QUEUED, SAVED, RETRYING, SENT, FAILED = 'queued', 'saved', 'retrying', 'sent', 'failed'
+
+
+class UpstreamError(Exception):
+    """A batch the sink could not deliver; ``retryable`` failures are sent again"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class Sink(Protocol):
+    def send(self, batch: List[Dict[str, Any]]): ...
+
+
+class HttpSink:
+    """POST batches as ``{"submissions": [...]}`` over pooled keep-alive connections"""
+
+    def __init__(self, url: str, pool_size: int = SENDERS, timeout: float = HTTP_TIMEOUT,
+                 headers: Optional[Dict[str, str]] = None):
+        parts = urllib.parse.urlsplit(url)
+        self._connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self._host = parts.netloc
+        self._path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        self._timeout = timeout
+        self._headers = {'Content-Type': 'application/json', **(headers or {})}
+        self._idle: 'queue.LifoQueue[http.client.HTTPConnection]' = queue.LifoQueue(pool_size)
+        self.connections_opened = 0
+
+    def _acquire(self) -> http.client.HTTPConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            self.connections_opened += 1
+            return self._connection_class(self._host, timeout=self._timeout)
+
+    def _release(self, connection: http.client.HTTPConnection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def send(self, batch: List[Dict[str, Any]]):
+        body = json.dumps({'submissions': batch}, separators=(',', ':')).encode('utf-8')
+        connection = self._acquire()
+        try:
+            connection.request('POST', self._path, body, self._headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as exc:
+            # Also covers an idle connection the server has since closed
+            connection.close()
+            raise UpstreamError(f"{type(exc).__name__}: {exc}") from exc
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+        if not 200 <= response.status < 300:
+            raise UpstreamError(f"HTTP {response.status} {response.reason}",
+                                retryable=response.status == 429 or response.status >= 500)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class SubmissionQueue:
+    """Bounded intake queue, a batching writer thread and upstream sender threads"""
+
+    def __init__(self, store: SubmissionStore, sink: Optional[Sink] = None, queue_size: int = QUEUE_SIZE,
+                 batch_size: int = BATCH_SIZE, senders: int = SENDERS):
+        self.store = store
+        self.sink = sink
+        self.batch_size = batch_size
+        self._intake: 'queue.Queue[tuple]' = queue.Queue(queue_size)
+        self._outbox: 'queue.Queue[List[Dict[str, Any]]]' = queue.Queue()
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._unfinished = 0
+        self._idle = threading.Condition()
+        self._stopping = threading.Event()
+        self.counters = {'batches': 0, 'sent_batches': 0, 'retries': 0, 'failed': 0, 'resent': 0}
+        if sink is not None:
+            self._resend_unsent()
+        self._threads = [threading.Thread(target=self._write_loop, name='submission-writer', daemon=True)]
+        if sink is not None:
+            self._threads += [threading.Thread(target=self._send_loop, name=f'submission-sender-{i}', daemon=True)
+                              for i in range(senders)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, form_data: Dict[str, Any], timeout: float = SUBMIT_TIMEOUT) -> str:
+        """Enqueue a plain form_data copy and return its ticket; raises ``queue.Full``"""
+        ticket = uuid.uuid4().hex
+        with self._idle:
+            self._forget_finished()
+            self._status[ticket] = {'state': QUEUED, 'submission_id': None, 'attempts': 0, 'error': None,
+                                    'updated': time.monotonic()}
+            self._unfinished += 1
+        try:
+            self._intake.put((ticket, form_data), timeout=timeout)
+        except queue.Full:
+            with self._idle:
+                del self._status[ticket]
+                self._finish(1)
+            raise
+        return ticket
+
+    def amend(self, submission_id: int, form_data: Dict[str, Any]) -> int:
+        """Store a correction of a stored submission now and queue it upstream; returns the new id"""
+        new_id = self.store.amend(submission_id, form_data, outbox=self.sink is not None)
+        if self.sink is not None:
+            self._outbox.put([{'reference': new_id, 'ticket': None, 'form_data': form_data}])
+        return new_id
+
+    def status(self, tickets: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        with self._idle:
+            return {ticket: dict(self._status[ticket]) for ticket in tickets if ticket in self._status}
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every submitted ticket is sent, failed, or stored when there is no sink"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        self.join(timeout)
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _resend_unsent(self):
+        """Queue the stored submissions an earlier process did not get upstream; they have no tickets"""
+        for records in self.store.iter_unsent(self.batch_size):
+            self._outbox.put([{'reference': record['id'], 'ticket': None, 'form_data': record['form_data']}
+                              for record in records])
+            self.counters['resent'] += len(records)
+
+    def _update(self, tickets: Iterable[str], **changes):
+        now = time.monotonic()
+        with self._idle:
+            for ticket in tickets:
+                self._status[ticket].update(changes, updated=now)
+
+    def _finish(self, count: int):
+        # Called with self._idle held
+        self._unfinished -= count
+        if self._unfinished == 0:
+            self._idle.notify_all()
+
+    def _forget_finished(self):
+        cutoff = time.monotonic() - STATUS_TTL
+        final = (SENT, FAILED) if self.sink is not None else (SAVED, FAILED)
+        for ticket in [t for t, s in self._status.items() if s['updated'] < cutoff and s['state'] in final]:
+            del self._status[ticket]
+
+    def _next_batch(self) -> List[tuple]:
+        try:
+            batch = [self._intake.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + BATCH_WINDOW
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._intake.get(timeout=remaining) if remaining > 0 else self._intake.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_loop(self):
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            tickets = [ticket for ticket, _ in batch]
+            try:
+                submission_ids = self.store.insert_many((form_data for _, form_data in batch),
+                                                        outbox=self.sink is not None)
+            except Exception as exc:
+                self._update(tickets, state=FAILED, error=f"Could not save: {exc}")
+                with self._idle:
+                    self.counters['failed'] += len(tickets)
+                    self._finish(len(tickets))
+                continue
+            with self._idle:
+                self.counters['batches'] += 1
+                for ticket, submission_id in zip(tickets, submission_ids):
+                    self._status[ticket].update(state=SAVED, submission_id=submission_id, updated=time.monotonic())
+                if self.sink is None:
+                    self._finish(len(tickets))
+            if self.sink is not None:
+                self._outbox.put([{'reference': submission_id, 'ticket': ticket, 'form_data': form_data}
+                                  for (ticket, form_data), submission_id in zip(batch, submission_ids)])
+
+    def _send_loop(self):
+        while not self._stopping.is_set():
+            try:
+                batch = self._outbox.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            tickets = [item['ticket'] for item in batch if item['ticket'] is not None]
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                try:
+                    self.sink.send(batch)
+                except Exception as exc:
+                    # Anything but an UpstreamError is a bug in the sink: fail the batch, keep the sender
+                    if isinstance(exc, UpstreamError) and exc.retryable and attempt < MAX_ATTEMPTS:
+                        self._update(tickets, state=RETRYING, attempts=attempt, error=str(exc))
+                        with self._idle:
+                            self.counters['retries'] += 1
+                        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+                        # Full jitter keeps the senders from retrying in lockstep
+                        self._stopping.wait(random.uniform(0, delay))
+                        continue
+                    # The batch stays in the outbox and is sent again after a restart
+                    self._update(tickets, state=FAILED, attempts=attempt, error=f"Not sent upstream: {exc}")
+                    with self._idle:
+                        self.counters['failed'] += len(tickets)
+                        self._finish(len(tickets))
+                    break
+                try:
+                    self.store.mark_sent([item['reference'] for item in batch])
+                except Exception:
+                    # Left in the outbox it is sent again after a restart, and the endpoint drops it by reference
+                    pass
+                self._update(tickets, state=SENT, attempts=attempt, error=None)
+                with self._idle:
+                    self.counters['sent_batches'] += 1
+                    self._finish(len(tickets))
+                break
+
+
+@st.cache_resource
+def get_submission_queue() -> SubmissionQueue:
+    """Return the process-wide queue, sending upstream when KONSULTA_UPSTREAM_URL is set and not offline"""
+    sink = None
+    if UPSTREAM_URL and not OFFLINE_MODE:
+        headers = {'Authorization': f"Bearer {UPSTREAM_TOKEN}"} if UPSTREAM_TOKEN else None
+        sink = HttpSink(UPSTREAM_URL, headers=headers)
+    return SubmissionQueue(get_store(), sink)
@@ -0,0 +1,597 @@
+"""SQLite persistence for submitted assessments.
+
+Each submission stores the full ``form_data`` as JSON plus a few denormalised
+General Data columns that carry the lookup indexes. The database runs in WAL
+mode so readers never block the writer, and one connection is shared by all
+sessions of the process (see ``get_store``).
+
+Every record also has a ``record_uuid`` that identifies it across stores and
+a ``version``. Rows are never updated in place: a newer version of a record
+is stored as a new row and the old row is deleted in the same transaction
+(see ``amend``), so ids only grow and "changed since id N" is a primary key
+range. The ``superseded`` table remembers which rows were replaced.
+"""
+import collections
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import streamlit as st
+
+from matching import blocking_keys, normalize_pin
+from rollups import RollupKey, rollup_deltas
+
+DEFAULT_DB_PATH = os.environ.get('KONSULTA_DB_PATH', 'konsulta.db')
+
+# General Data keys copied into their own columns for indexed lookups
+INDEXED_FIELDS = [
+    'philhealth_pin', 'last_name', 'first_name', 'middle_name', 'birthdate',
+    'barangay', 'municipality', 'registration_date',
+    'purok', 'municipality_code', 'barangay_code', 'purok_code'
+]
+# Columns that identify a record and its version across stores
+SYNC_COLUMNS = {'record_uuid': 'TEXT', 'version': 'INTEGER NOT NULL DEFAULT 1', 'updated_at': 'TEXT'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    submitted_at TEXT NOT NULL,
+    philhealth_pin TEXT,
+    last_name TEXT,
+    first_name TEXT,
+    middle_name TEXT,
+    birthdate TEXT,
+    barangay TEXT,
+    municipality TEXT,
+    registration_date TEXT,
+    purok TEXT,
+    municipality_code TEXT,
+    barangay_code TEXT,
+    purok_code TEXT,
+    record_uuid TEXT,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_submissions_pin ON submissions (philhealth_pin);
+CREATE INDEX IF NOT EXISTS idx_submissions_name ON submissions (last_name, birthdate);
+CREATE INDEX IF NOT EXISTS idx_submissions_address ON submissions (barangay, municipality);
+CREATE INDEX IF NOT EXISTS idx_submissions_registration ON submissions (registration_date);
+CREATE TABLE IF NOT EXISTS patient_blocks (
+    block_key TEXT NOT NULL,
+    submission_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_patient_blocks_key ON patient_blocks (block_key, submission_id);
+CREATE TABLE IF NOT EXISTS ncd_scores (
+    submission_id INTEGER PRIMARY KEY,
+    bmi REAL,
+    bmi_category TEXT,
+    systolic INTEGER,
+    diastolic INTEGER,
+    bp_category TEXT,
+    risk_score INTEGER NOT NULL,
+    risk_category TEXT NOT NULL,
+    scored_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    month TEXT NOT NULL,
+    municipality TEXT NOT NULL,
+    barangay TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (month, municipality, barangay, metric)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS superseded (
+    submission_id INTEGER PRIMARY KEY,
+    superseded_by INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_superseded_by ON superseded (superseded_by);
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_bundles (
+    checksum TEXT PRIMARY KEY,
+    station TEXT NOT NULL,
+    sequence INTEGER NOT NULL,
+    records INTEGER NOT NULL,
+    imported_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    submission_id INTEGER PRIMARY KEY
+);
+"""
+
+# Created after ``_add_missing_columns`` so databases from before the
+# gazetteer gain the columns first
+PLACE_INDEX = "CREATE INDEX IF NOT EXISTS idx_submissions_place ON submissions (municipality_code, barangay_code)"
+RECORD_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS idx_submissions_record ON submissions (record_uuid)"
+
+CANDIDATE_COLUMNS = ['id'] + INDEXED_FIELDS
+
+# The date a submission counts for in reports: its registration date, or the day it was stored without one
+REGISTERED_ON = ("(CASE WHEN registration_date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]*' THEN registration_date "
+                 "ELSE substr(submitted_at, 1, 10) END)")
+
+Prepared = Tuple[tuple, List[str], Tuple[RollupKey, Dict[str, float]]]
+
+
+def _row_values(form_data: Dict[str, Any], submitted_at: str, record_uuid: str, version: int,
+                updated_at: str) -> tuple:
+    general = form_data.get('general_info', {})
+    general = {**general, 'philhealth_pin': normalize_pin(general.get('philhealth_pin'))}
+    indexed = tuple((general.get(name) or None) for name in INDEXED_FIELDS)
+    return ((submitted_at,) + indexed + (record_uuid, version, updated_at)
+            + (json.dumps(form_data, separators=(',', ':')),))
+
+
+def prepare_submission(form_data: Dict[str, Any], submitted_at: str, record_uuid: Optional[str] = None,
+                       version: int = 1, updated_at: Optional[str] = None) -> Prepared:
+    """Row values, blocking keys and rollup deltas of a submission, computed outside the store lock (or process)"""
+    row = _row_values(form_data, submitted_at, record_uuid or uuid.uuid4().hex, version, updated_at or submitted_at)
+    return row, blocking_keys(form_data.get('general_info', {})), rollup_deltas(form_data, submitted_at)
+
+
+def _sum_rollups(rollups: Iterable[Tuple[RollupKey, Dict[str, float]]],
+                 totals: Optional[Dict[tuple, float]] = None) -> Dict[tuple, float]:
+    """Rollup deltas summed per (month, municipality, barangay, metric), added to ``totals`` when given"""
+    totals = collections.defaultdict(float) if totals is None else totals
+    for key, values in rollups:
+        for metric, value in values.items():
+            totals[key + (metric,)] += value
+    return totals
+
+
+def _to_record(row: sqlite3.Row) -> Dict[str, Any]:
+    return {'id': row['id'], 'submitted_at': row['submitted_at'], 'form_data': json.loads(row['data'])}
+
+
+class SubmissionStore:
+    """Thread-safe wrapper around a single SQLite connection"""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._add_missing_columns()
+        self._conn.execute(PLACE_INDEX)
+        self._conn.execute(RECORD_INDEX)
+        self._normalize_pins()
+        self._backfill_blocks()
+        self._backfill_rollups()
+
+    def _add_missing_columns(self):
+        """Add indexed and sync columns introduced after the table was created"""
+        existing = {row['name'] for row in self._conn.execute("PRAGMA table_info(submissions)")}
+        for name in INDEXED_FIELDS:
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE submissions ADD COLUMN {name} TEXT")
+        for name, definition in SYNC_COLUMNS.items():
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE submissions ADD COLUMN {name} {definition}")
+        if 'record_uuid' not in existing:
+            self._conn.execute("UPDATE submissions SET record_uuid = lower(hex(randomblob(16))), "
+                               "updated_at = submitted_at")
+
+    def _normalize_pins(self):
+        """Strip the separators from PINs stored as typed, before PINs were normalised"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("UPDATE submissions SET philhealth_pin = replace(replace(philhealth_pin, '-', ''), "
+                               "' ', '') WHERE philhealth_pin GLOB '*[- ]*'")
+            self._conn.execute("UPDATE patient_blocks SET block_key = replace(replace(block_key, '-', ''), ' ', '') "
+                               "WHERE block_key >= 'pin:' AND block_key < 'pin;' AND block_key GLOB '*[- ]*'")
+            self._conn.execute("COMMIT")
+
+    def _backfill_blocks(self):
+        """Index submissions stored before the block table existed"""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM patient_blocks LIMIT 1").fetchone():
+                return
+            rows = self._conn.execute(f"SELECT {', '.join(CANDIDATE_COLUMNS)} FROM submissions").fetchall()
+            if not rows:
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany("INSERT INTO patient_blocks (block_key, submission_id) VALUES (?, ?)",
+                                   [(block_key, row['id']) for row in rows for block_key in blocking_keys(dict(row))])
+            self._conn.execute("COMMIT")
+
+    def _backfill_rollups(self):
+        """Aggregate submissions stored before the rollup table existed"""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM rollups LIMIT 1").fetchone():
+                return
+            if not self._conn.execute("SELECT 1 FROM submissions LIMIT 1").fetchone():
+                return
+        self.rebuild_rollups()
+
+    def insert(self, form_data: Dict[str, Any]) -> int:
+        """Store one submission and return its id"""
+        return self.insert_many([form_data])[0]
+
+    def insert_many(self, submissions: Iterable[Dict[str, Any]], outbox: bool = False) -> List[int]:
+        """Store a batch of submissions in a single transaction, also in the upstream outbox when ``outbox``"""
+        submitted_at = datetime.datetime.now().isoformat(timespec='seconds')
+        return self.insert_prepared([prepare_submission(form_data, submitted_at) for form_data in submissions],
+                                    outbox=outbox)
+
+    def insert_prepared(self, prepared: List[Prepared], replaces: Sequence[Optional[int]] = (),
+                        outbox: bool = False) -> List[int]:
+        """Store submissions from ``prepare_submission`` in a single transaction
+
+        ``replaces`` gives, per submission, the id of the older version of
+        the same record that it supersedes, or None; raises ``KeyError``,
+        storing nothing, when one of those is no longer stored. With
+        ``outbox`` the new ids also wait in the outbox until ``mark_sent``.
+        """
+        if not prepared:
+            return []
+        columns = ['id', 'submitted_at'] + INDEXED_FIELDS + list(SYNC_COLUMNS) + ['data']
+        placeholders = ', '.join('?' * len(columns))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Numbered before the superseded rows go, so an id is never handed out twice
+                first_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM submissions").fetchone()[0]
+                retired = [(old_id, first_id + offset) for offset, old_id in enumerate(replaces) if old_id is not None]
+                if retired:
+                    self._retire(retired)
+                self._conn.executemany(f"INSERT INTO submissions ({', '.join(columns)}) VALUES ({placeholders})",
+                                       [(first_id + offset,) + row for offset, (row, _, _) in enumerate(prepared)])
+                blocks = [(block_key, first_id + offset)
+                          for offset, (_, block_keys, _) in enumerate(prepared)
+                          for block_key in block_keys]
+                self._conn.executemany("INSERT INTO patient_blocks (block_key, submission_id) VALUES (?, ?)", blocks)
+                self._add_rollups(rollup for _, _, rollup in prepared)
+                if outbox:
+                    self._conn.executemany("INSERT OR IGNORE INTO outbox (submission_id) VALUES (?)",
+                                           [(first_id + offset,) for offset in range(len(prepared))])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return list(range(first_id, first_id + len(prepared)))
+
+    def _retire(self, retired: List[Tuple[int, int]]):
+        """Delete superseded rows with their blocks, rollup counts and scores; the caller holds the lock"""
+        by_id = dict(retired)
+        placeholders = ', '.join('?' * len(by_id))
+        rows = self._conn.execute(f"SELECT id, submitted_at, data FROM submissions WHERE id IN ({placeholders})",
+                                  list(by_id)).fetchall()
+        if len(rows) < len(by_id):
+            # Retired meanwhile, e.g. by another correction or a synced update
+            raise KeyError(sorted(by_id.keys() - {row['id'] for row in rows})[0])
+        blocks, deltas = [], []
+        for row in rows:
+            form_data = json.loads(row['data'])
+            blocks += [(block_key, row['id']) for block_key in blocking_keys(form_data.get('general_info', {}))]
+            key, values = rollup_deltas(form_data, row['submitted_at'])
+            deltas.append((key, {metric: -value for metric, value in values.items()}))
+        self._conn.executemany("DELETE FROM patient_blocks WHERE block_key = ? AND submission_id = ?", blocks)
+        self._add_rollups(deltas)
+        # Counters a place no longer has would otherwise linger as zero rows
+        self._conn.executemany("DELETE FROM rollups WHERE month = ? AND municipality = ? AND barangay = ? "
+                               "AND ABS(value) < 1e-9", list({key for key, _ in deltas}))
+        self._conn.execute(f"DELETE FROM ncd_scores WHERE submission_id IN ({placeholders})", list(by_id))
+        self._conn.execute(f"DELETE FROM submissions WHERE id IN ({placeholders})", list(by_id))
+        self._conn.executemany("INSERT OR REPLACE INTO superseded (submission_id, superseded_by) VALUES (?, ?)",
+                               [(row['id'], by_id[row['id']]) for row in rows])
+        # An unsent record is sent in its newest version
+        self._conn.executemany("UPDATE outbox SET submission_id = ? WHERE submission_id = ?",
+                               [(by_id[row['id']], row['id']) for row in rows])
+
+    def amend(self, submission_id: int, form_data: Dict[str, Any], outbox: bool = False) -> int:
+        """Store a corrected copy of a submission as the next version of its record and return the new id
+
+        Raises ``KeyError`` when the submission is not stored, including when
+        a newer version replaced it while the copy was being prepared.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT submitted_at, record_uuid, version FROM submissions WHERE id = ?",
+                                     (submission_id,)).fetchone()
+        if row is None:
+            raise KeyError(submission_id)
+        updated_at = datetime.datetime.now().isoformat(timespec='seconds')
+        prepared = prepare_submission(form_data, row['submitted_at'], row['record_uuid'], row['version'] + 1,
+                                      updated_at)
+        return self.insert_prepared([prepared], [submission_id], outbox)[0]
+
+    def _add_rollups(self, rollups: Iterable[Tuple[RollupKey, Dict[str, float]]]):
+        """Add rollup deltas; the caller holds the lock inside a transaction"""
+        totals = _sum_rollups(rollups)
+        self._conn.executemany("INSERT INTO rollups (month, municipality, barangay, metric, value) "
+                               "VALUES (?, ?, ?, ?, ?) ON CONFLICT DO UPDATE SET value = value + excluded.value",
+                               [key + (value,) for key, value in totals.items()])
+
+    def rebuild_rollups(self, chunk_size: int = 1000) -> int:
+        """Recompute the rollups from every stored submission and return how many were counted"""
+        # The recount reads a snapshot on a connection of its own, so sessions keep reading and writing
+        # through the shared one. Only the catch-up with what changed since and the swap hold the lock.
+        snapshot = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            snapshot.execute("BEGIN")
+            last_id = snapshot.execute("SELECT COALESCE(MAX(id), 0) FROM submissions").fetchone()[0]
+            totals: Dict[tuple, float] = collections.defaultdict(float)
+            counted = 0
+            cursor = snapshot.execute("SELECT submitted_at, data FROM submissions")
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                _sum_rollups((rollup_deltas(json.loads(data), submitted_at) for submitted_at, data in rows), totals)
+                counted += len(rows)
+
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    added = self._conn.execute("SELECT submitted_at, data FROM submissions WHERE id > ?",
+                                               (last_id,)).fetchall()
+                    _sum_rollups((rollup_deltas(json.loads(row['data']), row['submitted_at']) for row in added),
+                                 totals)
+                    # Rows of the snapshot replaced since: gone from the table, still readable in the snapshot
+                    retired = [row[0] for row in self._conn.execute(
+                        "SELECT submission_id FROM superseded WHERE superseded_by > ? AND submission_id <= ?",
+                        (last_id, last_id))]
+                    for start in range(0, len(retired), 500):
+                        batch = retired[start:start + 500]
+                        rows = snapshot.execute(f"SELECT submitted_at, data FROM submissions "
+                                                f"WHERE id IN ({', '.join('?' * len(batch))})", batch).fetchall()
+                        _sum_rollups(((key, {metric: -value for metric, value in values.items()})
+                                      for key, values in (rollup_deltas(json.loads(data), submitted_at)
+                                                          for submitted_at, data in rows)), totals)
+                    counted += len(added) - len(retired)
+                    self._conn.execute("DELETE FROM rollups")
+                    self._conn.executemany("INSERT INTO rollups (month, municipality, barangay, metric, value) "
+                                           "VALUES (?, ?, ?, ?, ?)",
+                                           [key + (value,) for key, value in totals.items() if abs(value) >= 1e-9])
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+        finally:
+            snapshot.close()
+        return counted
+
+    def rollup_months(self) -> List[str]:
+        """Months with rollups, newest first"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT month FROM rollups ORDER BY month DESC")]
+
+    def rollup_rows(self, month: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Rollup values per place and metric for one month, or summed over all months"""
+        if month:
+            sql, params = "SELECT municipality, barangay, metric, value FROM rollups WHERE month = ?", (month,)
+        else:
+            sql, params = ("SELECT municipality, barangay, metric, SUM(value) AS value FROM rollups "
+                           "GROUP BY municipality, barangay, metric"), ()
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def _query(self, where: str, params: tuple, limit: Optional[int],
+               order_by: str = "id DESC") -> List[Dict[str, Any]]:
+        sql = f"SELECT id, submitted_at, data FROM submissions WHERE {where} ORDER BY {order_by}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [_to_record(row) for row in rows]
+
+    def get(self, submission_id: int) -> Optional[Dict[str, Any]]:
+        records = self._query("id = ?", (submission_id,), 1)
+        return records[0] if records else None
+
+    def find_by_ids(self, ids: List[int]) -> List[Dict[str, Any]]:
+        """Submissions with the given ids, newest first"""
+        records = []
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            records += self._query(f"id IN ({', '.join('?' * len(batch))})", tuple(batch), None)
+        return sorted(records, key=lambda record: -record['id'])
+
+    def find_by_pin(self, philhealth_pin: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Submissions for a PhilHealth PIN, with or without separators, newest first"""
+        return self._query("philhealth_pin = ?", (normalize_pin(philhealth_pin),), limit)
+
+    def find_by_name(self, last_name: str, birthdate: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self._query("last_name = ? AND birthdate = ?", (last_name, birthdate), limit)
+
+    def find_by_address(self, barangay: str, municipality: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self._query("barangay = ? AND municipality = ?", (barangay, municipality), limit)
+
+    def find_by_registration_date(self, start: str, end: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Submissions registered between two ISO dates, inclusive"""
+        # Ordering along the index keeps LIMIT queries from sorting the whole range
+        return self._query("registration_date BETWEEN ? AND ?", (start, end), limit,
+                           order_by="registration_date DESC, id DESC")
+
+    def iter_chunks(self, chunk_size: int = 1000, since: Optional[str] = None, until: Optional[str] = None,
+                    registered: bool = False, place: Optional[Tuple[str, str]] = None,
+                    address: Optional[Tuple[str, str]] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Every submission in id order, ``chunk_size`` at a time, optionally submitted within [since, until)
+
+        With ``registered`` the bounds apply to the registration date, or
+        the submission date when there is none, as in the rollups.
+        ``place`` keeps the submissions with those gazetteer (municipality,
+        barangay) codes, ``address`` those with that typed (barangay,
+        municipality) and no code.
+        """
+        # Paging by id holds the lock for one chunk at a time and keeps memory flat
+        column = REGISTERED_ON if registered else "submitted_at"
+        where, params = "id > ?", ()
+        if place:
+            where, params = where + " AND municipality_code = ? AND barangay_code = ?", params + tuple(place)
+        if address:
+            where, params = (where + " AND barangay_code IS NULL AND barangay = ? AND municipality = ?",
+                             params + tuple(address))
+        if since:
+            where, params = where + f" AND {column} >= ?", params + (since,)
+        if until:
+            where, params = where + f" AND {column} < ?", params + (until,)
+        last_id = 0
+        while True:
+            records = self._query(where, (last_id,) + params, chunk_size, order_by="id")
+            if not records:
+                return
+            yield records
+            last_id = records[-1]['id']
+
+    def iter_fields(self, fields: List[Tuple[str, str]], chunk_size: int = 10_000,
+                    after_id: int = 0) -> Iterator[List[list]]:
+        """``[id, value, ...]`` of the (section, field) pairs of each submission after ``after_id``, in id order"""
+        # A multi-path json_extract parses each document once and returns the values as a JSON array
+        paths = ', '.join(f"'$.{section}.{name}'" for section, name in fields)
+        sql = f"SELECT id, json_extract(data, {paths}) FROM submissions WHERE id > ? ORDER BY id LIMIT ?"
+        last_id = after_id
+        while True:
+            with self._lock:
+                rows = self._conn.execute(sql, (last_id, chunk_size)).fetchall()
+            if not rows:
+                return
+            if len(fields) > 1:
+                # One json.loads per chunk rather than per row
+                values = json.loads('[' + ','.join(row[1] for row in rows) + ']')
+                yield [[row[0]] + row_values for row, row_values in zip(rows, values)]
+            else:
+                yield [[row[0], row[1]] for row in rows]
+            last_id = rows[-1][0]
+
+    def save_ncd_scores(self, rows: List[tuple]):
+        """Replace the NCD screening results of the given submissions, see ``ncd_risk.SCORE_COLUMNS``"""
+        if not rows:
+            return
+        placeholders = ', '.join('?' * len(rows[0]))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(f"INSERT OR REPLACE INTO ncd_scores VALUES ({placeholders})", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def superseded_since(self, after_id: int) -> List[int]:
+        """Ids of rows replaced by a newer version stored after ``after_id``"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT submission_id FROM superseded WHERE superseded_by > ?", (after_id,))]
+
+    def iter_sync_rows(self, after_id: int = 0, chunk_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """Records stored after ``after_id`` with their identity, version and raw JSON ``data``, in id order"""
+        sql = ("SELECT id, record_uuid, version, submitted_at, updated_at, data FROM submissions "
+               "WHERE id > ? ORDER BY id LIMIT ?")
+        while True:
+            with self._lock:
+                rows = self._conn.execute(sql, (after_id, chunk_size)).fetchall()
+            if not rows:
+                return
+            yield [dict(row) for row in rows]
+            after_id = rows[-1]['id']
+
+    def record_versions(self, record_uuids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Stored id, version, update time and raw JSON ``data`` per record uuid"""
+        versions = {}
+        for start in range(0, len(record_uuids), 500):
+            batch = record_uuids[start:start + 500]
+            sql = (f"SELECT id, record_uuid, version, updated_at, data FROM submissions "
+                   f"WHERE record_uuid IN ({', '.join('?' * len(batch))})")
+            with self._lock:
+                versions.update((row['record_uuid'], dict(row)) for row in self._conn.execute(sql, batch))
+        return versions
+
+    def sync_value(self, name: str, default: str = '') -> str:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def set_sync_values(self, values: Dict[str, Any]):
+        """Store sync bookkeeping such as the last exported id, atomically"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)",
+                                       [(name, str(value)) for name, value in values.items()])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def bundle_imported(self, checksum: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM sync_bundles WHERE checksum = ?", (checksum,)).fetchone()
+        return row is not None
+
+    def record_bundle(self, checksum: str, station: str, sequence: int, records: int):
+        imported_at = datetime.datetime.now().isoformat(timespec='seconds')
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO sync_bundles VALUES (?, ?, ?, ?, ?)",
+                               (checksum, station, sequence, records, imported_at))
+
+    def bundle_sequences(self, station: str) -> List[int]:
+        """Sequence numbers of the bundles imported from a station"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT sequence FROM sync_bundles WHERE station = ?",
+                                                         (station,))]
+
+    def iter_unsent(self, chunk_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """Records still in the upstream outbox, in id order"""
+        sql = ("SELECT s.id, s.submitted_at, s.data FROM outbox o JOIN submissions s ON s.id = o.submission_id "
+               "WHERE o.submission_id > ? ORDER BY o.submission_id LIMIT ?")
+        after_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(sql, (after_id, chunk_size)).fetchall()
+            if not rows:
+                return
+            yield [_to_record(row) for row in rows]
+            after_id = rows[-1]['id']
+
+    def mark_sent(self, submission_ids: List[int]):
+        """Take submissions the upstream endpoint accepted out of the outbox"""
+        with self._lock:
+            self._conn.execute(f"DELETE FROM outbox WHERE submission_id IN ({', '.join('?' * len(submission_ids))})",
+                               submission_ids)
+
+    def find_block_candidates(self, block_keys: List[str]) -> List[Dict[str, Any]]:
+        """General Data columns of every submission filed under any of the keys"""
+        if not block_keys:
+            return []
+        placeholders = ', '.join('?' * len(block_keys))
+        columns = ', '.join(f"s.{name}" for name in CANDIDATE_COLUMNS)
+        sql = (f"SELECT DISTINCT {columns} FROM patient_blocks b JOIN submissions s ON s.id = b.submission_id "
+               f"WHERE b.block_key IN ({placeholders})")
+        with self._lock:
+            rows = self._conn.execute(sql, block_keys).fetchall()
+        return [dict(row) for row in rows]
+
+    def count_by_place(self) -> List[Dict[str, Any]]:
+        """Submission counts per canonical municipality and barangay"""
+        sql = ("SELECT municipality_code, barangay_code, COUNT(*) AS submissions FROM submissions "
+               "GROUP BY municipality_code, barangay_code")
+        with self._lock:
+            rows = self._conn.execute(sql).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, after_id: int = 0) -> int:
+        """Number of submissions, or of those stored after ``after_id``"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM submissions WHERE id > ?", (after_id,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+@st.cache_resource
+def get_store(path: str = DEFAULT_DB_PATH) -> SubmissionStore:
+    """Return the process-wide submission store"""
+    return SubmissionStore(path)
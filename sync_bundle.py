@@ -0,0 +1,231 @@
+"""Offline-first sync between barangay health stations and the central server.
+
+A station without connectivity runs with KONSULTA_OFFLINE set: submissions
+are only stored in its local SQLite store and drafts in its local draft
+journal, and nothing is sent upstream. When a file can be carried to town
+(or the link is up), ``export_bundle`` packages the records stored since the
+previous bundle into a gzip-compressed, SHA-256 checksummed file in
+KONSULTA_SYNC_DIR. Amendments are stored as new rows, so "changed since the
+last bundle" is an id range. Bundles stay in the directory until deleted,
+so a copy lost on the way can be sent again.
+
+On the central server ``import_bundle`` verifies the checksum and merges the
+records by ``record_uuid``: unknown records are inserted, a higher version
+replaces the stored one, the same version is a duplicate and a lower one is
+stale. Two different copies with the same version (amended at two stations)
+are a conflict, settled by the later ``updated_at`` and then by content
+hash, so the outcome does not depend on which bundle arrives first. The
+ledger of imported bundles makes importing one twice a no-op, and the
+per-record rules make the merge idempotent even without it. Both steps read
+only the delta: an id range on export and a uuid index lookup per record on
+import.
+
+    python sync_bundle.py export [--full]
+    python sync_bundle.py import sync/station-a-000012.ksync [...]
+"""
+import argparse
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import socket
+import sys
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from submission_store import DEFAULT_DB_PATH, SubmissionStore, prepare_submission
+
+SYNC_DIR = os.environ.get('KONSULTA_SYNC_DIR', 'sync')
+STATION_ID = os.environ.get('KONSULTA_STATION_ID') or socket.gethostname()
+MAGIC = b'KONSULTA-SYNC 1\n'
+BUNDLE_SUFFIX = '.ksync'
+CHUNK_SIZE = 1000
+
+INSERTED, UPDATED, DUPLICATE, STALE = 'inserted', 'updated', 'duplicate', 'stale'
+
+
+class BundleError(ValueError):
+    """A file that is not a sync bundle, or one damaged on the way"""
+
+
+def _digest(form_data: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(form_data, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def _record_line(row: Dict[str, Any]) -> str:
+    # The stored JSON goes in as is instead of being parsed and dumped again
+    meta = json.dumps({'uuid': row['record_uuid'], 'version': row['version'], 'submitted_at': row['submitted_at'],
+                       'updated_at': row['updated_at']}, separators=(',', ':'))
+    return f'{meta[:-1]},"form_data":{row["data"]}}}\n'
+
+
+def _write_atomically(path: str, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def export_bundle(store: SubmissionStore, directory: str = SYNC_DIR, station: str = STATION_ID,
+                  full: bool = False) -> Optional[Dict[str, Any]]:
+    """Write the records stored since the last bundle (all of them when ``full``) and return its header and path
+
+    Returns None when there is nothing new to send.
+    """
+    after_id = 0 if full else int(store.sync_value('exported_through', '0'))
+    sequence = int(store.sync_value('bundle_sequence', '0')) + 1
+    # wbits 31 writes a gzip container, so a bundle's payload also opens with ordinary tools
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    payload = io.BytesIO()
+    records, through_id = 0, after_id
+    for rows in store.iter_sync_rows(after_id, CHUNK_SIZE):
+        payload.write(compressor.compress(''.join(map(_record_line, rows)).encode('utf-8')))
+        records += len(rows)
+        through_id = rows[-1]['id']
+    if not records:
+        return None
+    payload.write(compressor.flush())
+    data = payload.getvalue()
+    header = {'station': station, 'sequence': sequence,
+              'created_at': datetime.datetime.now().isoformat(timespec='seconds'), 'after_id': after_id,
+              'through_id': through_id, 'records': records, 'bytes': len(data),
+              'sha256': hashlib.sha256(data).hexdigest()}
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', station)}-{sequence:06d}{BUNDLE_SUFFIX}")
+    _write_atomically(path, MAGIC + json.dumps(header).encode('utf-8') + b'\n' + data)
+    # A crash before this line only means the next bundle repeats these records, which the merge ignores
+    store.set_sync_values({'exported_through': through_id, 'bundle_sequence': sequence})
+    return {**header, 'path': path}
+
+
+def list_bundles(directory: str = SYNC_DIR) -> List[str]:
+    """Bundle files in ``directory``, newest first"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted((os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(BUNDLE_SUFFIX)),
+                  reverse=True)
+
+
+def read_bundle(data: bytes) -> Tuple[Dict[str, Any], Iterator[List[Dict[str, Any]]]]:
+    """Header of a bundle after verifying its checksum, and its records ``CHUNK_SIZE`` at a time"""
+    if not data.startswith(MAGIC):
+        raise BundleError("not a Konsulta sync bundle")
+    end = data.find(b'\n', len(MAGIC))
+    try:
+        header = json.loads(data[len(MAGIC):end])
+    except ValueError as exc:
+        raise BundleError(f"unreadable bundle header: {exc}") from exc
+    payload = data[end + 1:]
+    if len(payload) != header.get('bytes') or hashlib.sha256(payload).hexdigest() != header.get('sha256'):
+        raise BundleError("checksum mismatch: the bundle is truncated or damaged")
+
+    def chunks() -> Iterator[List[Dict[str, Any]]]:
+        chunk = []
+        with gzip.GzipFile(fileobj=io.BytesIO(payload)) as f:
+            for line in f:
+                chunk.append(json.loads(line))
+                if len(chunk) == CHUNK_SIZE:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    return header, chunks()
+
+
+def resolve(incoming: Dict[str, Any], stored: Dict[str, Any]) -> Tuple[str, bool]:
+    """``UPDATED``, ``DUPLICATE`` or ``STALE`` for an incoming copy of a stored record, and whether they conflict"""
+    if incoming['version'] != stored['version']:
+        return (UPDATED if incoming['version'] > stored['version'] else STALE), False
+    mine = (incoming['updated_at'] or '', _digest(incoming['form_data']))
+    theirs = (stored['updated_at'] or '', _digest(json.loads(stored['data'])))
+    if mine == theirs:
+        return DUPLICATE, False
+    return (UPDATED if mine > theirs else STALE), True
+
+
+def _merge_chunk(store: SubmissionStore, chunk: List[Dict[str, Any]], counts: Dict[str, Any]):
+    stored = store.record_versions([record['uuid'] for record in chunk])
+    prepared, replaces = [], []
+    for record in chunk:
+        existing = stored.get(record['uuid'])
+        if existing is None:
+            outcome = INSERTED
+        else:
+            outcome, conflict = resolve(record, existing)
+            counts['conflicts'] += conflict
+        counts[outcome] += 1
+        if outcome in (INSERTED, UPDATED):
+            prepared.append(prepare_submission(record['form_data'], record['submitted_at'], record['uuid'],
+                                               record['version'], record['updated_at']))
+            replaces.append(existing['id'] if existing else None)
+    store.insert_prepared(prepared, replaces)
+
+
+def import_bundle(store: SubmissionStore, data: bytes) -> Dict[str, Any]:
+    """Merge a bundle into ``store`` and return what happened to its records; raises ``BundleError``"""
+    header, chunks = read_bundle(data)
+    counts = {'station': header['station'], 'sequence': header['sequence'], 'records': header['records'],
+              INSERTED: 0, UPDATED: 0, DUPLICATE: 0, STALE: 0, 'conflicts': 0, 'already_imported': False}
+    if store.bundle_imported(header['sha256']):
+        counts['already_imported'] = True
+        return counts
+    for chunk in chunks:
+        _merge_chunk(store, chunk, counts)
+    store.record_bundle(header['sha256'], header['station'], header['sequence'], header['records'])
+    imported = set(store.bundle_sequences(header['station']))
+    # Earlier bundles from this station that never arrived
+    counts['missing'] = [sequence for sequence in range(1, header['sequence']) if sequence not in imported]
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exchange offline sync bundles between stations and the server.")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help="bundle the records stored since the last bundle")
+    export.add_argument('--dir', default=SYNC_DIR)
+    export.add_argument('--station', default=STATION_ID)
+    export.add_argument('--full', action='store_true', help="bundle every record, e.g. for a new server")
+    merge = commands.add_parser('import', help="merge bundles into this store")
+    merge.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+
+    store = SubmissionStore(args.db)
+    failed = False
+    if args.command == 'export':
+        header = export_bundle(store, args.dir, args.station, args.full)
+        if header is None:
+            print("Nothing to sync: no records stored since the last bundle")
+        else:
+            print(f"{header['path']}: {header['records']} records, {header['bytes'] / 1024:.1f} KiB")
+    else:
+        for path in args.paths:
+            with open(path, 'rb') as f:
+                data = f.read()
+            try:
+                counts = import_bundle(store, data)
+            except BundleError as exc:
+                print(f"{path}: {exc}", file=sys.stderr)
+                failed = True
+                continue
+            if counts['already_imported']:
+                print(f"{path}: already imported")
+                continue
+            print(f"{path}: {counts['records']} records from {counts['station']} #{counts['sequence']}: "
+                  + ', '.join(f"{counts[name]} {name}" for name in (INSERTED, UPDATED, DUPLICATE, STALE))
+                  + (f", {counts['conflicts']} conflicts resolved" if counts['conflicts'] else ""))
+            if counts['missing']:
+                print(f"  bundles not imported yet from {counts['station']}: "
+                      f"{', '.join(map(str, counts['missing']))}", file=sys.stderr)
+    store.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
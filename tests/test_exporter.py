@@ -0,0 +1,23 @@
+import csv
+import io
+
+from exporter import export_chunks, month_range
+from form_schema import build_schema
+from submission_store import SubmissionStore
+
+
+def exported_names(store: SubmissionStore, month: str) -> list:
+    data = b''.join(export_chunks(store, 'csv', build_schema(), *month_range(month)))
+    return [row['last_name'] for row in csv.DictReader(io.StringIO(data.decode('utf-8')))]
+
+
+def test_month_is_the_registration_month(tmp_path):
+    store = SubmissionStore(str(tmp_path / 'konsulta.db'))
+    # Registered in September, imported or synced in October
+    store.insert_many([{'general_info': {'last_name': 'Late', 'registration_date': '2026-09-28'}},
+                       {'general_info': {'last_name': 'Undated'}}])
+    store._conn.execute("UPDATE submissions SET submitted_at = '2026-10-03T09:00:00'")
+
+    assert exported_names(store, '2026-09') == ['Late']
+    assert exported_names(store, '2026-10') == ['Undated']
+    store.close()
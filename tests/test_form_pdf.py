@@ -0,0 +1,30 @@
+import form_pdf
+from gazetteer import Gazetteer
+from submission_store import SubmissionStore
+
+ROWS = [
+    {'municipality_code': '036916000', 'municipality': 'Tarlac City', 'barangay_code': '036916001',
+     'barangay': 'Aguso', 'purok': ''},
+    {'municipality_code': '036916000', 'municipality': 'Tarlac City', 'barangay_code': '036916002',
+     'barangay': 'Alvindia', 'purok': ''},
+]
+
+
+def form(general_info: dict) -> dict:
+    return {'general_info': dict(general_info, last_name='Dela Cruz')}
+
+
+def test_barangay_batch_pages_by_code_whatever_the_spelling(tmp_path, monkeypatch):
+    gazetteer = Gazetteer(ROWS)
+    monkeypatch.setattr(form_pdf, 'get_gazetteer', lambda: gazetteer)
+    store = SubmissionStore(str(tmp_path / 'konsulta.db'))
+    aguso = gazetteer.canonicalize({'municipality': 'Tarlac City', 'barangay': 'Aguso'})
+    alvindia = gazetteer.canonicalize({'municipality': 'Tarlac City', 'barangay': 'Alvindia'})
+    ids = store.insert_many(form(aguso if i % 2 else alvindia) for i in range(25))
+    typed = store.insert(form({'municipality': 'Capas', 'barangay': 'Dolores'}))
+
+    chunks = list(form_pdf.select_records(store, barangay='aguso', municipality='TARLAC CITY'))
+    assert [record['id'] for chunk in chunks for record in chunk] == ids[1::2]
+    chunks = list(form_pdf.select_records(store, barangay='Dolores', municipality='Capas'))
+    assert [record['id'] for chunk in chunks for record in chunk] == [typed]
+    store.close()
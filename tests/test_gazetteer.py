@@ -0,0 +1,52 @@
+from gazetteer import Gazetteer, place_key
+
+ROWS = [
+    {'municipality_code': '036918000', 'municipality': 'San Jose', 'barangay_code': '036918002',
+     'barangay': 'Burgos', 'purok': ''},
+    {'municipality_code': '034926000', 'municipality': 'San Jose City', 'barangay_code': '034926001',
+     'barangay': 'Abar 1st', 'purok': ''},
+]
+# Another San Jose, in Batangas
+BATANGAS = {'municipality_code': '041020000', 'municipality': 'San Jose', 'barangay_code': '041020001',
+            'barangay': 'Aguila', 'purok': '', 'province': 'Batangas'}
+TARLAC = dict(ROWS[0], province='Tarlac')
+
+
+def test_san_jose_and_san_jose_city_stay_apart():
+    gazetteer = Gazetteer(ROWS)
+
+    assert gazetteer.barangays('San Jose') == ['Burgos']
+    assert gazetteer.barangays('San Jose City') == ['Abar 1st']
+    assert gazetteer.canonicalize({'municipality': 'San Jose'})['municipality_code'] == '036918000'
+    assert gazetteer.canonicalize({'municipality': 'City of San Jose'})['municipality_code'] == '034926000'
+
+
+def test_city_prefix_and_suffix_share_a_key():
+    assert place_key('City of San Fernando') == place_key('San Fernando City') == 'san fernando city'
+
+
+def test_municipalities_of_the_same_name_are_told_apart_by_province():
+    gazetteer = Gazetteer([TARLAC, ROWS[1], BATANGAS])
+
+    assert gazetteer.municipalities() == ['San Jose (Batangas)', 'San Jose (Tarlac)', 'San Jose City']
+    assert gazetteer.municipality_code('San Jose') is None
+    assert gazetteer.canonicalize({'municipality': 'San Jose'})['municipality_code'] is None
+    assert gazetteer.barangays('San Jose (Batangas)') == ['Aguila']
+    assert gazetteer.canonicalize({'municipality': 'San Jose (Tarlac)', 'barangay': 'Burgos'})['barangay_code'] \
+        == '036918002'
+
+
+def test_province_defaults_to_the_psgc_prefix():
+    gazetteer = Gazetteer([ROWS[0], dict(BATANGAS, province='')])
+
+    assert gazetteer.municipalities() == ['San Jose (0369)', 'San Jose (0410)']
+
+
+def test_barangays_of_the_same_key_are_ambiguous():
+    rows = [dict(ROWS[0], barangay_code='036918010', barangay='Poblacion I'),
+            dict(ROWS[0], barangay_code='036918011', barangay='Poblacion 1')]
+    gazetteer = Gazetteer(rows)
+
+    assert gazetteer.barangay_code('San Jose', 'Poblacion 1') is None
+    assert gazetteer.barangays('San Jose') == ['Poblacion 1 (036918011)', 'Poblacion I (036918010)']
+    assert gazetteer.barangay_code('San Jose', 'Poblacion I (036918010)') == '036918010'
@@ -0,0 +1,39 @@
+import csv
+
+from importer import import_file
+from matching import find_likely_duplicates
+from submission_store import SubmissionStore
+
+
+def test_dashed_pin_is_found_by_digits(tmp_path):
+    path = tmp_path / 'patients.csv'
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['last_name', 'first_name', 'sex', 'birthdate', 'philhealth_pin'])
+        writer.writerow(['Dela Cruz', 'Juan', 'M', '1980-05-01', '19-012345678-9'])
+    store = SubmissionStore(str(tmp_path / 'konsulta.db'))
+
+    counts = import_file(str(path), store, str(tmp_path / 'errors.csv'), workers=1,
+                         gazetteer_path=str(tmp_path / 'gazetteer.csv'))
+
+    assert counts['imported'] == 1
+    records = store.find_by_pin('190123456789')
+    assert len(records) == 1
+    assert records[0]['form_data']['general_info']['philhealth_pin'] == '190123456789'
+    store.close()
+
+
+def test_dashed_pin_typed_in_the_form_finds_an_imported_patient(tmp_path):
+    path = tmp_path / 'patients.csv'
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['last_name', 'first_name', 'sex', 'birthdate', 'philhealth_pin'])
+        writer.writerow(['Dela Cruz', 'Juan', 'M', '1980-05-01', '190123456789'])
+    store = SubmissionStore(str(tmp_path / 'konsulta.db'))
+    import_file(str(path), store, str(tmp_path / 'errors.csv'), workers=1,
+                gazetteer_path=str(tmp_path / 'gazetteer.csv'))
+
+    assert len(store.find_by_pin('19-012345678-9')) == 1
+    typed = {'philhealth_pin': '19-012345678-9', 'last_name': 'Cruz', 'first_name': 'Juana'}
+    assert [match['philhealth_pin'] for match in find_likely_duplicates(typed, store)] == ['190123456789']
+    store.close()
@@ -0,0 +1,22 @@
+from ncd_risk import score_patient
+
+
+def test_unanswered_habits_are_unknown_not_risk_factors():
+    # What an untouched form holds: the status radios start unanswered
+    form_data = {'general_info': {'age': 0},
+                 'medical_history': {'smoking_status': None, 'alcohol_status': None, 'height': 0.0, 'weight': 0.0}}
+
+    assessment = score_patient(form_data)
+
+    assert assessment['risk_score'] == 0
+    assert assessment['risk_factors'] == []
+    assert assessment['unanswered'] == ["Smoking status", "Alcohol status"]
+
+
+def test_answered_habits_still_score():
+    form_data = {'general_info': {}, 'medical_history': {'smoking_status': 'Yes', 'alcohol_status': 'No'}}
+
+    assessment = score_patient(form_data)
+
+    assert assessment['risk_factors'] == ["Current smoker"]
+    assert assessment['unanswered'] == []
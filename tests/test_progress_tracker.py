@@ -0,0 +1,58 @@
+import datetime
+
+from form_schema import build_schema
+from progress_tracker import ProgressTracker
+
+SCHEMA = build_schema()
+
+
+def widget_default(field):
+    """What ``render_field`` stores for a widget nobody has touched"""
+    if field.kind == 'checkbox':
+        return False
+    if field.kind in ('radio', 'selectbox'):
+        return None if 'index' in field.params else field.options[0]
+    if field.kind == 'number':
+        return field.params.get('min_value', 0)
+    if field.kind == 'date':
+        return datetime.date.today().isoformat()
+    return ''
+
+
+def render_defaults(tracker, section_key, data):
+    for name, field in SCHEMA.section(section_key).fields.items():
+        if name not in data:
+            data[name] = widget_default(field)
+            tracker.update(section_key, name, data)
+
+
+def test_defaults_stored_on_first_render_are_not_answers():
+    tracker = ProgressTracker(SCHEMA)
+    general = {'last_name': 'Dela Cruz', 'first_name': 'Maria', 'middle_name': 'Santos', 'contact': '0917',
+               'email': 'maria@example.com', 'philhealth_pin': '190123456789', 'purok': 'Purok 2',
+               'barangay': 'Aguso', 'municipality': 'Tarlac City', 'facility_choice1': 'RHU',
+               'facility_choice2': 'RHU', 'facility_choice3': 'RHU'}
+    for name in general:
+        tracker.update('general_info', name, general)
+    render_defaults(tracker, 'general_info', general)
+    render_defaults(tracker, 'medical_history', {})
+
+    assert tracker.percent('medical_history') < 20
+    assert tracker.overall_percent() < 80
+
+
+def test_none_of_the_above_answers_the_unticked_conditions():
+    tracker = ProgressTracker(SCHEMA)
+    data = {}
+    render_defaults(tracker, 'medical_history', data)
+    before = tracker.counts('medical_history')
+    data.update(past_hypertension=True, no_past_conditions=True)
+    tracker.update('medical_history', 'past_hypertension', data)
+    tracker.update('medical_history', 'no_past_conditions', data)
+    conditions = sum(1 for name in SCHEMA.section('medical_history').fields if name.startswith('past_')
+                     and SCHEMA.section('medical_history').fields[name].required)
+
+    assert tracker.counts('medical_history')[0] == before[0] + conditions
+    data['no_past_conditions'] = False
+    tracker.update('medical_history', 'no_past_conditions', data)
+    assert tracker.counts('medical_history')[0] == before[0] + 1
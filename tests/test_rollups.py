@@ -0,0 +1,9 @@
+from rollups import UNANSWERED, get_rollup_layout
+
+
+def test_unanswered_status_is_counted_apart_from_the_answers():
+    values = get_rollup_layout().values({'general_info': {}, 'medical_history': {'smoking_status': None}})
+
+    assert values[f"smoking_status:{UNANSWERED}"] == 1
+    assert values[f"alcohol_status:{UNANSWERED}"] == 1
+    assert not any(metric.endswith(':Yes') for metric in values)
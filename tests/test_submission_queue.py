@@ -0,0 +1,83 @@
+from submission_queue import FAILED, SENT, SubmissionQueue
+from submission_store import SubmissionStore
+
+FORM = {'general_info': {'last_name': 'Dela Cruz', 'first_name': 'Juan'}}
+
+
+class BrokenSink:
+    """Fails the first ``broken`` batches with an error that is not an UpstreamError"""
+
+    def __init__(self, broken: int = 0):
+        self.broken = broken
+        self.batches = []
+
+    def send(self, batch):
+        if self.broken:
+            self.broken -= 1
+            raise RuntimeError("sink bug")
+        self.batches.append(batch)
+
+
+def test_unexpected_sink_error_fails_the_batch_and_keeps_sending(tmp_path):
+    store = SubmissionStore(str(tmp_path / 'konsulta.db'))
+    sink = BrokenSink(broken=1)
+    submissions = SubmissionQueue(store, sink, senders=1)
+    first = submissions.submit(FORM)
+    assert submissions.join(10)
+    second = submissions.submit(FORM)
+    assert submissions.join(10)
+    statuses = submissions.status([first, second])
+    submissions.close(10)
+
+    assert statuses[first]['state'] == FAILED
+    assert 'sink bug' in statuses[first]['error']
+    assert statuses[second]['state'] == SENT
+    store.close()
+
+
+def test_unsent_submissions_are_resent_after_a_restart(tmp_path):
+    path = str(tmp_path / 'konsulta.db')
+    store = SubmissionStore(path)
+    submissions = SubmissionQueue(store, BrokenSink(broken=1), senders=1)
+    ticket = submissions.submit(FORM)
+    assert submissions.join(10)
+    reference = submissions.status([ticket])[ticket]['submission_id']
+    submissions.close(10)
+    # Stored but never handed over, as if the process died before sending
+    unsent = store.insert_many([FORM], outbox=True)
+    store.close()
+
+    store = SubmissionStore(path)
+    sink = BrokenSink()
+    submissions = SubmissionQueue(store, sink, senders=1)
+    assert submissions.counters['resent'] == 2
+    for _ in range(100):
+        if sum(map(len, sink.batches)) == 2:
+            break
+        submissions._stopping.wait(0.1)
+    submissions.close(10)
+
+    assert sorted(item['reference'] for batch in sink.batches for item in batch) == [reference] + unsent
+    assert not list(store.iter_unsent())
+    store.close()
+
+
+def test_a_correction_is_sent_upstream_as_a_new_version(tmp_path):
+    store = SubmissionStore(str(tmp_path / 'konsulta.db'))
+    sink = BrokenSink()
+    submissions = SubmissionQueue(store, sink, senders=1)
+    ticket = submissions.submit(FORM)
+    assert submissions.join(10)
+    original = submissions.status([ticket])[ticket]['submission_id']
+    corrected = {'general_info': {**FORM['general_info'], 'first_name': 'Juana'}}
+    new_id = submissions.amend(original, corrected)
+    for _ in range(100):
+        if len(sink.batches) == 2:
+            break
+        submissions._stopping.wait(0.1)
+    submissions.close(10)
+
+    assert store.get(original) is None
+    assert sink.batches[1] == [{'reference': new_id, 'ticket': None, 'form_data': corrected}]
+    assert not list(store.iter_unsent())
+    store.close()
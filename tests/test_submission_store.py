@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+import submission_store
+from submission_store import SubmissionStore
+
+
+def form(barangay: str, smoker: bool) -> dict:
+    return {'general_info': {'last_name': 'Dela Cruz', 'barangay': barangay, 'municipality': 'Tarlac City',
+                             'registration_date': '2026-10-01'},
+            'medical_history': {'past_hypertension': smoker, 'smoking_status': 'Yes' if smoker else 'No'}}
+
+
+def rollups(store: SubmissionStore) -> list:
+    return sorted((row['municipality'], row['barangay'], row['metric'], round(row['value'], 6))
+                  for row in store.rollup_rows())
+
+
+def test_rebuild_matches_incremental_rollups_while_records_are_amended(tmp_path):
+    store = SubmissionStore(str(tmp_path / 'konsulta.db'))
+    ids = store.insert_many(form(f"Barangay {i % 7}", i % 2 == 0) for i in range(600))
+
+    def amend():
+        for offset, submission_id in enumerate(ids[:150]):
+            store.amend(submission_id, form(f"Barangay {offset % 3}", offset % 3 == 0))
+
+    amender = threading.Thread(target=amend)
+    amender.start()
+    for _ in range(3):
+        assert store.rebuild_rollups(chunk_size=50) == 600
+    amender.join()
+    incremental = rollups(store)
+
+    assert store.rebuild_rollups() == 600
+    assert rollups(store) == incremental
+    store.close()
+
+
+def test_rebuild_catches_up_with_changes_made_while_it_counts(tmp_path, monkeypatch):
+    store = SubmissionStore(str(tmp_path / 'konsulta.db'))
+    ids = store.insert_many(form(f"Barangay {i % 3}", i % 2 == 0) for i in range(20))
+    original = submission_store.rollup_deltas
+    changes = []
+
+    def rollup_deltas(form_data, submitted_at):
+        if not changes:
+            changes.append(form_data)
+            # Lands after the snapshot is taken, before the swap
+            store.amend(ids[0], form("Barangay 9", True))
+            store.insert(form("Barangay 8", False))
+        return original(form_data, submitted_at)
+
+    monkeypatch.setattr(submission_store, 'rollup_deltas', rollup_deltas)
+    assert store.rebuild_rollups(chunk_size=5) == 21
+    rebuilt = rollups(store)
+    monkeypatch.setattr(submission_store, 'rollup_deltas', original)
+
+    assert store.rebuild_rollups() == 21
+    assert rebuilt == rollups(store)
+    store.close()
+
+
+def test_amending_a_submission_retired_meanwhile_raises_key_error(tmp_path, monkeypatch):
+    store = SubmissionStore(str(tmp_path / 'konsulta.db'))
+    original = store.insert(form("Barangay 1", False))
+    prepare = submission_store.prepare_submission
+    newer = []
+
+    def prepare_submission(*args, **kwargs):
+        if not newer:
+            newer.append(None)
+            # Another session corrects the same submission between the read and the insert
+            newer[0] = store.amend(original, form("Barangay 2", False))
+        return prepare(*args, **kwargs)
+
+    monkeypatch.setattr(submission_store, 'prepare_submission', prepare_submission)
+    with pytest.raises(KeyError):
+        store.amend(original, form("Barangay 3", True))
+
+    assert [record['id'] for chunk in store.iter_chunks() for record in chunk] == [newer[0]]
+    store.close()